@@ -5,12 +5,52 @@ from utils.log_utils import *
 from utils.file_utils import *
 from datetime import timedelta
 from utils.df_utils import normalize_dataframe
+from utils.normalization_utils import get_symbol_groups
+from utils.metrics_utils import metrics
+from storage.estimate_store_factory import create_estimate_store
+from analysis_tools.vectorized_revision_engine import VectorizedRevisionEngine
+from analysis_tools.symbol_partitioned_index import SymbolPartitionedIndex
+from analysis_tools.rolling_factor_state import RollingFactorState
+from analysis_tools.sharded_scorer import ShardedScorer
 import time
 
 
+FACTOR_COLUMNS = ['agreement_score', 'magnitude_score', 'upside_score', 'avg_earnings_surprise', 'avg_num_analysts']
+FACTOR_WEIGHTS = {
+    'agreement_score': 0.10,
+    'magnitude_score': 0.35,
+    'upside_score': 0.35,
+    'avg_earnings_surprise': 0.10,
+    'avg_num_analysts': 0.10
+}
+
+
+def rank_factor_results(results_df, column_list=FACTOR_COLUMNS, group_labels=None):
+    """
+    Normalizes the factors cross-sectionally, within the groups of group_labels if given, and sorts
+    symbols by their weighted score.
+    """
+    results_norm_df = normalize_dataframe(results_df.copy(), column_list=column_list, group_labels=group_labels)
+
+    results_norm_df['weighted_score'] = sum(
+        results_norm_df[col] * weight for col, weight in FACTOR_WEIGHTS.items())
+
+    # Merge normalized weighted score back to the original DataFrame
+    final_results_df = results_df.copy()
+    final_results_df['weighted_score'] = results_norm_df['weighted_score']
+
+    # Sort by weighted score
+    final_results_df.sort_values(by=['weighted_score'], ascending=False, inplace=True)
+    return final_results_df
+
+
 class EarningsEstimateRevisionCalculator:
-    def __init__(self, fmp_api_key):
-        self.earnings_surprise_loader = EarningsSurpriseLoader(fmp_api_key)
+    def __init__(self, fmp_api_key, fmp_data_loader=None, symbol_groups=None, estimate_store=None):
+        self.earnings_surprise_loader = EarningsSurpriseLoader(fmp_api_key, fmp_data_loader)
+        # Group of each symbol for the NORMALIZATION_GROUP_COLUMN normalization
+        self.symbol_groups = symbol_groups or {}
+        self.estimate_store = estimate_store or create_estimate_store()
+        self.vectorized_engine = VectorizedRevisionEngine()
 
     def calculate_earnings_surprise(self, symbol: str):
         try:
@@ -24,30 +64,33 @@ class EarningsEstimateRevisionCalculator:
             loge(ex)
         return 0.0
 
-    def calculate_agreement(self, symbol, estimate_tracking_df, days=30):
+    def get_symbol_window(self, symbol, estimate_tracking_df, days, as_of=None):
         """
-        Calculate the agreement ratio of upwards revisions versus total revisions
-        for a given symbol over the past `days` days.
+        Returns the rows of a symbol tracked within the last `days` days. estimate_tracking_df can be a
+        DataFrame or a SymbolPartitionedIndex, which avoids scanning the whole history.
         """
-        # Filter data for the specific symbol
+        cutoff_date = (as_of or datetime.now()) - timedelta(days=days)
+        if isinstance(estimate_tracking_df, SymbolPartitionedIndex):
+            return estimate_tracking_df.get_window(symbol, cutoff_date)
         symbol_df = estimate_tracking_df[estimate_tracking_df['symbol'] == symbol]
-        if symbol_df.empty:
-            return 0.0
-
-        # Filter for data within the last `days` period
-        cutoff_date = datetime.now() - timedelta(days=days)
-        symbol_df = symbol_df[symbol_df['tracking_date'] >= cutoff_date]
+        return symbol_df[symbol_df['tracking_date'] >= cutoff_date]
 
+    def calculate_agreement(self, symbol, estimate_tracking_df, days=30, as_of=None):
+        """
+        Calculate the agreement ratio of upwards revisions versus total revisions
+        for a given symbol over the past `days` days.
+        """
+        # Filter data for the specific symbol within the last `days` period
+        symbol_df = self.get_symbol_window(symbol, estimate_tracking_df, days, as_of)
         if symbol_df.empty:
             return 0.0
 
         # Calculate percentage change in estimates
-        symbol_df['estimatedEpsChange'] = symbol_df.groupby('date')['estimatedEpsAvg'].transform(pd.Series.pct_change)
-        symbol_df.dropna(subset=['estimatedEpsChange'], inplace=True)
+        eps_change = symbol_df.groupby('date')['estimatedEpsAvg'].transform(pd.Series.pct_change).dropna()
 
         # Count upward and downward revisions
-        upward_revisions = (symbol_df['estimatedEpsChange'] > 0).sum()
-        downward_revisions = (symbol_df['estimatedEpsChange'] < 0).sum()
+        upward_revisions = (eps_change > 0).sum()
+        downward_revisions = (eps_change < 0).sum()
 
         # Calculate total revisions
         total_revisions = upward_revisions + downward_revisions
@@ -58,25 +101,20 @@ class EarningsEstimateRevisionCalculator:
         agreement_score = upward_revisions / total_revisions
         return round(agreement_score, 2)
 
-    def calculate_magnitude(self, symbol, estimate_tracking_df):
+    def calculate_magnitude(self, symbol, estimate_tracking_df, as_of=None):
         """
         The magnitude component targets the size of the recent changes for the current and next fiscal years.
         """
-        symbol_df = estimate_tracking_df[estimate_tracking_df['symbol'] == symbol]
-        if symbol_df.empty:
-            return 0.0
-
         # Get recent estimates (last month)
-        one_month_ago = datetime.now() - timedelta(days=30)
-        symbol_df = symbol_df[symbol_df['tracking_date'] >= one_month_ago]
-
+        now = as_of or datetime.now()
+        symbol_df = self.get_symbol_window(symbol, estimate_tracking_df, 30, now)
         if symbol_df.empty:
             return 0.0
 
         # Calculate difference between one month ago and most recent estimates
         # for current and next fiscal year estimates
-        current_fiscal_year_df = symbol_df[symbol_df['date'].dt.year == datetime.now().year]
-        next_fiscal_year_df = symbol_df[symbol_df['date'].dt.year == datetime.now().year + 1]
+        current_fiscal_year_df = symbol_df[symbol_df['date'].dt.year == now.year]
+        next_fiscal_year_df = symbol_df[symbol_df['date'].dt.year == now.year + 1]
         if len(current_fiscal_year_df) == 0 or len(next_fiscal_year_df) == 0:
             return 0.0
 
@@ -92,20 +130,13 @@ class EarningsEstimateRevisionCalculator:
         magnitude_score = (current_fiscal_change + next_fiscal_change) / 2
         return round(magnitude_score, 2)
 
-    def calculate_upside(self, symbol, estimate_tracking_df):
+    def calculate_upside(self, symbol, estimate_tracking_df, as_of=None):
         """
         Calculates the upside as the percentage change between the most recent consensus
         and the average consensus over a specified time period.
         """
-        # Filter data for the given symbol
-        symbol_df = estimate_tracking_df[estimate_tracking_df['symbol'] == symbol]
-        if symbol_df.empty:
-            return 0.0
-
-        # Filter data for the last 90 days
-        cutoff_date = datetime.now() - timedelta(days=90)
-        recent_estimates_df = symbol_df[symbol_df['tracking_date'] >= cutoff_date]
-
+        # Filter data for the given symbol and the last 90 days
+        recent_estimates_df = self.get_symbol_window(symbol, estimate_tracking_df, 90, as_of)
         if recent_estimates_df.empty:
             return 0.0
 
@@ -125,20 +156,13 @@ class EarningsEstimateRevisionCalculator:
         upside_score = ((last_consensus - avg_recent_consensus) / avg_recent_consensus) * 100
         return round(upside_score, 2)
 
-    def calculate_avg_number_analysts(self, symbol, estimate_tracking_df):
+    def calculate_avg_number_analysts(self, symbol, estimate_tracking_df, as_of=None):
         """
         Calculates the upside as the percentage change between the most recent consensus
         and the average consensus over a specified time period.
         """
-        # Filter data for the given symbol
-        symbol_df = estimate_tracking_df[estimate_tracking_df['symbol'] == symbol]
-        if symbol_df.empty:
-            return 0.0
-
-        # Filter data for the last 90 days
-        cutoff_date = datetime.now() - timedelta(days=90)
-        recent_estimates_df = symbol_df[symbol_df['tracking_date'] >= cutoff_date]
-
+        # Filter data for the given symbol and the last 90 days
+        recent_estimates_df = self.get_symbol_window(symbol, estimate_tracking_df, 90, as_of)
         if recent_estimates_df.empty:
             return 0.0
 
@@ -146,63 +170,127 @@ class EarningsEstimateRevisionCalculator:
         avg_num_analysts = recent_estimates_df['numberAnalystsEstimatedEps'].mean()
         return avg_num_analysts
 
-    def calculate_earnings_estimate_revisions(self):
-        logi("Calculating earnings estimate revisions...")
-        symbol_loader = MarketSymbolLoader()
-        symbols_df = symbol_loader.fetch_sp500_symbols(cache_file=True, cache_dir=CACHE_DIR)
-        symbol_list = symbols_df['symbol'].unique()
-
-        estimate_tracking_df = load_csv(CACHE_DIR, ESTIMATE_TRACKING_FILE_NAME)
-        if estimate_tracking_df is None or estimate_tracking_df.empty:
-            logi(f"estimate_tracking_df is empty")
-            return
-        estimate_tracking_df['date'] = pd.to_datetime(estimate_tracking_df['date'], errors='coerce')
-        estimate_tracking_df['tracking_date'] = pd.to_datetime(estimate_tracking_df['tracking_date'], errors='coerce')
+    def calculate_symbol_factors(self, symbol_list, estimate_tracking_df, as_of=None):
+        """
+        Calculates the estimate revision factors symbol by symbol.
+        """
+        # Sort once so every factor method takes a slice instead of scanning the whole history
+        if not isinstance(estimate_tracking_df, SymbolPartitionedIndex):
+            estimate_tracking_df = SymbolPartitionedIndex(estimate_tracking_df)
 
         results = []
         for symbol in symbol_list:
             logd(f"Now processing {symbol}...")
-            agreement_score = self.calculate_agreement(symbol, estimate_tracking_df)
-            magnitude_score = self.calculate_magnitude(symbol, estimate_tracking_df)
-            upside_score = self.calculate_upside(symbol, estimate_tracking_df)
-            avg_earnings_surprise = self.calculate_earnings_surprise(symbol)
-            avg_num_analysts = self.calculate_avg_number_analysts(symbol, estimate_tracking_df)
-
-            result = {
+            results.append({
                 'symbol': symbol,
-                'agreement_score': agreement_score,
-                'magnitude_score': magnitude_score,
-                'upside_score': upside_score,
-                'avg_earnings_surprise': avg_earnings_surprise,
-                'avg_num_analysts': avg_num_analysts
-            }
-            results.append(result)
-            # Throttle FMP API calls for earnings surprises
-            #time.sleep(0.1)
-
-        results_df = pd.DataFrame(results)
-
-        results_norm_df = normalize_dataframe(
-            results_df.copy(),
-            column_list=['agreement_score', 'magnitude_score', 'upside_score', 'avg_earnings_surprise', 'avg_num_analysts']
-        )
-
-        results_norm_df['weighted_score'] = (
-            results_norm_df['agreement_score'] * 0.10 +
-            results_norm_df['magnitude_score'] * 0.35 +
-            results_norm_df['upside_score'] * 0.35 +
-            results_norm_df['avg_earnings_surprise'] * 0.10 +
-            results_norm_df['avg_num_analysts'] * 0.10
-        )
-
-        # Merge normalized weighted score back to the original DataFrame
-        final_results_df = results_df.copy()
-        final_results_df['weighted_score'] = results_norm_df['weighted_score']
-
-        # Sort by weighted score
-        final_results_df.sort_values(by=['weighted_score'], ascending=False, inplace=True)
-
-        file_name = f"earnings_revision_results.csv"
-        store_csv(RESULTS_DIR, file_name, final_results_df)
+                'agreement_score': self.calculate_agreement(symbol, estimate_tracking_df, as_of=as_of),
+                'magnitude_score': self.calculate_magnitude(symbol, estimate_tracking_df, as_of=as_of),
+                'upside_score': self.calculate_upside(symbol, estimate_tracking_df, as_of=as_of),
+                'avg_num_analysts': self.calculate_avg_number_analysts(symbol, estimate_tracking_df, as_of=as_of)
+            })
+        return pd.DataFrame(results)
+
+    def calculate_factors(self, symbol_list, estimate_tracking_df, as_of=None, engine=SCORING_ENGINE, reference_df=None):
+        """
+        Calculates all factors for the given symbols, including the earnings surprise.
+
+        Parameters:
+            symbol_list (list): Symbols to score.
+            estimate_tracking_df (DataFrame): Tracking history.
+            as_of (datetime): Scoring time, defaults to now.
+            engine (str): "rolling", "vectorized", "parallel" or "per_symbol".
+            reference_df (DataFrame): Datetime history for the parity check when estimate_tracking_df is typed.
+
+        Returns:
+            DataFrame: one row per symbol with the columns 'symbol' and FACTOR_COLUMNS.
+        """
+        as_of = as_of or datetime.now()
+        if engine == "rolling":
+            results_df = RollingFactorState.load().calculate_factors(symbol_list, as_of)
+        elif engine == "vectorized":
+            results_df = self.vectorized_engine.calculate_factors(estimate_tracking_df, symbol_list, as_of)
+            if VERIFY_SCORING_PARITY:
+                self.vectorized_engine.check_parity(self, estimate_tracking_df, symbol_list, as_of,
+                                                    reference_df=reference_df)
+        elif engine == "parallel":
+            results_df = ShardedScorer().calculate_factors(estimate_tracking_df, symbol_list, as_of)
+        elif engine == "per_symbol":
+            results_df = self.calculate_symbol_factors(symbol_list, estimate_tracking_df, as_of)
+        else:
+            raise ValueError(f"Unsupported scoring engine: {engine}")
+
+        results_df['avg_earnings_surprise'] = [self.calculate_earnings_surprise(symbol) for symbol in results_df['symbol']]
+        return results_df[['symbol'] + FACTOR_COLUMNS]
+
+    def get_group_labels(self, results_df):
+        if NORMALIZATION_GROUP_COLUMN is None:
+            return None
+        if not self.symbol_groups:
+            logw(f"No {NORMALIZATION_GROUP_COLUMN} groups for the symbols - normalizing over all symbols")
+            return None
+        return results_df['symbol'].map(self.symbol_groups).to_numpy()
+
+    def rank_results(self, results_df, column_list=FACTOR_COLUMNS):
+        return rank_factor_results(results_df, column_list, self.get_group_labels(results_df))
+
+    def score_symbols(self, symbol_list, as_of=None):
+        """
+        Calculates the factors of the given symbols from the configured scoring engine, before normalization.
+
+        Returns:
+            DataFrame: factors per symbol, or None if there is no tracking history.
+        """
+        as_of = as_of or datetime.now()
+        engine = SCORING_ENGINE
+        estimate_tracking_df = None
+        reference_df = None
+        if engine == "rolling" and RollingFactorState.load().is_empty():
+            logw("Rolling factor state is empty - scoring from the tracking history")
+            engine = "vectorized"
+
+        if engine != "rolling":
+            # Only the scoring windows are loaded; older history is never read
+            start_date = as_of - timedelta(days=SCORING_HISTORY_DAYS)
+            with metrics.stage("history_load"):
+                if engine == "vectorized" and COMPACT_HISTORY_ENABLED and hasattr(self.estimate_store, 'load_typed'):
+                    estimate_tracking_df = self.estimate_store.load_typed(start_date=start_date)
+                    if VERIFY_SCORING_PARITY:
+                        # The per-symbol methods of the parity check need datetime columns
+                        reference_df = self.estimate_store.load(start_date=start_date)
+                else:
+                    estimate_tracking_df = self.estimate_store.load(start_date=start_date)
+            if estimate_tracking_df is None or estimate_tracking_df.empty:
+                logi(f"estimate_tracking_df is empty")
+                return None
+            metrics.increment("scored_history_rows", len(estimate_tracking_df))
+
+        with metrics.stage("score"):
+            return self.calculate_factors(symbol_list, estimate_tracking_df, as_of, engine=engine,
+                                          reference_df=reference_df)
+
+    def store_ranked_results(self, results_df, file_name="earnings_revision_results.csv"):
+        """
+        Normalizes and ranks the factors of a universe and stores them in the results directory.
+        """
+        with metrics.stage("normalize"):
+            final_results_df = self.rank_results(results_df)
+        with metrics.stage("write"):
+            store_csv(RESULTS_DIR, file_name, final_results_df)
         path = os.path.join(RESULTS_DIR, file_name)
         logd(f"Results file stored to: {path}")
+        return final_results_df
+
+    def calculate_earnings_estimate_revisions(self, symbol_list=None):
+        logi("Calculating earnings estimate revisions...")
+        if symbol_list is None:
+            symbol_loader = MarketSymbolLoader()
+            with metrics.stage("symbol_load"):
+                symbols_df = symbol_loader.fetch_sp500_symbols(cache_file=True, cache_dir=CACHE_DIR)
+            symbol_list = symbols_df['symbol'].unique()
+            self.symbol_groups = get_symbol_groups(symbols_df)
+
+        results_df = self.score_symbols(symbol_list)
+        if results_df is None:
+            return
+        self.store_ranked_results(results_df)
+        self.earnings_surprise_loader.fmp_data_loader.log_cache_stats()
@@ -0,0 +1,122 @@
+import pandas as pd
+from datetime import timedelta
+from config import *
+from utils.log_utils import *
+from utils.file_utils import *
+from analysis_tools.rolling_factor_state import RollingFactorState
+from analysis_tools.earnings_estimate_revision_calculator import rank_factor_results, FACTOR_COLUMNS
+from data_loaders.earnings_surprise_loader import EarningsSurpriseLoader
+from storage.estimate_store_factory import create_estimate_store
+
+
+BACKTEST_RESULTS_FILE_NAME = "earnings_revision_backtest.csv"
+
+
+class RevisionBacktester:
+    """
+    Scores the estimate revision model as of every historical tracking date in a single pass.
+
+    The tracking runs are replayed in order into an in-memory RollingFactorState, so each date is
+    scored from window aggregates instead of re-running the pipeline on the full history.
+    Earnings surprises are point-in-time as well: only surprises reported in the 90 days up to
+    each date are used.
+    """
+
+    def __init__(self, fmp_api_key=None):
+        self.earnings_surprise_loader = EarningsSurpriseLoader(fmp_api_key) if fmp_api_key else None
+        self.estimate_store = create_estimate_store()
+
+    def load_earnings_surprises(self, symbol_list) -> pd.DataFrame:
+        """
+        Fetches the earnings surprise history of all symbols once.
+        """
+        surprise_list = []
+        for symbol in symbol_list:
+            surprise_df = self.earnings_surprise_loader.fetch_earnings_surprise_history(symbol)
+            if surprise_df is not None and not surprise_df.empty:
+                surprise_list.append(surprise_df)
+        if not surprise_list:
+            return pd.DataFrame(columns=['symbol', 'date', 'earningsDifferencePercent'])
+        return pd.concat(surprise_list, ignore_index=True)
+
+    @staticmethod
+    def calculate_earnings_surprise_as_of(surprise_df: pd.DataFrame, symbol_list, as_of) -> pd.Series:
+        as_of = pd.Timestamp(as_of)
+        recent_df = surprise_df[(surprise_df['date'] >= as_of - timedelta(days=90)) & (surprise_df['date'] <= as_of)]
+        avg_earnings_surprise = recent_df.groupby('symbol')['earningsDifferencePercent'].mean().round(2)
+        return avg_earnings_surprise.reindex(list(symbol_list)).fillna(0.0)
+
+    def run(self, estimate_tracking_df: pd.DataFrame, symbol_list=None, start_date=None, end_date=None,
+            include_earnings_surprise=True) -> pd.DataFrame:
+        """
+        Scores every tracking date of the history within [start_date, end_date].
+
+        Parameters:
+            estimate_tracking_df (DataFrame): Tracking history. Must include the scoring window before start_date.
+            symbol_list (list): Symbols to score, defaults to all symbols in the history.
+            start_date (datetime): First tracking date to score.
+            end_date (datetime): Last tracking date to score.
+            include_earnings_surprise (bool): Fetch point-in-time earnings surprises (needs an FMP API key).
+
+        Returns:
+            DataFrame: long format with as_of_date, symbol, the factors, weighted_score and rank (1 = best).
+        """
+        estimate_tracking_df = estimate_tracking_df.dropna(subset=['tracking_date'])
+        if symbol_list is None:
+            symbol_list = estimate_tracking_df['symbol'].dropna().unique()
+        symbol_list = list(symbol_list)
+
+        surprise_df = None
+        column_list = FACTOR_COLUMNS
+        if include_earnings_surprise and self.earnings_surprise_loader is not None:
+            surprise_df = self.load_earnings_surprises(symbol_list)
+        else:
+            # A constant column carries no information for the cross-sectional normalization
+            column_list = [col for col in FACTOR_COLUMNS if col != 'avg_earnings_surprise']
+
+        start_date = pd.Timestamp(start_date).normalize() if start_date is not None else None
+        end_date = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1) if end_date is not None else None
+
+        rolling_factor_state = RollingFactorState(state_dir=None)
+        scores_list = []
+        for tracking_date, run_df in estimate_tracking_df.groupby('tracking_date', sort=True):
+            rolling_factor_state.update(run_df, tracking_date)
+            if (start_date is not None and tracking_date < start_date) or \
+                    (end_date is not None and tracking_date >= end_date):
+                continue
+
+            results_df = rolling_factor_state.calculate_factors(symbol_list, tracking_date)
+            if surprise_df is not None:
+                results_df['avg_earnings_surprise'] = self.calculate_earnings_surprise_as_of(
+                    surprise_df, symbol_list, tracking_date).to_numpy()
+            else:
+                results_df['avg_earnings_surprise'] = 0.0
+            ranked_df = rank_factor_results(results_df[['symbol'] + FACTOR_COLUMNS], column_list=column_list)
+            ranked_df.insert(0, 'as_of_date', tracking_date)
+            ranked_df['rank'] = range(1, len(ranked_df) + 1)
+            scores_list.append(ranked_df)
+
+        if not scores_list:
+            return pd.DataFrame(columns=['as_of_date', 'symbol'] + FACTOR_COLUMNS + ['weighted_score', 'rank'])
+        logi(f"Backtest scored {len(symbol_list)} symbols on {len(scores_list)} tracking dates")
+        return pd.concat(scores_list, ignore_index=True)
+
+    def run_backtest(self, start_date=None, end_date=None, symbol_list=None, include_earnings_surprise=True):
+        """
+        Loads the stored history, runs the backtest and stores the long-format results in RESULTS_DIR.
+        """
+        logi("Running estimate revision backtest...")
+        load_start_date = None
+        if start_date is not None:
+            # The first scored date needs its full scoring window
+            load_start_date = pd.Timestamp(start_date) - timedelta(days=SCORING_HISTORY_DAYS + 1)
+        estimate_tracking_df = self.estimate_store.load(symbols=symbol_list, start_date=load_start_date,
+                                                        end_date=end_date)
+        if estimate_tracking_df is None or estimate_tracking_df.empty:
+            logi(f"estimate_tracking_df is empty")
+            return None
+
+        backtest_df = self.run(estimate_tracking_df, symbol_list, start_date, end_date, include_earnings_surprise)
+        store_csv(RESULTS_DIR, BACKTEST_RESULTS_FILE_NAME, backtest_df)
+        logd(f"Backtest results stored to: {os.path.join(RESULTS_DIR, BACKTEST_RESULTS_FILE_NAME)}")
+        return backtest_df
@@ -0,0 +1,234 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from config import *
+from utils.log_utils import *
+
+
+DAY_COLUMNS = ['symbol', 'tracking_date', 'row_count', 'eps_sum', 'eps_count', 'analysts_sum', 'analysts_count',
+               'up_revisions', 'down_revisions']
+YEAR_COLUMNS = ['symbol', 'tracking_date', 'fiscal_year', 'first_eps', 'last_eps']
+LAST_VALUE_COLUMNS = ['symbol', 'date', 'estimatedEpsAvg', 'tracking_date']
+
+
+class RollingFactorState:
+    """
+    Persisted per-symbol aggregates of the tracking history, updated once per tracking run.
+
+    The state keeps one bucket per symbol and tracking run inside the longest scoring window:
+        - day buckets: row count, sum/count of estimatedEpsAvg and numberAnalystsEstimatedEps, and the number
+          of up/down revisions starting from that run (a revision counts while its earlier row is in the window)
+        - year buckets: first/last estimatedEpsAvg per fiscal year and run for the magnitude factor
+        - last values: most recent estimatedEpsAvg per (symbol, target date) to detect the next revision
+    Buckets older than the window are expired on every update, so scoring costs O(symbols)
+    regardless of how much history is stored.
+
+    Attributes:
+        window_days (int): Longest scoring window in days.
+        last_tracking_date (datetime): Tracking date of the most recent run applied.
+    """
+
+    def __init__(self, state_dir=ROLLING_FACTOR_STATE_DIR, window_days=SCORING_HISTORY_DAYS,
+                 agreement_days=30, magnitude_days=30, upside_days=90):
+        self.state_dir = state_dir
+        self.window_days = max(window_days, agreement_days, magnitude_days, upside_days)
+        self.agreement_days = agreement_days
+        self.magnitude_days = magnitude_days
+        self.upside_days = upside_days
+        self.last_tracking_date = None
+        self.day_df = pd.DataFrame(columns=DAY_COLUMNS)
+        self.year_df = pd.DataFrame(columns=YEAR_COLUMNS)
+        self.last_value_df = pd.DataFrame(columns=LAST_VALUE_COLUMNS)
+
+    @classmethod
+    def load(cls, state_dir=ROLLING_FACTOR_STATE_DIR, **kwargs):
+        """
+        Loads the persisted state, or returns an empty state if none exists.
+        """
+        state = cls(state_dir, **kwargs)
+        meta_path = os.path.join(state_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return state
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        state.last_tracking_date = pd.Timestamp(meta['last_tracking_date']) if meta.get('last_tracking_date') else None
+        state.day_df = pd.read_parquet(os.path.join(state_dir, "days.parquet"))
+        state.year_df = pd.read_parquet(os.path.join(state_dir, "years.parquet"))
+        state.last_value_df = pd.read_parquet(os.path.join(state_dir, "last_values.parquet"))
+        return state
+
+    def save(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        for df, file_name in [(self.day_df, "days.parquet"), (self.year_df, "years.parquet"),
+                              (self.last_value_df, "last_values.parquet")]:
+            path = os.path.join(self.state_dir, file_name)
+            df.to_parquet(f"{path}.tmp", index=False)
+            os.replace(f"{path}.tmp", path)
+        # The meta file is written last and marks the state as complete
+        meta_path = os.path.join(self.state_dir, "meta.json")
+        with open(f"{meta_path}.tmp", "w") as f:
+            json.dump({'last_tracking_date': str(self.last_tracking_date) if self.last_tracking_date is not None else None,
+                       'window_days': self.window_days}, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def is_empty(self) -> bool:
+        return self.last_tracking_date is None
+
+    def can_update(self, tracking_date) -> bool:
+        """
+        Returns True if tracking_date is a new day after the last applied run.
+        """
+        return self.last_tracking_date is not None and \
+            pd.Timestamp(tracking_date).normalize() > self.last_tracking_date.normalize()
+
+    def update(self, new_estimates_df: pd.DataFrame, tracking_date):
+        """
+        Applies one tracking run and expires buckets that slid out of the window.
+        """
+        tracking_date = pd.Timestamp(tracking_date)
+        if self.last_tracking_date is not None and tracking_date <= self.last_tracking_date:
+            raise ValueError(f"Tracking date {tracking_date} is not after the last applied run {self.last_tracking_date}")
+        if new_estimates_df is None or new_estimates_df.empty:
+            self.last_tracking_date = tracking_date
+            return
+
+        run_df = new_estimates_df[['symbol', 'date', 'estimatedEpsAvg', 'numberAnalystsEstimatedEps']].copy()
+        run_df['date'] = pd.to_datetime(run_df['date'], errors='coerce')
+        run_df['estimatedEpsAvg'] = run_df['estimatedEpsAvg'].astype(float)
+        run_df['numberAnalystsEstimatedEps'] = run_df['numberAnalystsEstimatedEps'].astype(float)
+
+        # Day buckets of the new run
+        grouped = run_df.groupby('symbol', sort=False)
+        new_day_df = pd.DataFrame({
+            'row_count': grouped.size(),
+            'eps_sum': grouped['estimatedEpsAvg'].sum(),
+            'eps_count': grouped['estimatedEpsAvg'].count(),
+            'analysts_sum': grouped['numberAnalystsEstimatedEps'].sum(),
+            'analysts_count': grouped['numberAnalystsEstimatedEps'].count()
+        }).reset_index()
+        new_day_df['tracking_date'] = tracking_date
+        new_day_df['up_revisions'] = 0
+        new_day_df['down_revisions'] = 0
+
+        # Revisions against the previous row of the same target, credited to the run of that previous row
+        dated_df = run_df.dropna(subset=['date'])
+        revisions_df = dated_df.merge(self.last_value_df, on=['symbol', 'date'], how='inner', suffixes=('', '_previous'))
+        if not revisions_df.empty:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                eps_change = (revisions_df['estimatedEpsAvg'] - revisions_df['estimatedEpsAvg_previous']) / \
+                             revisions_df['estimatedEpsAvg_previous']
+            revisions_df['up_revisions'] = (eps_change > 0).astype(int)
+            revisions_df['down_revisions'] = (eps_change < 0).astype(int)
+            revision_counts_df = revisions_df.groupby(['symbol', 'tracking_date'])[
+                ['up_revisions', 'down_revisions']].sum()
+            day_df = self.day_df.set_index(['symbol', 'tracking_date'])
+            revision_counts_df = revision_counts_df.reindex(day_df.index, fill_value=0)
+            day_df[['up_revisions', 'down_revisions']] += revision_counts_df.to_numpy()
+            self.day_df = day_df.reset_index()
+
+        # First/last consensus per fiscal year of the new run
+        year_run_df = dated_df.assign(fiscal_year=dated_df['date'].dt.year)
+        year_grouped = year_run_df.groupby(['symbol', 'fiscal_year'], sort=False)['estimatedEpsAvg']
+        new_year_df = pd.DataFrame({
+            'first_eps': year_run_df.loc[year_grouped.head(1).index].set_index(['symbol', 'fiscal_year'])['estimatedEpsAvg'],
+            'last_eps': year_run_df.loc[year_grouped.tail(1).index].set_index(['symbol', 'fiscal_year'])['estimatedEpsAvg']
+        }).reset_index()
+        new_year_df['tracking_date'] = tracking_date
+
+        # Latest value per target
+        new_last_value_df = dated_df.drop_duplicates(subset=['symbol', 'date'], keep='last')[
+            ['symbol', 'date', 'estimatedEpsAvg']].assign(tracking_date=tracking_date)
+        self.last_value_df = pd.concat([df for df in [self.last_value_df, new_last_value_df] if len(df) > 0],
+                                       ignore_index=True).drop_duplicates(subset=['symbol', 'date'], keep='last')
+
+        self.day_df = pd.concat([df for df in [self.day_df, new_day_df[DAY_COLUMNS]] if len(df) > 0], ignore_index=True)
+        self.year_df = pd.concat([df for df in [self.year_df, new_year_df[YEAR_COLUMNS]] if len(df) > 0],
+                                 ignore_index=True)
+        self.last_tracking_date = tracking_date
+        self.expire(tracking_date)
+
+    def expire(self, as_of):
+        """
+        Drops buckets that can no longer fall inside any scoring window.
+        """
+        cutoff_date = pd.Timestamp(as_of) - timedelta(days=self.window_days + 1)
+        self.day_df = self.day_df[self.day_df['tracking_date'] >= cutoff_date].reset_index(drop=True)
+        self.year_df = self.year_df[self.year_df['tracking_date'] >= cutoff_date].reset_index(drop=True)
+        # Revisions starting from an expired run are never counted, so older last values are not needed
+        self.last_value_df = self.last_value_df[self.last_value_df['tracking_date'] >= cutoff_date].reset_index(drop=True)
+
+    def rebuild(self, estimate_tracking_df: pd.DataFrame):
+        """
+        Rebuilds the state from the tracking history by applying every run in order.
+        Only the last window_days of history are needed.
+        """
+        self.last_tracking_date = None
+        self.day_df = pd.DataFrame(columns=DAY_COLUMNS)
+        self.year_df = pd.DataFrame(columns=YEAR_COLUMNS)
+        self.last_value_df = pd.DataFrame(columns=LAST_VALUE_COLUMNS)
+        if estimate_tracking_df is None or estimate_tracking_df.empty:
+            return
+        estimate_tracking_df = estimate_tracking_df.dropna(subset=['tracking_date'])
+        for tracking_date, run_df in estimate_tracking_df.groupby('tracking_date', sort=True):
+            self.update(run_df, tracking_date)
+        logi(f"Rebuilt rolling factor state from {len(estimate_tracking_df)} rows up to {self.last_tracking_date}")
+
+    def calculate_factors(self, symbol_list, as_of: datetime = None) -> pd.DataFrame:
+        """
+        Calculates the estimate revision factors from the aggregates.
+
+        Returns:
+            DataFrame: one row per symbol in symbol_list order with agreement_score, magnitude_score,
+            upside_score and avg_num_analysts.
+        """
+        as_of = pd.Timestamp(as_of or datetime.now())
+        symbol_index = pd.Index(list(symbol_list), name='symbol')
+
+        # Agreement
+        agreement_df = self.day_df[self.day_df['tracking_date'] >= as_of - timedelta(days=self.agreement_days)]
+        revision_counts_df = agreement_df.groupby('symbol')[['up_revisions', 'down_revisions']].sum()
+        total = revision_counts_df['up_revisions'] + revision_counts_df['down_revisions']
+        agreement = (revision_counts_df['up_revisions'] / total.where(total > 0)).round(2).fillna(0.0)
+
+        # Magnitude
+        year_df = self.year_df[self.year_df['tracking_date'] >= as_of - timedelta(days=self.magnitude_days)]
+        year_df = year_df.sort_values(by='tracking_date', kind='stable')
+
+        # first()/last() would skip NaN values, so take the first/last bucket explicitly
+        def get_bucket_change(year):
+            fiscal_year_df = year_df[year_df['fiscal_year'] == year]
+            grouped = fiscal_year_df.groupby('symbol')
+            first = fiscal_year_df.loc[grouped.head(1).index].set_index('symbol')['first_eps']
+            last = fiscal_year_df.loc[grouped.tail(1).index].set_index('symbol')['last_eps']
+            return (last - first) / first
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            current_fiscal_change = get_bucket_change(as_of.year)
+            next_fiscal_change = get_bucket_change(as_of.year + 1) * 100
+            current_fiscal_change, next_fiscal_change = current_fiscal_change.align(next_fiscal_change, join='inner')
+            magnitude = ((current_fiscal_change + next_fiscal_change) / 2).round(2)
+
+        # Upside and analyst count
+        upside_df = self.day_df[self.day_df['tracking_date'] >= as_of - timedelta(days=self.upside_days)]
+        upside_df = upside_df[upside_df['row_count'] > 0]
+        grouped = upside_df.groupby('symbol')
+        eps_count = grouped['eps_count'].sum()
+        avg_recent_consensus = grouped['eps_sum'].sum() / eps_count.where(eps_count > 0)
+        last_df = upside_df.loc[grouped['tracking_date'].idxmax()].set_index('symbol')
+        last_consensus = (last_df['eps_sum'] / last_df['eps_count'].where(last_df['eps_count'] > 0)).reindex(
+            avg_recent_consensus.index)
+        upside = ((last_consensus - avg_recent_consensus) / avg_recent_consensus) * 100
+        invalid = avg_recent_consensus.isna() | last_consensus.isna() | (avg_recent_consensus == 0)
+        upside = upside.round(2).mask(invalid, 0.0)
+        analysts_count = grouped['analysts_count'].sum()
+        avg_num_analysts = grouped['analysts_sum'].sum() / analysts_count.where(analysts_count > 0)
+
+        factors_df = pd.DataFrame({
+            'agreement_score': agreement.reindex(symbol_index, fill_value=0.0),
+            'magnitude_score': magnitude.reindex(symbol_index, fill_value=0.0),
+            'upside_score': upside.reindex(symbol_index, fill_value=0.0),
+            'avg_num_analysts': avg_num_analysts.reindex(symbol_index, fill_value=0.0)
+        }, index=symbol_index)
+        return factors_df.reset_index()
@@ -0,0 +1,119 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from config import *
+from utils.log_utils import *
+from analysis_tools.vectorized_revision_engine import VectorizedRevisionEngine
+
+
+# Columns shared with the worker processes
+SHARED_COLUMNS = ['symbol_code', 'date', 'tracking_date', 'estimatedEpsAvg', 'numberAnalystsEstimatedEps']
+
+
+def _score_shard(column_dir, row_start, row_end, symbol_names, shard_symbols, as_of):
+    """
+    Scores one shard in a worker process. Columns are memory-mapped, so only the rows
+    of the shard are paged in and nothing but the small factor table is pickled back.
+    """
+    columns = {col: np.load(os.path.join(column_dir, f"{col}.npy"), mmap_mode='r')[row_start:row_end]
+               for col in SHARED_COLUMNS}
+    shard_df = pd.DataFrame({
+        'symbol': np.asarray(symbol_names, dtype=object)[columns['symbol_code']],
+        'date': columns['date'],
+        'tracking_date': columns['tracking_date'],
+        'estimatedEpsAvg': columns['estimatedEpsAvg'],
+        'numberAnalystsEstimatedEps': columns['numberAnalystsEstimatedEps']
+    })
+    return VectorizedRevisionEngine().calculate_factors(shard_df, shard_symbols, as_of)
+
+
+class ShardedScorer:
+    """
+    Scores large universes in a process pool.
+
+    The scoring window of the history is sorted by symbol and written once as one .npy file per
+    column (under /dev/shm when available). Symbols are split into contiguous shards; each worker
+    memory-maps the columns and scores its row range with the VectorizedRevisionEngine.
+    Cross-sectional normalization is left to the caller and runs on the merged result,
+    so the output matches the serial engines.
+
+    Attributes:
+        workers (int): Number of worker processes.
+        shard_count (int): Number of shards, defaults to 4 per worker for load balancing.
+    """
+
+    def __init__(self, workers=SCORING_WORKERS, shard_count=None):
+        self.workers = max(1, workers or 1)
+        self.shard_count = shard_count or self.workers * 4
+
+    @staticmethod
+    def _get_shared_dir():
+        # Prefer RAM-backed storage so the column files are effectively shared memory
+        return "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+    def write_columns(self, estimate_tracking_df: pd.DataFrame, symbol_list, as_of, column_dir):
+        """
+        Writes the rows of the scoring window sorted by symbol to column files.
+
+        Returns:
+            tuple: (symbol code per row, symbol names)
+        """
+        window_days = max(SCORING_HISTORY_DAYS, 90)
+        df = estimate_tracking_df[estimate_tracking_df['symbol'].isin(list(symbol_list))]
+        df = df[df['tracking_date'] >= as_of - timedelta(days=window_days)]
+
+        # Stable sort keeps the original row order within a symbol
+        symbol_names = np.array(sorted(set(df['symbol'])), dtype=object)
+        symbol_codes = np.searchsorted(symbol_names, df['symbol'].to_numpy(dtype=object)).astype(np.int32)
+        order = np.argsort(symbol_codes, kind='stable')
+
+        arrays = {
+            'symbol_code': symbol_codes[order],
+            'date': df['date'].to_numpy(dtype='datetime64[ns]')[order],
+            'tracking_date': df['tracking_date'].to_numpy(dtype='datetime64[ns]')[order],
+            'estimatedEpsAvg': df['estimatedEpsAvg'].to_numpy(dtype=np.float64)[order],
+            'numberAnalystsEstimatedEps': df['numberAnalystsEstimatedEps'].to_numpy(dtype=np.float64)[order]
+        }
+        for col, values in arrays.items():
+            np.save(os.path.join(column_dir, f"{col}.npy"), values)
+        return arrays['symbol_code'], symbol_names
+
+    def calculate_factors(self, estimate_tracking_df: pd.DataFrame, symbol_list, as_of: datetime = None) -> pd.DataFrame:
+        """
+        Calculates the estimate revision factors with a process pool.
+
+        Returns:
+            DataFrame: same layout as VectorizedRevisionEngine.calculate_factors, in symbol_list order.
+        """
+        as_of = as_of or datetime.now()
+        symbol_list = list(symbol_list)
+        with tempfile.TemporaryDirectory(prefix="revision_scoring_", dir=self._get_shared_dir()) as column_dir:
+            symbol_codes, symbol_names = self.write_columns(estimate_tracking_df, symbol_list, as_of, column_dir)
+
+            # Contiguous symbol code ranges and their row ranges
+            shard_bounds = np.linspace(0, len(symbol_names), min(self.shard_count, max(1, len(symbol_names))) + 1,
+                                       dtype=int)
+            tasks = []
+            for code_start, code_end in zip(shard_bounds[:-1], shard_bounds[1:]):
+                if code_start == code_end:
+                    continue
+                row_start, row_end = np.searchsorted(symbol_codes, [code_start, code_end], side='left')
+                tasks.append((int(row_start), int(row_end), list(symbol_names[code_start:code_end])))
+
+            logd(f"Scoring {len(symbol_names)} symbols in {len(tasks)} shards with {self.workers} workers...")
+            shard_results = []
+            if tasks:
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    futures = [executor.submit(_score_shard, column_dir, row_start, row_end, list(symbol_names),
+                                               shard_symbols, as_of)
+                               for row_start, row_end, shard_symbols in tasks]
+                    shard_results = [future.result() for future in futures]
+
+        # Symbols without history in the window score 0.0 like in the serial engines
+        empty_df = VectorizedRevisionEngine().calculate_factors(estimate_tracking_df.iloc[0:0], [], as_of)
+        factors_df = pd.concat([empty_df] + shard_results, ignore_index=True).set_index('symbol')
+        factors_df = factors_df.reindex(pd.Index(symbol_list, name='symbol'), fill_value=0.0)
+        return factors_df.reset_index()
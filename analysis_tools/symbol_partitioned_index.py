@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+
+class SymbolPartitionedIndex:
+    """
+    Index over the tracking history built once per scoring run.
+
+    Rows are sorted by (symbol, tracking_date) so each symbol occupies a contiguous row range.
+    Looking up a symbol is a dictionary lookup plus a positional slice, and the start of a
+    time window is found with a binary search on the symbol's sorted tracking dates.
+    Rows without a tracking date can never fall inside a window and are left out.
+    The sort is stable, so rows with the same tracking date keep their original order.
+    """
+
+    def __init__(self, estimate_tracking_df: pd.DataFrame):
+        df = estimate_tracking_df.dropna(subset=['symbol', 'tracking_date'])
+        df = df.sort_values(by=['symbol', 'tracking_date'], kind='stable').reset_index(drop=True)
+        self.df = df
+        self.tracking_dates = df['tracking_date'].to_numpy()
+
+        # Contiguous [start, end) row offsets per symbol
+        symbols = df['symbol'].to_numpy()
+        if len(symbols) > 0:
+            boundaries = np.flatnonzero(symbols[1:] != symbols[:-1]) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(symbols)]))
+            self.offsets = {symbol: (start, end) for symbol, start, end in zip(symbols[starts], starts, ends)}
+        else:
+            self.offsets = {}
+
+    def __len__(self):
+        return len(self.df)
+
+    def get_symbols(self) -> list:
+        return list(self.offsets.keys())
+
+    def get_symbol_df(self, symbol) -> pd.DataFrame:
+        """
+        Returns all rows of a symbol in tracking date order.
+        """
+        start, end = self.offsets.get(symbol, (0, 0))
+        return self.df.iloc[start:end]
+
+    def get_window(self, symbol, cutoff_date) -> pd.DataFrame:
+        """
+        Returns the rows of a symbol with tracking_date >= cutoff_date.
+        """
+        start, end = self.offsets.get(symbol, (0, 0))
+        if start == end:
+            return self.df.iloc[0:0]
+        cutoff = pd.Timestamp(cutoff_date).to_datetime64().astype(self.tracking_dates.dtype)
+        window_start = start + np.searchsorted(self.tracking_dates[start:end], cutoff, side='left')
+        return self.df.iloc[window_start:end]
@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from utils.log_utils import *
+from storage.typed_estimate_loader import to_day_number, is_day_number, get_day_number_years
+
+
+# Factors computed from the tracking history (earnings surprise comes from the FMP API)
+ESTIMATE_FACTOR_COLUMNS = ['agreement_score', 'magnitude_score', 'upside_score', 'avg_num_analysts']
+
+
+class VectorizedRevisionEngine:
+    """
+    Computes the estimate revision factors for all symbols at once with groupby operations.
+
+    Produces the same numbers as the per-symbol calculate_agreement, calculate_magnitude,
+    calculate_upside and calculate_avg_number_analysts methods of EarningsEstimateRevisionCalculator,
+    but scans the tracking history once per window instead of once per symbol and factor.
+    """
+
+    def __init__(self, agreement_days=30, magnitude_days=30, upside_days=90):
+        self.agreement_days = agreement_days
+        self.magnitude_days = magnitude_days
+        self.upside_days = upside_days
+
+    def calculate_agreement(self, window_df: pd.DataFrame) -> pd.Series:
+        # Revisions are consecutive changes of the same symbol and fiscal target
+        eps_change = window_df.groupby(['symbol', 'date'], sort=False)['estimatedEpsAvg'].pct_change()
+        revisions_df = pd.DataFrame({
+            'symbol': window_df['symbol'],
+            'up': eps_change > 0,
+            'down': eps_change < 0
+        })
+        counts_df = revisions_df.groupby('symbol', sort=False)[['up', 'down']].sum()
+        total = counts_df['up'] + counts_df['down']
+        agreement = (counts_df['up'] / total.where(total > 0)).round(2)
+        return agreement.fillna(0.0)
+
+    def calculate_magnitude(self, window_df: pd.DataFrame, as_of: datetime) -> pd.Series:
+        if is_day_number(window_df['date']):
+            target_year = pd.Series(get_day_number_years(window_df['date'].to_numpy()), index=window_df.index)
+        else:
+            target_year = window_df['date'].dt.year
+
+        def get_change(year):
+            year_df = window_df[target_year == year]
+            grouped = year_df.groupby('symbol', sort=False)['estimatedEpsAvg']
+            # head/tail keep the first/last row in history order, including NaN values
+            first = year_df.loc[grouped.head(1).index].set_index('symbol')['estimatedEpsAvg']
+            last = year_df.loc[grouped.tail(1).index].set_index('symbol')['estimatedEpsAvg']
+            return (last - first) / first
+
+        current_fiscal_change = get_change(as_of.year)
+        next_fiscal_change = get_change(as_of.year + 1) * 100
+        # Symbols need both fiscal years to get a magnitude score
+        current_fiscal_change, next_fiscal_change = current_fiscal_change.align(next_fiscal_change, join='inner')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return ((current_fiscal_change + next_fiscal_change) / 2).round(2)
+
+    def calculate_upside(self, window_df: pd.DataFrame) -> pd.Series:
+        grouped = window_df.groupby('symbol', sort=False)
+        avg_recent_consensus = grouped['estimatedEpsAvg'].mean()
+
+        # Consensus at each symbol's most recent tracking date
+        is_last = window_df['tracking_date'] == grouped['tracking_date'].transform('max')
+        last_consensus = window_df[is_last].groupby('symbol', sort=False)['estimatedEpsAvg'].mean()
+        last_consensus = last_consensus.reindex(avg_recent_consensus.index)
+
+        upside = ((last_consensus - avg_recent_consensus) / avg_recent_consensus) * 100
+        invalid = avg_recent_consensus.isna() | last_consensus.isna() | (avg_recent_consensus == 0)
+        return upside.round(2).mask(invalid, 0.0)
+
+    def calculate_avg_number_analysts(self, window_df: pd.DataFrame) -> pd.Series:
+        return window_df.groupby('symbol', sort=False)['numberAnalystsEstimatedEps'].mean()
+
+    def calculate_factors(self, estimate_tracking_df: pd.DataFrame, symbol_list, as_of: datetime = None) -> pd.DataFrame:
+        """
+        Calculates the estimate revision factors for all symbols.
+
+        Parameters:
+            estimate_tracking_df (DataFrame): Tracking history with datetime 'date' and 'tracking_date' columns,
+                or the typed history of storage.typed_estimate_loader with int32 day numbers. Windows over
+                day numbers include the whole first day.
+            symbol_list (list): Symbols to score. Symbols without history get 0.0 for all factors.
+            as_of (datetime): Scoring time, defaults to now.
+
+        Returns:
+            DataFrame: one row per symbol in symbol_list order with the columns 'symbol' and ESTIMATE_FACTOR_COLUMNS.
+        """
+        as_of = as_of or datetime.now()
+        symbol_list = list(symbol_list)
+        df = estimate_tracking_df[['symbol', 'date', 'tracking_date', 'estimatedEpsAvg', 'numberAnalystsEstimatedEps']]
+        df = df[df['symbol'].isin(symbol_list)]
+        if is_day_number(df['tracking_date']):
+            # Typed history: compute in float64 like the datetime path, on the filtered rows only
+            df = df.astype({'estimatedEpsAvg': 'float64', 'numberAnalystsEstimatedEps': 'float64'})
+            get_cutoff = lambda days: to_day_number(as_of - timedelta(days=days))
+        else:
+            get_cutoff = lambda days: as_of - timedelta(days=days)
+
+        agreement_df = df[df['tracking_date'] >= get_cutoff(self.agreement_days)]
+        if self.magnitude_days == self.agreement_days:
+            magnitude_df = agreement_df
+        else:
+            magnitude_df = df[df['tracking_date'] >= get_cutoff(self.magnitude_days)]
+        upside_df = df[df['tracking_date'] >= get_cutoff(self.upside_days)]
+
+        # Symbols without data in a window score 0.0, NaN results of symbols with data are kept
+        symbol_index = pd.Index(symbol_list, name='symbol')
+        factors_df = pd.DataFrame({
+            'agreement_score': self.calculate_agreement(agreement_df).reindex(symbol_index, fill_value=0.0),
+            'magnitude_score': self.calculate_magnitude(magnitude_df, as_of).reindex(symbol_index, fill_value=0.0),
+            'upside_score': self.calculate_upside(upside_df).reindex(symbol_index, fill_value=0.0),
+            'avg_num_analysts': self.calculate_avg_number_analysts(upside_df).reindex(symbol_index, fill_value=0.0)
+        }, index=symbol_index)
+        return factors_df.reset_index()
+
+    def check_parity(self, calculator, estimate_tracking_df: pd.DataFrame, symbol_list, as_of: datetime = None,
+                     tolerance=1e-9, reference_df: pd.DataFrame = None) -> pd.DataFrame:
+        """
+        Compares the vectorized factors with the per-symbol methods of an EarningsEstimateRevisionCalculator.
+        The per-symbol methods need datetime columns, so for a typed history pass the same history
+        loaded with datetimes as reference_df.
+
+        Returns:
+            DataFrame: rows where at least one factor differs by more than tolerance (empty when in parity).
+        """
+        as_of = as_of or datetime.now()
+        vectorized_df = self.calculate_factors(estimate_tracking_df, symbol_list, as_of).set_index('symbol')
+        reference_df = estimate_tracking_df if reference_df is None else reference_df
+        per_symbol_df = pd.DataFrame([{
+            'symbol': symbol,
+            'agreement_score': calculator.calculate_agreement(symbol, reference_df, self.agreement_days, as_of=as_of),
+            'magnitude_score': calculator.calculate_magnitude(symbol, reference_df, as_of=as_of),
+            'upside_score': calculator.calculate_upside(symbol, reference_df, as_of=as_of),
+            'avg_num_analysts': calculator.calculate_avg_number_analysts(symbol, reference_df, as_of=as_of)
+        } for symbol in symbol_list]).set_index('symbol')
+
+        mismatch = pd.Series(False, index=per_symbol_df.index)
+        for col in ESTIMATE_FACTOR_COLUMNS:
+            left = vectorized_df[col].astype(float).to_numpy()
+            right = per_symbol_df[col].astype(float).to_numpy()
+            equal = np.isclose(left, right, rtol=0, atol=tolerance, equal_nan=True)
+            mismatch |= ~equal
+        mismatch_df = vectorized_df[mismatch].join(per_symbol_df[mismatch], rsuffix='_per_symbol')
+        if mismatch_df.empty:
+            logi(f"Vectorized factors match the per-symbol factors for {len(symbol_list)} symbols")
+        else:
+            logw(f"Vectorized factors differ for {len(mismatch_df)} symbols: {list(mismatch_df.index[:10])}")
+        return mismatch_df
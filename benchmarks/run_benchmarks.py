@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+import numpy as np
+from config import *
+
+
+# Benchmark scales: (symbols, tracking days, fiscal year targets)
+BENCHMARK_SCALES = {
+    'sp500_1y': (500, 252, 4),
+    'sp500_5y': (500, 1260, 4),
+    'r2000_1y': (2000, 252, 4),
+    'r2000_5y': (2000, 1260, 4),
+}
+BENCHMARK_STAGES = ['csv_load', 'typed_csv_load', 'per_symbol_factors', 'vectorized_factors', 'normalize', 'csv_append',
+                    'parquet_append']
+BENCHMARK_RESULTS_DIR = os.path.join(RESULTS_DIR, "benchmarks")
+# Entry points whose cold import time is measured
+IMPORT_TIME_MODULES = ['cli', 'storage.memmap_column_store', 'storage.estimate_store_factory', 'utils.df_utils',
+                       'pipelines.run_context']
+_IMPORT_TIME_SCRIPT = """
+import importlib, json, resource, sys, time
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+seconds = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'seconds': seconds, 'peak_rss_mb': peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024}))
+"""
+
+
+def get_peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class StageTimer:
+    """
+    Collects wall time, process peak RSS and throughput per benchmark stage.
+    Peak RSS is the high-water mark of the process at the end of the stage, so each scale runs in its own process.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, fn, rows):
+        start = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - start
+        self.stages[name] = {
+            'seconds': round(seconds, 4),
+            'rows': int(rows),
+            'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None,
+            'peak_rss_mb': round(get_peak_rss_mb(), 1)
+        }
+        print(f"  {name:<24} {seconds:9.3f}s {rows:>12,} rows {self.stages[name]['peak_rss_mb']:>9.1f} MB peak")
+        return result
+
+
+def run_scale(scale, stages=BENCHMARK_STAGES, seed=42):
+    """
+    Runs the benchmark stages for one scale on a synthetic history and returns the stage metrics.
+    """
+    # Imported here so the spawned worker process pays for them, not the parent
+    from loguru import logger
+    from benchmarks.synthetic_history import generate_estimate_history
+    from analysis_tools.earnings_estimate_revision_calculator import EarningsEstimateRevisionCalculator, \
+        FACTOR_COLUMNS
+    from analysis_tools.vectorized_revision_engine import VectorizedRevisionEngine
+    from data_loaders.fmp_data_loader import FmpDataLoader
+    from storage.csv_estimate_store import CsvEstimateStore
+    from storage.parquet_estimate_store import ParquetEstimateStore
+    from utils.df_utils import normalize_dataframe
+
+    # The per-symbol path logs every symbol
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    symbol_count, tracking_days, target_count = BENCHMARK_SCALES[scale]
+    print(f"{scale}: {symbol_count} symbols x {tracking_days} days x {target_count} targets")
+    timer = StageTimer()
+    as_of = datetime.now()
+    history_df = timer.run("generate", lambda: generate_estimate_history(
+        symbol_count, tracking_days, target_count, end_date=as_of, seed=seed), symbol_count * tracking_days * target_count)
+    symbol_list = list(history_df['symbol'].cat.categories)
+    last_tracking_date = history_df['tracking_date'].max()
+    history_rows = len(history_df)
+    new_day_df = history_df[history_df['tracking_date'] == last_tracking_date].copy()
+    new_day_df['tracking_date'] = last_tracking_date + timedelta(days=1)
+
+    work_dir = tempfile.mkdtemp(prefix="estimate_benchmark_")
+    try:
+        csv_store = CsvEstimateStore(cache_dir=work_dir)
+        timer.run("csv_write", lambda: history_df.to_csv(csv_store.path, index=False), history_rows)
+        del history_df
+
+        estimate_tracking_df = None
+        if 'csv_load' in stages or 'per_symbol_factors' in stages or 'vectorized_factors' in stages:
+            # read_csv plus to_datetime of both date columns, as the calculator did before the store backends
+            estimate_tracking_df = timer.run("csv_load", csv_store.load, history_rows)
+            window_df = estimate_tracking_df[
+                estimate_tracking_df['tracking_date'] >= as_of - timedelta(days=SCORING_HISTORY_DAYS)]
+            estimate_tracking_df = None
+            window_rows = len(window_df)
+
+        typed_window_df = None
+        if 'typed_csv_load' in stages:
+            typed_window_df = timer.run("typed_csv_load", lambda: csv_store.load_typed(
+                start_date=as_of - timedelta(days=SCORING_HISTORY_DAYS)), history_rows)
+
+        results_df = None
+        if 'per_symbol_factors' in stages:
+            # No requests are made, only the factor methods are used. The store and the loader are
+            # injected, so nothing is created or migrated under the production cache directory
+            calculator = EarningsEstimateRevisionCalculator(
+                "benchmark", fmp_data_loader=FmpDataLoader("benchmark", use_response_cache=False),
+                estimate_store=csv_store)
+            results_df = timer.run("per_symbol_factors",
+                                   lambda: calculator.calculate_symbol_factors(symbol_list, window_df, as_of),
+                                   window_rows)
+        if 'vectorized_factors' in stages:
+            engine = VectorizedRevisionEngine()
+            results_df = timer.run("vectorized_factors",
+                                   lambda: engine.calculate_factors(window_df, symbol_list, as_of), window_rows)
+            if typed_window_df is not None:
+                timer.run("typed_vectorized_factors",
+                          lambda: engine.calculate_factors(typed_window_df, symbol_list, as_of), len(typed_window_df))
+
+        if 'normalize' in stages and results_df is not None:
+            results_df['avg_earnings_surprise'] = np.random.default_rng(seed).normal(2.0, 5.0, len(results_df))
+            timer.run("normalize", lambda: normalize_dataframe(results_df.copy(), FACTOR_COLUMNS), len(results_df))
+
+        if 'csv_append' in stages:
+            timer.run("csv_append", lambda: csv_store.append(new_day_df), len(new_day_df))
+        if 'parquet_append' in stages:
+            parquet_store = ParquetEstimateStore(base_dir=os.path.join(work_dir, "parquet"))
+            timer.run("parquet_append", lambda: parquet_store.append(new_day_df), len(new_day_df))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'scale': scale,
+        'symbols': symbol_count,
+        'tracking_days': tracking_days,
+        'targets': target_count,
+        'history_rows': history_rows,
+        'stages': timer.stages
+    }
+
+
+def measure_import_times(modules=IMPORT_TIME_MODULES):
+    """
+    Measures the cold import time of each module in a fresh interpreter, so modules imported by an
+    earlier measurement are not cached. Returned in the shape of a scale result, so it is stored
+    and compared to the baseline like one.
+    """
+    print("imports: cold import time per entry point")
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [repo_dir, os.environ.get('PYTHONPATH')]))}
+    stages = {}
+    for module in modules:
+        completed = subprocess.run([sys.executable, "-c", _IMPORT_TIME_SCRIPT, module], cwd=repo_dir, env=env,
+                                   capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"  {module:<32} failed: {completed.stderr.strip().splitlines()[-1:]}")
+            continue
+        measured = json.loads(completed.stdout.strip().splitlines()[-1])
+        stages[module] = {
+            'seconds': round(measured['seconds'], 4),
+            'rows': 0,
+            'rows_per_sec': None,
+            'peak_rss_mb': round(measured['peak_rss_mb'], 1)
+        }
+        print(f"  {module:<32} {measured['seconds']:9.3f}s {stages[module]['peak_rss_mb']:>9.1f} MB peak")
+    return {'scale': 'imports', 'stages': stages}
+
+
+def compare_to_baseline(results, baseline):
+    """
+    Prints the wall time and peak RSS of each stage relative to a saved baseline. Ratios above 1 are slower.
+    """
+    print("Comparison to baseline (current / baseline):")
+    for scale, result in results.items():
+        baseline_result = baseline.get(scale)
+        if baseline_result is None:
+            print(f"  {scale}: not in baseline")
+            continue
+        for stage, metrics in result['stages'].items():
+            baseline_metrics = baseline_result['stages'].get(stage)
+            if not baseline_metrics or not baseline_metrics['seconds']:
+                continue
+            time_ratio = metrics['seconds'] / baseline_metrics['seconds']
+            rss_ratio = metrics['peak_rss_mb'] / baseline_metrics['peak_rss_mb']
+            flag = "  SLOWER" if time_ratio > 1.1 else ""
+            print(f"  {scale:<10} {stage:<32} time x{time_ratio:6.2f}  rss x{rss_ratio:6.2f}{flag}")
+
+
+def run_benchmarks(scales, stages=BENCHMARK_STAGES, baseline_path=None, save_baseline_path=None, seed=42,
+                   import_times=True):
+    """
+    Runs each scale in a fresh process, stores the results under results/benchmarks and optionally compares
+    them to, or saves them as, a baseline JSON file. The cold import times are stored as the "imports" entry.
+    """
+    results = {}
+    if import_times:
+        results['imports'] = measure_import_times()
+    for scale in scales:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            results[scale] = executor.submit(run_scale, scale, stages, seed).result()
+
+    os.makedirs(BENCHMARK_RESULTS_DIR, exist_ok=True)
+    path = os.path.join(BENCHMARK_RESULTS_DIR, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Benchmark results stored to: {path}")
+
+    if baseline_path:
+        with open(baseline_path, "r") as f:
+            compare_to_baseline(results, json.load(f))
+    if save_baseline_path:
+        with open(save_baseline_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline stored to: {save_baseline_path}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the tracker and calculator hot paths")
+    parser.add_argument("--scales", nargs="+", default=['sp500_1y'], choices=list(BENCHMARK_SCALES))
+    parser.add_argument("--stages", nargs="+", default=BENCHMARK_STAGES, choices=BENCHMARK_STAGES)
+    parser.add_argument("--baseline", default=None, help="Baseline JSON file to compare against")
+    parser.add_argument("--save-baseline", default=None, help="Store the results as a baseline JSON file")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-imports", action="store_true", help="Do not measure the cold import times")
+    args = parser.parse_args()
+    run_benchmarks(args.scales, args.stages, args.baseline, args.save_baseline, args.seed, not args.skip_imports)
+
+
+if __name__ == "__main__":
+    main()
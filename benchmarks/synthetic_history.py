@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from config import *
+
+
+def generate_estimate_history(symbol_count=500, tracking_days=252, target_count=4, end_date=None, seed=42,
+                              revision_probability=0.1, revision_std=0.02):
+    """
+    Generates a synthetic estimates_tracking history in the layout written by EstimateTracker.
+
+    Every business day up to end_date each symbol reports estimates for target_count fiscal years, starting
+    with the current year, so targets roll over at the turn of the year like the real data. Each
+    (symbol, fiscal year) consensus follows a random walk: on a given day it is revised with
+    revision_probability by a normal move of revision_std relative to its level, with a slight upward
+    drift for growing companies. Analyst counts drift by single analysts.
+
+    Parameters:
+        symbol_count (int): Number of symbols (N).
+        tracking_days (int): Number of business days tracked (D).
+        target_count (int): Fiscal year targets per symbol and day (K).
+        end_date (datetime): Last tracking day, defaults to today.
+        seed (int): Random seed, the same arguments always produce the same history.
+
+    Returns:
+        DataFrame: N x D x K rows with ESTIMATE_TRACKING_COLUMNS, ordered by tracking_date and symbol.
+    """
+    rng = np.random.default_rng(seed)
+    end_date = pd.Timestamp(end_date or datetime.now()).normalize()
+    tracking_dates = pd.bdate_range(end=end_date, periods=tracking_days) + pd.Timedelta(hours=1, minutes=30)
+    day_years = tracking_dates.year.to_numpy()
+    first_year = int(day_years.min())
+    year_count = int(day_years.max()) - first_year + target_count
+
+    # Consensus EPS per (symbol, fiscal year, day)
+    base_eps = rng.lognormal(mean=1.0, sigma=0.8, size=symbol_count)
+    growth = rng.normal(0.08, 0.05, size=symbol_count)
+    year_offsets = np.arange(year_count)
+    level = base_eps[:, None] * (1 + growth[:, None]) ** year_offsets[None, :]
+    revised = rng.random((symbol_count, year_count, tracking_days)) < revision_probability
+    moves = rng.normal(0.001, revision_std, size=revised.shape) * revised
+    eps_avg = level[:, :, None] * np.cumprod(1 + moves, axis=2)
+    # A few loss makers keep the sign of their estimates
+    eps_avg[rng.random(symbol_count) < 0.05] *= -1
+
+    spread = rng.uniform(0.05, 0.25, size=(symbol_count, year_count))[:, :, None]
+    analyst_base = rng.integers(3, 35, size=(symbol_count, year_count))[:, :, None]
+    analyst_moves = np.cumsum(rng.integers(-1, 2, size=revised.shape) * revised, axis=2)
+    analysts = np.clip(analyst_base + analyst_moves, 1, None)
+
+    # Pick the K targets reported on each day: fiscal years day_year .. day_year + K - 1
+    day_index = np.arange(tracking_days)
+    year_index = (day_years - first_year)[:, None] + np.arange(target_count)[None, :]  # (D, K)
+    symbol_index = np.arange(symbol_count)
+
+    # Row order (day, symbol, target)
+    sym = np.broadcast_to(symbol_index[None, :, None], (tracking_days, symbol_count, target_count)).ravel()
+    yi = np.broadcast_to(year_index[:, None, :], (tracking_days, symbol_count, target_count)).ravel()
+    di = np.broadcast_to(day_index[:, None, None], (tracking_days, symbol_count, target_count)).ravel()
+
+    avg = eps_avg[sym, yi, di]
+    half_spread = np.abs(avg) * spread[sym, yi, 0]
+    symbols = pd.Categorical.from_codes(sym, categories=[f"SYM{i:04d}" for i in range(symbol_count)])
+    fiscal_year_ends = pd.to_datetime([f"{first_year + i}-12-31" for i in range(year_count)])
+
+    return pd.DataFrame({
+        'date': fiscal_year_ends[yi],
+        'tracking_date': tracking_dates[di],
+        'estimatedEpsAvg': np.round(avg, 4),
+        'estimatedEpsHigh': np.round(avg + half_spread, 4),
+        'estimatedEpsLow': np.round(avg - half_spread, 4),
+        'numberAnalystsEstimatedEps': analysts[sym, yi, di].astype(float),
+        'symbol': symbols
+    })[ESTIMATE_TRACKING_COLUMNS]
@@ -0,0 +1,159 @@
+"""
+Command line entry point for cron jobs and ad-hoc queries:
+
+    python cli.py track [--index SNP_500 DJI]
+    python cli.py score [--index SNP_500 DJI]
+    python cli.py query symbol AAPL [--start 2024-01-01] [--end 2024-06-30] [--latest]
+    python cli.py build-column-store
+
+Only argparse and config are imported at start-up. Each command imports what it uses when it runs,
+so a query never loads requests, lxml or the scoring code, and --help returns immediately.
+"""
+import argparse
+import os
+import sys
+from config import *
+
+
+def get_fmp_api_key():
+    if "FMP_API_KEY" not in os.environ:
+        print("FMP_API_KEY not set as OS environment variable - exiting")
+        sys.exit(1)
+    return os.environ["FMP_API_KEY"]
+
+
+def setup_run():
+    from utils.file_utils import create_output_directories
+    from utils.log_utils import setup_logger
+    from utils.metrics_utils import metrics
+    create_output_directories()
+    setup_logger("estimate_revision_model_log.txt")
+    metrics.reset()
+
+
+def write_run_metrics():
+    from utils.log_utils import logi
+    from utils.metrics_utils import metrics
+    if METRICS_ENABLED:
+        logi(f"Run metrics stored to: {metrics.write_json()}")
+
+
+def create_run(market_indexes):
+    from data_loaders.market_symbol_loader import MarketIndex
+    from pipelines.run_context import RunContext
+    from pipelines.multi_universe_run import MultiUniverseRun
+    market_indexes = [MarketIndex(market_index) for market_index in market_indexes]
+    run_context = RunContext(get_fmp_api_key(), market_indexes[0])
+    multi_universe_run = MultiUniverseRun(run_context.fmp_api_key, market_indexes, run_context=run_context) \
+        if len(market_indexes) > 1 else None
+    return run_context, multi_universe_run
+
+
+def track(args):
+    setup_run()
+    from trackers.estimate_tracker import TrackingRunError
+    from utils.log_utils import loge
+    run_context, multi_universe_run = create_run(args.index)
+    try:
+        if multi_universe_run is not None:
+            multi_universe_run.track()
+        else:
+            tracker = run_context.create_tracker()
+            tracker.track_estimates(symbol_list=run_context.get_symbol_list())
+    except TrackingRunError as ex:
+        # Non-zero exit status, so a "score" chained after "track" does not run
+        loge(ex)
+        sys.exit(1)
+    run_context.log_stats()
+    write_run_metrics()
+
+
+def score(args):
+    setup_run()
+    run_context, multi_universe_run = create_run(args.index)
+    if multi_universe_run is not None:
+        multi_universe_run.score()
+    else:
+        calculator = run_context.create_calculator()
+        calculator.calculate_earnings_estimate_revisions(symbol_list=run_context.get_symbol_list())
+    run_context.log_stats()
+    write_run_metrics()
+
+
+def build_column_store(args):
+    from storage.estimate_store_factory import create_estimate_store
+    from storage.memmap_column_store import MemmapColumnStore
+    column_store = MemmapColumnStore()
+    column_store.build_from_store(create_estimate_store())
+    print(f"Column store built at {column_store.base_dir}")
+
+
+def load_symbol_history(symbol, start_date=None, end_date=None):
+    """
+    Loads the tracking history of one symbol. The memory-mapped column store reads only the pages
+    of the symbol's slice, so it is used when it is enabled and has been built. It is as current as
+    its last build. Otherwise the configured store is read.
+    """
+    import pandas as pd
+    if MEMMAP_COLUMN_STORE_ENABLED:
+        from storage.memmap_column_store import MemmapColumnStore
+        column_store = MemmapColumnStore.open()
+        if column_store.has_data():
+            symbol_df = column_store.get_symbol_df(symbol)
+            tracking_dates = symbol_df['tracking_date']
+            mask = pd.Series(True, index=symbol_df.index)
+            if start_date is not None:
+                mask &= tracking_dates >= pd.Timestamp(start_date)
+            if end_date is not None:
+                mask &= tracking_dates < pd.Timestamp(end_date) + pd.Timedelta(days=1)
+            return symbol_df[mask].sort_values(['tracking_date', 'date'], kind='stable').reset_index(drop=True)
+
+    from storage.estimate_store_factory import create_estimate_store
+    store = create_estimate_store()
+    return store.load(symbols=[symbol], start_date=start_date, end_date=end_date)
+
+
+def query_symbol(args):
+    symbol_df = load_symbol_history(args.symbol.upper(), args.start, args.end)
+    if symbol_df.empty:
+        print(f"No tracking history for {args.symbol.upper()}")
+        return
+    if args.latest:
+        symbol_df = symbol_df[symbol_df['tracking_date'] == symbol_df['tracking_date'].max()]
+    print(symbol_df.to_string(index=False))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Estimate revision model")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    track_parser = commands.add_parser("track", help="Fetch and store today's analyst estimates")
+    track_parser.add_argument("--index", nargs="+", default=MARKET_INDEXES, help="Market indexes to track")
+    track_parser.set_defaults(func=track)
+
+    score_parser = commands.add_parser("score", help="Score and rank the tracked symbols")
+    score_parser.add_argument("--index", nargs="+", default=MARKET_INDEXES, help="Market indexes to score")
+    score_parser.set_defaults(func=score)
+
+    query_parser = commands.add_parser("query", help="Query the tracking history")
+    query_commands = query_parser.add_subparsers(dest="query_command", required=True)
+    symbol_parser = query_commands.add_parser("symbol", help="Print the tracking history of a symbol")
+    symbol_parser.add_argument("symbol")
+    symbol_parser.add_argument("--start", default=None, help="First tracking day (YYYY-MM-DD)")
+    symbol_parser.add_argument("--end", default=None, help="Last tracking day (YYYY-MM-DD)")
+    symbol_parser.add_argument("--latest", action="store_true", help="Only the most recent tracking run")
+    symbol_parser.set_defaults(func=query_symbol)
+
+    column_store_parser = commands.add_parser("build-column-store",
+                                              help="Rebuild the memory-mapped column store from the tracking store")
+    column_store_parser.set_defaults(func=build_column_store)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
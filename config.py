@@ -1,3 +1,5 @@
+import os
+
 # Directories
 LOG_DIR = "logs"
 CACHE_DIR = "cache"
@@ -8,3 +10,132 @@ ESTIMATE_TRACKING_FILE_NAME = "estimates_tracking.csv"
 EARNINGS_SURPRISES_FILE_NAME = "earnings_surprises.csv"
 EARNINGS_ESTIMATE_REVISION_CANDIDATE_FILE_NAME = "earnings_estimate_revision_candidates.csv"
 
+# Index constituent lists
+# Seconds before a cached symbol list is re-validated against its source page
+SYMBOL_CACHE_TTL = 7 * 24 * 60 * 60
+SYMBOL_LOADER_USER_AGENT = "estimate_revision_model/1.0 (index constituent loader)"
+
+# Market indexes scored on each run (MarketIndex values). With more than one, the union of their symbols
+# is tracked once and a ranking is written per index.
+MARKET_INDEXES = ["SNP_500"]
+
+# FMP API limits
+FMP_CALLS_PER_MINUTE = 300
+FETCH_CONCURRENCY = 8
+USE_CONCURRENT_FETCH = True
+# Symbols fetched between two tracker checkpoints
+TRACKER_BATCH_SIZE = 50
+# A run with more failed symbols is not committed and can be resumed by running the tracker again
+TRACKER_MAX_FAILED_SYMBOLS = 20
+TRACKER_CHECKPOINT_DIR = os.path.join(CACHE_DIR, "tracker_checkpoints")
+# "batch" runs the checkpointed tracker and then the calculator, "streaming" overlaps fetching and scoring
+PIPELINE_MODE = "batch"
+# Responses kept in memory per run
+RUN_CONTEXT_LRU_SIZE = 4096
+FMP_POOL_SIZE = 16
+FMP_REQUEST_TIMEOUT = 30
+FMP_MAX_RETRIES = 4
+FMP_BACKOFF_BASE = 0.5
+FMP_BACKOFF_MAX = 30
+# AIMD limit on in-flight FMP requests with a circuit breaker
+ADAPTIVE_CONCURRENCY_ENABLED = True
+ADAPTIVE_CONCURRENCY_INITIAL = 4
+ADAPTIVE_CONCURRENCY_MAX = 32
+
+# FMP response cache
+# Override with the FMP_BASE_URL environment variable to run against a local stand-in (tools/fmp_stub_server.py)
+FMP_BASE_URL = os.environ.get("FMP_BASE_URL", "https://financialmodelingprep.com/api/v3")
+# Directory to record FMP responses into as fixtures, None to disable
+FMP_RECORD_DIR = os.environ.get("FMP_RECORD_DIR")
+FMP_RESPONSE_CACHE_ENABLED = True
+# Set to True to bypass cached responses for a run
+FMP_FORCE_REFRESH = False
+FMP_RESPONSE_CACHE_DIR = os.path.join(CACHE_DIR, "fmp_responses")
+# Time to live per endpoint in seconds
+FMP_RESPONSE_CACHE_TTLS = {
+    "analyst-estimates": 12 * 60 * 60,
+    "earnings-surprises": 3 * 24 * 60 * 60,
+    "stock-screener": 14 * 24 * 60 * 60
+}
+# Extra time in seconds during which an expired entry is still served while it is refreshed in the background
+FMP_RESPONSE_CACHE_STALE_TTLS = {
+    "analyst-estimates": 0,
+    "earnings-surprises": 7 * 24 * 60 * 60,
+    "stock-screener": 14 * 24 * 60 * 60
+}
+# Reference endpoints whose expired cached response is used when the request fails. Analyst estimates
+# are not among them: a failed symbol is retried by the tracker instead of storing an old response as today's run
+FMP_EXPIRED_FALLBACK_ENDPOINTS = {"earnings-surprises", "stock-screener"}
+
+# Estimate tracking storage
+ESTIMATE_TRACKING_COLUMNS = ['date', 'tracking_date', 'estimatedEpsAvg', 'estimatedEpsHigh',
+                             'estimatedEpsLow', 'numberAnalystsEstimatedEps', 'symbol']
+# Storage backend for the tracking history: "csv", "parquet", "interval" or "sqlite"
+TRACKING_STORE_BACKEND = "parquet"
+ESTIMATE_TRACKING_PARQUET_DIR = os.path.join(CACHE_DIR, "estimates_tracking")
+ESTIMATE_TRACKING_INTERVAL_DIR = os.path.join(CACHE_DIR, "estimates_intervals")
+ESTIMATE_TRACKING_SQLITE_PATH = os.path.join(CACHE_DIR, "estimates_tracking.db")
+# Seconds a SQLite connection waits for a lock
+SQLITE_BUSY_TIMEOUT = 30
+# Memory-mapped column copy of the history for fast per-symbol queries. It is rebuilt by a job that runs
+# after tracking (or with "python cli.py build-column-store"), so the tracker never rewrites it
+MEMMAP_COLUMN_STORE_ENABLED = False
+ESTIMATE_TRACKING_MEMMAP_DIR = os.path.join(CACHE_DIR, "estimates_columns")
+# Oldest tracking date (in days) the calculator needs to load
+SCORING_HISTORY_DAYS = 90
+
+# Scoring
+# "vectorized" scores all symbols at once, "per_symbol" uses the per-symbol factor methods,
+# "rolling" scores from the rolling factor state maintained by the tracker,
+# "parallel" scores symbol shards in a process pool
+SCORING_ENGINE = "rolling"
+# Compare the vectorized factors with the per-symbol factors on every run
+VERIFY_SCORING_PARITY = False
+# Load the history in the compact typed layout (storage/typed_estimate_loader.py) for the vectorized engine.
+# Windows then have day granularity (a run exactly 30 days ago is included) and EPS values pass through
+# float32, so scores differ slightly from the datetime history - VERIFY_SCORING_PARITY reports by how much
+COMPACT_HISTORY_ENABLED = False
+# Worker processes for SCORING_ENGINE = "parallel"
+SCORING_WORKERS = os.cpu_count() or 1
+
+# Rolling factor state updated by the tracker on every run
+ROLLING_FACTOR_STATE_ENABLED = True
+ROLLING_FACTOR_STATE_DIR = os.path.join(CACHE_DIR, "rolling_factor_state")
+
+# Metrics
+# Write the stage timers, request latencies and counters of each run to METRICS_DIR
+METRICS_ENABLED = True
+METRICS_DIR = os.path.join(LOG_DIR, "metrics")
+# Request latency histogram bucket bounds in seconds
+METRICS_LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+# Port of the Prometheus text endpoint, None to disable
+METRICS_PROMETHEUS_PORT = None
+# Interface of the Prometheus endpoint. Local only by default, use "0.0.0.0" to expose it to a remote scraper
+METRICS_PROMETHEUS_HOST = "127.0.0.1"
+# Profile each run with "cprofile" or "pyinstrument", None to disable
+PROFILE_RUN = None
+
+# Job scheduling
+# Tracking runs Monday to Friday at JOB_SCHEDULE_TIME, scoring runs after tracking succeeds
+JOB_SCHEDULE_WEEKDAYS = [0, 1, 2, 3, 4]
+JOB_SCHEDULE_TIME = "01:30"
+# Runs missed while the scheduler was down or busy: "catch_up" runs them once, "skip" drops them
+JOB_MISFIRE_POLICY = "catch_up"
+# Missed runs older than this many seconds are skipped, None to always catch up
+JOB_MISFIRE_GRACE_SECONDS = 12 * 3600
+# Lock files and the last due time of each job
+JOB_STATE_DIR = os.path.join(CACHE_DIR, "jobs")
+# Queue delay and duration of each job run
+JOB_RUN_HISTORY_PATH = os.path.join(LOG_DIR, "job_runs.csv")
+
+# Factor normalization
+# Cross-sectional normalization of the factors: "min_max", "z_score" or "percentile_rank"
+NORMALIZATION_MODE = "min_max"
+# Winsorize the factors before normalizing at mean +/- WINSORIZE_SIGMA standard deviations, None to disable
+WINSORIZE_SIGMA = None
+# Or at the (lower, upper) quantiles, e.g. (0.01, 0.99), None to disable
+WINSORIZE_QUANTILES = None
+# Symbol table column to normalize within, e.g. "GICS Sector", None to normalize over the whole universe
+NORMALIZATION_GROUP_COLUMN = None
+# Standard deviations at which cap_outliers caps a factor
+OUTLIER_STD_MULTIPLIER = 3
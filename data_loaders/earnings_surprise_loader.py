@@ -6,8 +6,25 @@ from utils.log_utils import *
 
 
 class EarningsSurpriseLoader:
-    def __init__(self, fmp_api_key):
-        self.fmp_data_loader = FmpDataLoader(fmp_api_key)
+    def __init__(self, fmp_api_key, fmp_data_loader=None):
+        self.fmp_data_loader = fmp_data_loader or FmpDataLoader(fmp_api_key)
+
+    def fetch_earnings_surprise_history(self, symbol: str):
+        """
+        Fetches all reported earnings surprises of a symbol with the surprise in percent.
+
+        Returns:
+            DataFrame: columns 'symbol', 'date' and 'earningsDifferencePercent', or None if no data is available.
+        """
+        earnings_surprise_df = self.fmp_data_loader.fetch_earnings_surprises(symbol)
+        if earnings_surprise_df is None or earnings_surprise_df.empty:
+            return None
+        earnings_surprise_df = earnings_surprise_df.copy()
+        earnings_surprise_df['symbol'] = symbol
+        earnings_surprise_df['earningsDifferencePercent'] = ((earnings_surprise_df['actualEarningResult'] -
+                                                              earnings_surprise_df['estimatedEarning']) /
+                                                             earnings_surprise_df['estimatedEarning']) * 100
+        return earnings_surprise_df[['symbol', 'date', 'earningsDifferencePercent']]
 
     def find_earnings_surprises(self, symbol: str):
         #logd("Loading earnings surprises...")
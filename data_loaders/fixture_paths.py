@@ -0,0 +1,24 @@
+import os
+
+
+# Query parameters that are not part of a fixture's name
+FIXTURE_EXCLUDED_PARAMS = {"apikey"}
+
+
+def get_fixture_path(fixtures_dir, path, params=None):
+    """
+    Returns the fixture file of an API path relative to the base URL and its query parameters, e.g.
+    'analyst-estimates/AAPL' with period=annual and limit=100 is analyst-estimates/AAPL__limit=100,period=annual.json.
+
+    Raises:
+        ValueError: if the path has empty, '.' or '..' segments or a parameter contains a path separator,
+            so a fixture can never resolve outside fixtures_dir.
+    """
+    params = {k: v for k, v in (params or {}).items() if k not in FIXTURE_EXCLUDED_PARAMS and v is not None}
+    suffix = "__" + ",".join(f"{k}={params[k]}" for k in sorted(params)) if params else ""
+    parts = path.strip("/").split("/")
+    if any(part in ("", ".", "..") or "\\" in part for part in parts):
+        raise ValueError(f"Invalid fixture path: {path}")
+    if "/" in suffix or "\\" in suffix:
+        raise ValueError(f"Invalid fixture parameters: {params}")
+    return os.path.join(fixtures_dir, *parts[:-1], f"{parts[-1]}{suffix}.json")
@@ -1,8 +1,34 @@
+import json
 import os
+import random
+import threading
+import time
 import requests
 import pandas as pd
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
 from enum import Enum
 from typing import Union
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from config import *
+from data_loaders.response_cache import ResponseCache, CacheState, make_request_key
+from utils.log_utils import *
+from utils.rate_limit_utils import get_shared_token_bucket
+from utils.adaptive_limiter import AdaptiveConcurrencyLimiter, CircuitOpenError
+from utils.metrics_utils import metrics
+from data_loaders.fixture_paths import get_fixture_path
+
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class FmpRequestError(Exception):
+    """
+    Raised when an FMP request fails after all retries and the caller asked for errors to be raised.
+    """
+    pass
 
 
 class Period(Enum):
@@ -16,16 +42,260 @@ class FmpDataLoader:
 
     Attributes:
         api_key (str): FMP API key.
+        retry_count (int): Number of retried requests.
+        failure_count (int): Number of requests that failed after all retries.
     """
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, pool_size: int = FMP_POOL_SIZE, max_retries: int = FMP_MAX_RETRIES,
+                 backoff_base: float = FMP_BACKOFF_BASE, backoff_max: float = FMP_BACKOFF_MAX,
+                 timeout: float = FMP_REQUEST_TIMEOUT, use_response_cache: bool = FMP_RESPONSE_CACHE_ENABLED,
+                 force_refresh: bool = FMP_FORCE_REFRESH, adaptive_concurrency: bool = ADAPTIVE_CONCURRENCY_ENABLED,
+                 base_url: str = FMP_BASE_URL, record_dir: str = FMP_RECORD_DIR,
+                 calls_per_minute: int = FMP_CALLS_PER_MINUTE):
         """
         Initializes the FmpDataLoader with the given API key.
 
         Parameters:
             api_key (str): FMP API key.
+            pool_size (int): Number of keep-alive connections kept in the pool.
+            max_retries (int): Number of retries for 429/5xx responses and connection errors.
+            backoff_base (float): Base delay in seconds for exponential backoff.
+            backoff_max (float): Maximum delay in seconds between retries.
+            timeout (float): Request timeout in seconds.
+            use_response_cache (bool): Serve responses from the on-disk response cache when fresh.
+            force_refresh (bool): Bypass cached responses and refetch everything (results are still cached).
+            adaptive_concurrency (bool): Limit in-flight requests with an AdaptiveConcurrencyLimiter.
+            base_url (str): API base URL, e.g. a local stand-in server for offline runs.
+            record_dir (str): If set, every request goes to the API, bypassing the response cache, and
+                successful responses are stored there as fixture files.
+            calls_per_minute (int): Plan quota. Every request attempt, including retries, takes a token from a
+                bucket shared by all loaders of the API key. Cache hits take none.
         """
         self._api_key = api_key
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.base_url = base_url.rstrip("/")
+        self.record_dir = record_dir
+        self.force_refresh = force_refresh
+        self.response_cache = ResponseCache(base_url=self.base_url) if use_response_cache else None
+        self._revalidating = set()
+        self._revalidation_executor = None
+        # Optional RequestCoalescer shared within a run, see pipelines.run_context.RunContext
+        self.request_coalescer = None
+        self.rate_limiter = get_shared_token_bucket(api_key, calls_per_minute, burst=pool_size)
+        self.concurrency_limiter = None
+        if adaptive_concurrency:
+            self.concurrency_limiter = AdaptiveConcurrencyLimiter(initial_limit=ADAPTIVE_CONCURRENCY_INITIAL,
+                                                                  max_limit=ADAPTIVE_CONCURRENCY_MAX)
+
+        # Shared keep-alive session; retries are handled in _get
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        self._stats_lock = threading.Lock()
+        self.request_count = 0
+        self.retry_count = 0
+        self.failure_count = 0
+
+    def _increment(self, counter: str):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get_request_stats(self) -> dict:
+        """
+        Returns the request, retry and failure counters.
+        """
+        with self._stats_lock:
+            return {
+                'requests': self.request_count,
+                'retries': self.retry_count,
+                'failures': self.failure_count
+            }
+
+    def _get_retry_delay(self, attempt: int, response=None) -> float:
+        # Respect Retry-After if the server sent one (seconds or HTTP date)
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return min(self.backoff_max, max(0.0, float(retry_after)))
+                except ValueError:
+                    try:
+                        retry_date = parsedate_to_datetime(retry_after)
+                        delay = (retry_date - datetime.now(timezone.utc)).total_seconds()
+                        return min(self.backoff_max, max(0.0, delay))
+                    except (TypeError, ValueError):
+                        pass
+
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _get(self, url: str, params: dict = None):
+        """
+        Sends a GET request through the shared session, retrying 429/5xx responses
+        and connection errors with jittered exponential backoff.
+
+        Returns:
+            requests.Response: Last response received or None if the request never completed.
+        """
+        response = None
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                self._increment('retry_count')
+                time.sleep(self._get_retry_delay(attempt - 1, response))
+            if self.concurrency_limiter is not None:
+                try:
+                    probe = self.concurrency_limiter.acquire()
+                except CircuitOpenError as ex:
+                    print(f"Request skipped: {ex}")
+                    response = None
+                    break
+            self.rate_limiter.acquire()
+            self._increment('request_count')
+            start_time = time.monotonic()
+            try:
+                response = self._session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                print(f"Request error: {ex}")
+                response = None
+                continue
+            finally:
+                if self.concurrency_limiter is not None:
+                    succeeded = response is not None and response.status_code not in RETRYABLE_STATUS_CODES
+                    self.concurrency_limiter.release(time.monotonic() - start_time, succeeded, probe)
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                break
+
+        if response is None or response.status_code != 200:
+            self._increment('failure_count')
+        return response
+
+    def _request_json(self, endpoint: str, path: str, params: dict, raise_errors=False):
+        url = f"{self.base_url}/{path}"
+        start = time.perf_counter()
+        response = self._get(url, params={**params, "apikey": self._api_key})
+        metrics.observe_latency(endpoint, time.perf_counter() - start)
+        if response is None or response.status_code != 200:
+            reason = response.reason if response is not None else "no response"
+            if raise_errors:
+                raise FmpRequestError(f"Failed to fetch {path}. Error: {reason}")
+            print(f"Failed to fetch {endpoint} data. Error: {reason}")
+            return None
+        with metrics.stage("parse"):
+            payload = response.json()
+        metrics.increment("fmp_response_bytes", len(response.content))
+        if isinstance(payload, list):
+            metrics.increment("fmp_response_rows", len(payload))
+        # Only cache actual results, not empty lists or error messages
+        if self.response_cache is not None and isinstance(payload, list) and payload:
+            self.response_cache.store(endpoint, path, params, payload)
+        if self.record_dir and isinstance(payload, list) and payload:
+            self._record_fixture(path, params, payload)
+        return payload
+
+    def _record_fixture(self, path: str, params: dict, payload):
+        try:
+            fixture_path = get_fixture_path(self.record_dir, path, params)
+        except ValueError as ex:
+            logw(f"Not recording fixture: {ex}")
+            return
+        os.makedirs(os.path.dirname(fixture_path), exist_ok=True)
+        tmp_path = f"{fixture_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, fixture_path)
+
+    def _schedule_revalidation(self, endpoint: str, path: str, params: dict):
+        key = self.response_cache.make_key(endpoint, path, params)
+        with self._stats_lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+            if self._revalidation_executor is None:
+                self._revalidation_executor = ThreadPoolExecutor(max_workers=2)
+
+        def revalidate():
+            try:
+                self._request_json(endpoint, path, params)
+            finally:
+                with self._stats_lock:
+                    self._revalidating.discard(key)
+
+        self._revalidation_executor.submit(revalidate)
+
+    def _fetch_json(self, endpoint: str, path: str, params: dict = None, raise_errors=False):
+        """
+        Fetches a JSON payload, serving it from the response cache when possible.
+        Stale entries are returned immediately and refreshed in the background. Expired entries of
+        FMP_EXPIRED_FALLBACK_ENDPOINTS are returned when the request fails.
+
+        Parameters:
+            endpoint (str): Endpoint name used for the cache TTL lookup, e.g. 'earnings-surprises'.
+            path (str): Path relative to the base URL.
+            params (dict): Query parameters without the API key.
+            raise_errors (bool): Raise FmpRequestError instead of returning None when the request fails.
+
+        Returns:
+            Parsed JSON payload or None if the request failed.
+        """
+        params = dict(params or {})
+        if self.request_coalescer is not None:
+            # The shared fetch always raises, so each merged caller gets the failure in its own form
+            try:
+                return self.request_coalescer.get_or_fetch(
+                    make_request_key(endpoint, path, params, base_url=self.base_url),
+                    lambda: self._fetch_json_uncoalesced(endpoint, path, params, raise_errors=True))
+            except FmpRequestError as ex:
+                if raise_errors:
+                    raise
+                print(ex)
+                return None
+        return self._fetch_json_uncoalesced(endpoint, path, params, raise_errors)
+
+    def _fetch_json_uncoalesced(self, endpoint: str, path: str, params: dict, raise_errors=False):
+        cached_payload, state = None, CacheState.MISS
+        # Record runs fetch everything, so the fixtures cover every request
+        if self.response_cache is not None and not self.record_dir:
+            cached_payload, state = self.response_cache.lookup(endpoint, path, params,
+                                                               force_refresh=self.force_refresh)
+            if state == CacheState.FRESH:
+                return cached_payload
+            if state == CacheState.STALE:
+                self._schedule_revalidation(endpoint, path, params)
+                return cached_payload
+
+        # Better an old response than a hole in the reference data
+        use_expired = state == CacheState.EXPIRED and endpoint in FMP_EXPIRED_FALLBACK_ENDPOINTS
+        try:
+            payload = self._request_json(endpoint, path, params, raise_errors=raise_errors)
+        except FmpRequestError:
+            if use_expired:
+                return cached_payload
+            raise
+        if payload is None and use_expired:
+            return cached_payload
+        return payload
+
+    def log_limiter_metrics(self, timeline_path=None):
+        """
+        Logs the adaptive limiter metrics and optionally writes its state over time to a CSV file.
+        """
+        if self.concurrency_limiter is None:
+            return
+        logi(f"Adaptive limiter: {self.concurrency_limiter.get_metrics()}")
+        if timeline_path:
+            self.concurrency_limiter.export_timeline(timeline_path)
+
+    def log_cache_stats(self):
+        """
+        Logs response cache hit/miss statistics for the current run.
+        """
+        if self.response_cache is not None:
+            self.response_cache.log_stats()
 
     def fetch_stock_screener_results(
         self,
@@ -91,7 +361,6 @@ class FmpDataLoader:
                 return securities_df
 
             # Load data remotely
-            url = "https://financialmodelingprep.com/api/v3/stock-screener?"
             params = {
                 "exchange": exchange_list,
                 "limit": limit,
@@ -111,34 +380,29 @@ class FmpDataLoader:
                 "sector": sector,
                 "industry": industry,
                 "country": country,
-                "exchange": exchange,
-                "apikey": self._api_key
+                "exchange": exchange
             }
 
             # Filter out parameters that are None
             params = {k: v for k, v in params.items() if v is not None}
 
-            response = requests.get(url, params=params)
-
-            if response.status_code == 200:
-                securities_data = response.json()
-                if securities_data:
-                    securities_df = pd.DataFrame(securities_data)
+            securities_data = self._fetch_json("stock-screener", "stock-screener", params)
+            if securities_data:
+                securities_df = pd.DataFrame(securities_data)
 
-                    # Cache locally if requested
-                    if cache_data:
-                        os.makedirs(cache_dir, exist_ok=True)
-                        securities_df.to_csv(path, index=False)
+                # Cache locally if requested
+                if cache_data:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    securities_df.to_csv(path, index=False)
 
-                    return securities_df
-                return None
-            else:
-                return None
+                return securities_df
+            return None
         except Exception as ex:
             print(ex)
             return None
 
-    def fetch_analyst_estimates(self, symbol: str, period: Period, limit: int) -> Union[pd.DataFrame, None]:
+    def fetch_analyst_estimates(self, symbol: str, period: Period, limit: int,
+                                raise_errors: bool = False) -> Union[pd.DataFrame, None]:
         """
         Fetches analyst estimates data from the FMP API.
 
@@ -146,25 +410,24 @@ class FmpDataLoader:
             symbol (str): Stock symbol.
             period (Period): Period for the estimates, either Period.QUARTERLY or Period.ANNUAL.
             limit (int): Number of records to fetch.
-            api_key (str): Your FMP API key.
+            raise_errors (bool): Raise FmpRequestError when the request fails instead of returning None.
 
         Returns:
             pd.DataFrame: DataFrame with analyst estimates data or None if the request fails.
         """
         try:
-            url = f"https://financialmodelingprep.com/api/v3/analyst-estimates/{symbol}?period={period.value}&limit={limit}&apikey={self._api_key}"
-            response = requests.get(url)
-            if response.status_code == 200:
-                data = response.json()
-                if data:
-                    estimates_df = pd.DataFrame(data)
-                    return estimates_df
-                else:
-                    print(f"No data found for {symbol}.")
-                    return None
+            data = self._fetch_json("analyst-estimates", f"analyst-estimates/{symbol}",
+                                    {"period": period.value, "limit": limit}, raise_errors=raise_errors)
+            if data is None:
+                return None
+            if data:
+                estimates_df = pd.DataFrame(data)
+                return estimates_df
             else:
-                print(f"Failed to fetch analyst estimates. Error: {response.reason}")
+                print(f"No data found for {symbol}.")
                 return None
+        except FmpRequestError:
+            raise
         except Exception as ex:
             print(ex)
             return None
@@ -180,23 +443,19 @@ class FmpDataLoader:
             pd.DataFrame: DataFrame with earnings surprises data or None if the request fails.
         """
         try:
-            url = f"https://financialmodelingprep.com/api/v3/earnings-surprises/{symbol}?apikey={self._api_key}"
-            response = requests.get(url)
-            if response.status_code == 200:
-                data = response.json()
-                if data:
-                    surprises_df = pd.DataFrame(data)
-                    if len(surprises_df) > 0:
-                        # Convert date to pd format
-                        surprises_df['date'] = pd.to_datetime(surprises_df['date'])
-                        # Sort by date
-                        surprises_df.sort_values(by="date", ascending=True)
-                    return surprises_df
-                else:
-                    print(f"No data found for {symbol}.")
-                    return None
+            data = self._fetch_json("earnings-surprises", f"earnings-surprises/{symbol}")
+            if data is None:
+                return None
+            if data:
+                surprises_df = pd.DataFrame(data)
+                if len(surprises_df) > 0:
+                    # Convert date to pd format
+                    surprises_df['date'] = pd.to_datetime(surprises_df['date'])
+                    # Sort by date
+                    surprises_df.sort_values(by="date", ascending=True)
+                return surprises_df
             else:
-                print(f"Failed to fetch earnings surprises. Error: {response.reason}")
+                print(f"No data found for {symbol}.")
                 return None
         except Exception as ex:
             print(ex)
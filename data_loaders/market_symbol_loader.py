@@ -1,6 +1,13 @@
+import json
 import os
+import time
 import pandas as pd
+import requests
+from datetime import datetime
 from enum import Enum
+from io import StringIO
+from config import *
+from utils.log_utils import *
 
 
 class MarketIndex(Enum):
@@ -15,6 +22,17 @@ class MarketIndex(Enum):
     UNKNOWN = 'UNKNOWN'
 
 
+# Default cache file of each index, used to find its membership change history
+INDEX_CACHE_FILE_NAMES = {
+    MarketIndex.NASDAQ_100: "nasdaq100_symbols.csv",
+    MarketIndex.SNP_500: "sp500_symbols.csv",
+    MarketIndex.DJI: "dji_symbols.csv",
+    MarketIndex.RUSSELL_1000: "russell1000_symbols.csv",
+    MarketIndex.RUSSELL_2000: "russell2000_symbols.csv",
+}
+MEMBERSHIP_CHANGE_COLUMNS = ['date', 'symbol', 'change']
+
+
 class MarketSymbolLoader:
     """
     MarketSymbolLoader provides the ability to load a list of stock symbols for different market indexes
@@ -100,28 +118,119 @@ class MarketSymbolLoader:
         wiki_url = 'https://en.wikipedia.org/wiki/Russell_2000_Index'
         return self._fetch_symbols(wiki_url, 2, cache_file, cache_dir, file_name, 'Symbol')
 
-    def _fetch_symbols(self, url, table_index, cache_file, cache_dir, file_name, ticker_column):
+    @staticmethod
+    def _parse_table(html, table_index):
+        """
+        Parses only the table at table_index. Tables are counted like pd.read_html does (tables
+        without any non-blank text are skipped), but only the selected one is converted to a DataFrame.
+        """
+        # Only needed when the symbol cache is refreshed
+        import lxml.html
+        document = lxml.html.fromstring(html)
+        tables = document.xpath("//table[.//text()[re:test(., '\\S')]]",
+                                namespaces={"re": "http://exslt.org/regular-expressions"})
+        table_html = lxml.html.tostring(tables[table_index], encoding="unicode")
+        return pd.read_html(StringIO(table_html))[0]
+
+    @staticmethod
+    def _load_meta(meta_path):
+        if not os.path.exists(meta_path):
+            return {}
+        with open(meta_path, "r") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _save_meta(meta_path, meta):
+        with open(f"{meta_path}.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    @staticmethod
+    def _get_history_path(cache_path):
+        return f"{os.path.splitext(cache_path)[0]}_changes.csv"
+
+    def _record_membership_changes(self, cached_df, symbols_df, history_path):
+        """
+        Appends the symbols added to and removed from the index since the cached list to the change history.
+        """
+        cached_symbols = set(cached_df['symbol'].astype(str))
+        symbols = set(symbols_df['symbol'].astype(str))
+        today = datetime.now().strftime("%Y-%m-%d")
+        changes_df = pd.DataFrame(
+            [{'date': today, 'symbol': symbol, 'change': 'added'} for symbol in sorted(symbols - cached_symbols)] +
+            [{'date': today, 'symbol': symbol, 'change': 'removed'} for symbol in sorted(cached_symbols - symbols)],
+            columns=MEMBERSHIP_CHANGE_COLUMNS)
+        if changes_df.empty:
+            return
+        changes_df.to_csv(history_path, mode='a', header=not os.path.exists(history_path), index=False)
+        logi(f"Index membership changed: {len(symbols - cached_symbols)} added, "
+             f"{len(cached_symbols - symbols)} removed")
+
+    def _fetch_symbols(self, url, table_index, cache_file, cache_dir, file_name, ticker_column,
+                       ttl=SYMBOL_CACHE_TTL):
+        cache_path = os.path.join(cache_dir, file_name)
+        meta_path = f"{cache_path}.meta.json"
+        cached_df = None
+        meta = {}
         try:
-            cache_path = os.path.join(cache_dir, file_name)
-            # Create cache dir if needed
-            if cache_file and not os.path.exists(cache_path):
+            if cache_file:
                 os.makedirs(cache_dir, exist_ok=True)
+                if os.path.exists(cache_path):
+                    cached_df = pd.read_csv(cache_path)
+                    meta = self._load_meta(meta_path)
+                    # Use the cached list until it is older than the TTL
+                    if time.time() - meta.get('validated_at', 0) < ttl:
+                        return cached_df
+
+            # Re-validate with a conditional request, so an unchanged page is not downloaded again
+            headers = {'User-Agent': SYMBOL_LOADER_USER_AGENT}
+            if cached_df is not None and meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if cached_df is not None and meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+            response = requests.get(url, headers=headers, timeout=30)
+            if response.status_code == 304 and cached_df is not None:
+                meta['validated_at'] = time.time()
+                self._save_meta(meta_path, meta)
+                return cached_df
+            response.raise_for_status()
 
-            # Try to load file from cache
-            if os.path.exists(cache_path) and cache_file:
-                symbols_df = pd.read_csv(cache_path)
-                return symbols_df
-            else:
-                table = pd.read_html(url)
-                symbols_df = table[table_index]
-                symbols_df.rename(columns={ticker_column: "symbol"}, inplace=True)
-                # Cache file
-                if cache_file:
-                    symbols_df.to_csv(cache_path, index=False)
-                return symbols_df
+            symbols_df = self._parse_table(response.text, table_index)
+            symbols_df.rename(columns={ticker_column: "symbol"}, inplace=True)
+            # Cache file
+            if cache_file:
+                if cached_df is not None:
+                    self._record_membership_changes(cached_df, symbols_df, self._get_history_path(cache_path))
+                symbols_df.to_csv(f"{cache_path}.tmp", index=False)
+                os.replace(f"{cache_path}.tmp", cache_path)
+                self._save_meta(meta_path, {'validated_at': time.time(), 'etag': response.headers.get('ETag'),
+                                            'last_modified': response.headers.get('Last-Modified')})
+            return symbols_df
         except Exception as e:
             print(f"Failed to fetch symbols from {url}, error: {str(e)}")
-            return None
+            if cached_df is not None:
+                logw(f"Using cached symbols from {cache_path}")
+            return cached_df
+
+    def get_membership_changes(self, market_index: MarketIndex, since=None, cache_dir="cache"):
+        """
+        Returns the dated additions to and removals from an index recorded when its cached list was refreshed.
+
+        Parameters:
+            market_index (MarketIndex): The market index.
+            since (datetime): Only return changes on or after this date.
+            cache_dir (str): Cache directory.
+
+        Returns:
+            DataFrame: columns 'date', 'symbol' and 'change' ("added" or "removed").
+        """
+        history_path = self._get_history_path(os.path.join(cache_dir, INDEX_CACHE_FILE_NAMES[market_index]))
+        if not os.path.exists(history_path):
+            return pd.DataFrame(columns=MEMBERSHIP_CHANGE_COLUMNS)
+        changes_df = pd.read_csv(history_path, parse_dates=['date'])
+        if since is not None:
+            changes_df = changes_df[changes_df['date'] >= pd.Timestamp(since).normalize()]
+        return changes_df.reset_index(drop=True)
 
     def fetch_symbols(self, market_index: MarketIndex, cache_file=False, cache_dir="cache"):
         """
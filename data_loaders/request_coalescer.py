@@ -0,0 +1,80 @@
+import threading
+from collections import OrderedDict
+
+
+class _InFlightRequest:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RequestCoalescer:
+    """
+    In-memory LRU of responses that also merges concurrent identical requests.
+
+    The first caller of a key runs the fetch; callers asking for the same key while it is in flight
+    wait for that result instead of sending their own request. Successful (non-None) results are kept
+    in the LRU so the key is never fetched twice while the coalescer lives.
+
+    Attributes:
+        max_size (int): Maximum number of responses kept.
+        hit_count (int): Requests served from the LRU.
+        merged_count (int): Requests merged into an in-flight fetch.
+        fetch_count (int): Requests actually fetched.
+    """
+
+    def __init__(self, max_size=2048):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._responses = OrderedDict()
+        self._in_flight = {}
+        self.hit_count = 0
+        self.merged_count = 0
+        self.fetch_count = 0
+
+    def get_or_fetch(self, key, fetch_function):
+        """
+        Returns the response of key, calling fetch_function() only if no response is cached or in flight.
+        Exceptions raised by the fetch are raised in every merged caller.
+        """
+        with self._lock:
+            if key in self._responses:
+                self._responses.move_to_end(key)
+                self.hit_count += 1
+                return self._responses[key]
+            request = self._in_flight.get(key)
+            if request is not None:
+                self.merged_count += 1
+                is_owner = False
+            else:
+                request = _InFlightRequest()
+                self._in_flight[key] = request
+                self.fetch_count += 1
+                is_owner = True
+
+        if not is_owner:
+            request.event.wait()
+            if request.error is not None:
+                raise request.error
+            return request.result
+
+        try:
+            request.result = fetch_function()
+        except Exception as ex:
+            request.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if request.error is None and request.result is not None:
+                    self._responses[key] = request.result
+                    while len(self._responses) > self.max_size:
+                        self._responses.popitem(last=False)
+            request.event.set()
+        return request.result
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {'fetches': self.fetch_count, 'hits': self.hit_count, 'merged': self.merged_count,
+                    'cached': len(self._responses)}
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from config import *
+from utils.log_utils import *
+
+
+def make_request_key(endpoint: str, path: str, params: dict = None, excluded_params=("apikey",), base_url=None) -> str:
+    """
+    Returns a stable hash of an FMP request without the API key. The base URL is part of the key,
+    so responses of a stand-in server never answer requests to the real API and vice versa.
+    """
+    params = {k: v for k, v in (params or {}).items() if k not in excluded_params and v is not None}
+    key_source = json.dumps({'endpoint': endpoint, 'path': path, 'params': params, 'base_url': base_url},
+                            sort_keys=True, default=str)
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+class CacheState:
+    FRESH = "fresh"
+    STALE = "stale"
+    EXPIRED = "expired"
+    MISS = "miss"
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache for FMP JSON responses.
+
+    Entries are keyed by base URL, endpoint and request parameters (without the API key) and expire
+    after a per-endpoint time to live. Expired entries can still be served for a stale window
+    while the caller refreshes them.
+
+    Attributes:
+        cache_dir (str): Directory holding the cached responses.
+        base_url (str): API base URL the cached responses come from.
+        ttls (dict): Time to live in seconds per endpoint.
+        stale_ttls (dict): Stale window in seconds per endpoint.
+    """
+
+    # Parameters never included in the cache key
+    EXCLUDED_PARAMS = {"apikey"}
+
+    def __init__(self, cache_dir=FMP_RESPONSE_CACHE_DIR, ttls=None, stale_ttls=None, default_ttl=60 * 60,
+                 base_url=FMP_BASE_URL):
+        self.cache_dir = cache_dir
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.ttls = FMP_RESPONSE_CACHE_TTLS if ttls is None else ttls
+        self.stale_ttls = FMP_RESPONSE_CACHE_STALE_TTLS if stale_ttls is None else stale_ttls
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self.stats = {CacheState.FRESH: 0, CacheState.STALE: 0, CacheState.EXPIRED: 0, CacheState.MISS: 0,
+                      'stores': 0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, endpoint: str, path: str, params: dict = None) -> str:
+        return make_request_key(endpoint, path, params, self.EXCLUDED_PARAMS, self.base_url)
+
+    def _get_path(self, key: str) -> str:
+        # Two-level fan-out keeps directories small for large universes
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _count(self, state: str):
+        with self._lock:
+            self.stats[state] += 1
+
+    def lookup(self, endpoint: str, path: str, params: dict = None, force_refresh=False):
+        """
+        Looks up a cached response.
+
+        Returns:
+            tuple: (payload, state) where state is one of CacheState. payload is None on a miss.
+        """
+        cache_path = self._get_path(self.make_key(endpoint, path, params))
+        if force_refresh or not os.path.exists(cache_path):
+            self._count(CacheState.MISS)
+            return None, CacheState.MISS
+        try:
+            with open(cache_path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._count(CacheState.MISS)
+            return None, CacheState.MISS
+
+        age = time.time() - entry.get('fetched_at', 0)
+        ttl = self.ttls.get(endpoint, self.default_ttl)
+        if age <= ttl:
+            state = CacheState.FRESH
+        elif age <= ttl + self.stale_ttls.get(endpoint, 0):
+            state = CacheState.STALE
+        else:
+            state = CacheState.EXPIRED
+        self._count(state)
+        return entry.get('payload'), state
+
+    def store(self, endpoint: str, path: str, params: dict, payload):
+        """
+        Stores a response payload. The file is written atomically so concurrent readers never see partial entries.
+        """
+        cache_path = self._get_path(self.make_key(endpoint, path, params))
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({'endpoint': endpoint, 'path': path, 'fetched_at': time.time(), 'payload': payload}, f)
+        os.replace(tmp_path, cache_path)
+        self._count('stores')
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats[CacheState.FRESH] + stats[CacheState.STALE] + stats[CacheState.EXPIRED] + stats[CacheState.MISS]
+        stats['hit_ratio'] = round((stats[CacheState.FRESH] + stats[CacheState.STALE]) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def log_stats(self):
+        stats = self.get_stats()
+        saved_calls = stats[CacheState.FRESH] + stats[CacheState.STALE]
+        logi(f"Response cache: {saved_calls} API calls saved, {stats[CacheState.MISS]} misses, "
+             f"{stats[CacheState.EXPIRED]} expired, {stats[CacheState.STALE]} served stale, "
+             f"hit ratio {stats['hit_ratio']}")
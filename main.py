@@ -3,47 +3,111 @@ from utils.file_utils import get_os_variable
 from utils.log_utils import *
 from trackers.estimate_tracker import EstimateTracker
 from analysis_tools.earnings_estimate_revision_calculator import EarningsEstimateRevisionCalculator
-import schedule
-import time
+from analysis_tools.revision_backtester import RevisionBacktester
+from pipelines.streaming_pipeline import StreamingRevisionPipeline
+from pipelines.run_context import RunContext
+from pipelines.multi_universe_run import MultiUniverseRun
+from data_loaders.market_symbol_loader import MarketIndex
+from utils.metrics_utils import metrics, profile_run, start_prometheus_server
+from utils.job_scheduler import JobScheduler
+from storage.estimate_store_factory import create_estimate_store
+from storage.memmap_column_store import MemmapColumnStore
 
 
 # Get API key from environment variables
 FMP_API_KEY = get_os_variable('FMP_API_KEY')
 
 
+class ScheduledRun:
+    """
+    One tracking and scoring run, split in a track and a score step so they can be scheduled as
+    separate jobs. The streaming pipeline fetches and scores in one pass, so it runs in the track step.
+    """
+
+    def __init__(self):
+        self.market_indexes = [MarketIndex(market_index) for market_index in MARKET_INDEXES]
+        self.run_context = RunContext(FMP_API_KEY, self.market_indexes[0])
+        self.multi_universe_run = None
+        self.universes = None
+        self.symbol_list = None
+
+    def track(self):
+        if len(self.market_indexes) > 1:
+            self.multi_universe_run = MultiUniverseRun(FMP_API_KEY, self.market_indexes, run_context=self.run_context)
+            self.universes = self.multi_universe_run.track()
+        elif PIPELINE_MODE == "streaming":
+            pipeline = StreamingRevisionPipeline(FMP_API_KEY, run_context=self.run_context)
+            pipeline.run()
+        else:
+            self.symbol_list = self.run_context.get_symbol_list()
+            tracker = self.run_context.create_tracker()
+            tracker.track_estimates(symbol_list=self.symbol_list)
+
+    def score(self):
+        if self.multi_universe_run is not None:
+            self.multi_universe_run.score(self.universes)
+        elif self.symbol_list is not None:
+            revision_calculator = self.run_context.create_calculator()
+            revision_calculator.calculate_earnings_estimate_revisions(symbol_list=self.symbol_list)
+        self.run_context.log_stats()
+
+
 def perform_tasks():
-    tracker = EstimateTracker(FMP_API_KEY)
-    tracker.track_estimates()
+    metrics.reset()
+    with profile_run(PROFILE_RUN):
+        scheduled_run = ScheduledRun()
+        scheduled_run.track()
+        scheduled_run.score()
+    if METRICS_ENABLED:
+        logi(f"Run metrics stored to: {metrics.write_json()}")
+
+
+def build_column_store():
+    with metrics.stage("column_store_build"):
+        MemmapColumnStore().build_from_store(create_estimate_store())
 
-    revision_calculator = EarningsEstimateRevisionCalculator(FMP_API_KEY)
-    revision_calculator.calculate_earnings_estimate_revisions()
 
 def run_estimate_revision_calculator():
     revision_calculator = EarningsEstimateRevisionCalculator(FMP_API_KEY)
     revision_calculator.calculate_earnings_estimate_revisions()
 
 
-def schedule_events():
-    schedule.every().monday.at('01:30').do(perform_tasks)
-    schedule.every().tuesday.at('01:30').do(perform_tasks)
-    schedule.every().wednesday.at('01:30').do(perform_tasks)
-    schedule.every().thursday.at('01:30').do(perform_tasks)
-    schedule.every().friday.at('01:30').do(perform_tasks)
+def run_estimate_revision_backtest(start_date=None, end_date=None):
+    backtester = RevisionBacktester(FMP_API_KEY)
+    backtester.run_backtest(start_date, end_date)
 
 
-if __name__ == "__main__":
-    create_output_directories()
-    setup_logger("estimate_revision_model_log.txt")
+def schedule_events() -> JobScheduler:
+    scheduler = JobScheduler()
+    scheduled_runs = []
 
-    run_estimate_revision_calculator()
+    def track_job():
+        metrics.reset()
+        scheduled_runs[:] = [ScheduledRun()]
+        with profile_run(PROFILE_RUN):
+            scheduled_runs[0].track()
 
-    #  Schedule events - to run the script at regular intervals
-    schedule_events()
+    def score_job():
+        with profile_run(PROFILE_RUN):
+            scheduled_runs[0].score()
+        if METRICS_ENABLED:
+            logi(f"Run metrics stored to: {metrics.write_json()}")
 
-    #  Check schedule
-    while True:
-        schedule.run_pending()
-        time.sleep(60)  # Check time every x seconds
+    scheduler.add_job("track", track_job, weekdays=JOB_SCHEDULE_WEEKDAYS, at=JOB_SCHEDULE_TIME)
+    scheduler.add_job("score", score_job, depends_on=["track"])
+    if MEMMAP_COLUMN_STORE_ENABLED:
+        scheduler.add_job("column_store", build_column_store, depends_on=["track"])
+    return scheduler
 
 
+if __name__ == "__main__":
+    create_output_directories()
+    setup_logger("estimate_revision_model_log.txt")
+    if METRICS_PROMETHEUS_PORT:
+        start_prometheus_server(METRICS_PROMETHEUS_PORT, host=METRICS_PROMETHEUS_HOST)
+
+    run_estimate_revision_calculator()
 
+    #  Schedule events - sleeps until the next run is due
+    scheduler = schedule_events()
+    scheduler.run_forever()
@@ -0,0 +1,88 @@
+from config import *
+from utils.log_utils import *
+from data_loaders.market_symbol_loader import MarketIndex
+from pipelines.run_context import RunContext
+
+
+class MultiUniverseRun:
+    """
+    Tracks and scores several market indexes in one run.
+
+    The union of the index constituents is fetched once into the shared tracking history and
+    scored once, so the fetch cost scales with the number of unique symbols. Normalization is
+    cross-sectional, so each index then gets its own ranking of its constituents, stored as
+    earnings_revision_results_<index>.csv.
+
+    Attributes:
+        market_indexes (list): MarketIndex values of the universes.
+    """
+
+    def __init__(self, fmp_api_key, market_indexes=None, run_context=None):
+        self.market_indexes = [MarketIndex(market_index) for market_index in (market_indexes or MARKET_INDEXES)]
+        self.run_context = run_context or RunContext(fmp_api_key, self.market_indexes[0])
+
+    def get_universes(self) -> dict:
+        """
+        Returns the symbol list of each index. Indexes whose symbols cannot be loaded are left out.
+        """
+        universes = {}
+        for market_index in self.market_indexes:
+            symbols_df = self.run_context.get_symbols_df(market_index)
+            if symbols_df is None or symbols_df.empty:
+                loge(f"No symbols for {market_index.value} - skipping it")
+                continue
+            universes[market_index] = list(symbols_df['symbol'].unique())
+        return universes
+
+    @staticmethod
+    def get_results_file_name(market_index: MarketIndex) -> str:
+        return f"earnings_revision_results_{market_index.value.lower()}.csv"
+
+    def track(self) -> dict:
+        """
+        Fetches the union of the index constituents into the tracking history.
+
+        Returns:
+            dict: symbol list per MarketIndex, empty if no index could be loaded.
+        """
+        logi(f"Running multi-universe estimate revisions for {[index.value for index in self.market_indexes]}...")
+        universes = self.get_universes()
+        if not universes:
+            return universes
+
+        symbol_list = self.get_symbol_union(universes)
+        index_size_sum = sum(len(symbols) for symbols in universes.values())
+        logi(f"{len(symbol_list)} unique symbols across indexes with {index_size_sum} constituents in total")
+
+        tracker = self.run_context.create_tracker()
+        for market_index in universes:
+            if market_index != tracker.market_index:
+                tracker.log_membership_changes(market_index=market_index)
+        tracker.track_estimates(symbol_list=symbol_list)
+        return universes
+
+    @staticmethod
+    def get_symbol_union(universes: dict) -> list:
+        # Union in first-seen order, so the tracking file keeps a stable symbol order
+        return list(dict.fromkeys(symbol for symbols in universes.values() for symbol in symbols))
+
+    def score(self, universes=None):
+        """
+        Scores the union of the constituents once and stores a ranking per index.
+        """
+        universes = self.get_universes() if universes is None else universes
+        if not universes:
+            return
+        calculator = self.run_context.create_calculator()
+        results_df = calculator.score_symbols(self.get_symbol_union(universes))
+        if results_df is None:
+            return
+        for market_index, index_symbols in universes.items():
+            index_results_df = results_df[results_df['symbol'].isin(index_symbols)].reset_index(drop=True)
+            calculator.store_ranked_results(index_results_df, self.get_results_file_name(market_index))
+            logi(f"Ranked {len(index_results_df)} symbols for {market_index.value}")
+        self.run_context.fmp_data_loader.log_cache_stats()
+
+    def run(self):
+        universes = self.track()
+        self.score(universes)
@@ -0,0 +1,62 @@
+from config import *
+from utils.log_utils import *
+from data_loaders.fmp_data_loader import FmpDataLoader
+from data_loaders.market_symbol_loader import MarketSymbolLoader, MarketIndex
+from data_loaders.request_coalescer import RequestCoalescer
+from utils.metrics_utils import metrics
+from utils.normalization_utils import get_symbol_groups
+from trackers.estimate_tracker import EstimateTracker
+from analysis_tools.earnings_estimate_revision_calculator import EarningsEstimateRevisionCalculator
+
+
+class RunContext:
+    """
+    Shared resources of one scheduled run.
+
+    Owns a single FmpDataLoader whose requests go through an in-memory RequestCoalescer, and the
+    symbol universe, which is loaded once. Components created through the context share both, so no
+    endpoint and symbol is fetched twice in a run, even with concurrent fetches.
+
+    Attributes:
+        fmp_data_loader (FmpDataLoader): Loader shared by all components.
+        market_index (MarketIndex): Index defining the symbol universe.
+    """
+
+    def __init__(self, fmp_api_key, market_index=MarketIndex.SNP_500, lru_size=RUN_CONTEXT_LRU_SIZE):
+        self.fmp_api_key = fmp_api_key
+        self.market_index = market_index
+        self.fmp_data_loader = FmpDataLoader(fmp_api_key)
+        self.fmp_data_loader.request_coalescer = RequestCoalescer(lru_size)
+        self.market_symbol_loader = MarketSymbolLoader()
+        self._symbols_dfs = {}
+
+    def get_symbols_df(self, market_index=None):
+        market_index = market_index or self.market_index
+        if market_index not in self._symbols_dfs:
+            with metrics.stage("symbol_load"):
+                self._symbols_dfs[market_index] = self.market_symbol_loader.fetch_symbols(
+                    market_index, cache_file=True, cache_dir=CACHE_DIR)
+        return self._symbols_dfs[market_index]
+
+    def get_symbol_list(self, market_index=None) -> list:
+        return list(self.get_symbols_df(market_index)['symbol'].unique())
+
+    def create_tracker(self, **kwargs) -> EstimateTracker:
+        return EstimateTracker(self.fmp_api_key, fmp_data_loader=self.fmp_data_loader, market_index=self.market_index,
+                               **kwargs)
+
+    def get_symbol_groups(self) -> dict:
+        """
+        Returns the NORMALIZATION_GROUP_COLUMN group of each symbol of the loaded universes.
+        """
+        symbol_groups = {}
+        for symbols_df in self._symbols_dfs.values():
+            symbol_groups.update(get_symbol_groups(symbols_df))
+        return symbol_groups
+
+    def create_calculator(self) -> EarningsEstimateRevisionCalculator:
+        return EarningsEstimateRevisionCalculator(self.fmp_api_key, fmp_data_loader=self.fmp_data_loader,
+                                                  symbol_groups=self.get_symbol_groups())
+
+    def log_stats(self):
+        logi(f"Run context requests: {self.fmp_data_loader.request_coalescer.get_stats()}")
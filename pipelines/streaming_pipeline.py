@@ -0,0 +1,128 @@
+import queue
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from config import *
+from utils.log_utils import *
+from utils.file_utils import *
+from utils.metrics_utils import metrics
+from utils.normalization_utils import get_symbol_groups
+from trackers.estimate_tracker import EstimateTracker, TrackingRunError
+from analysis_tools.earnings_estimate_revision_calculator import EarningsEstimateRevisionCalculator, FACTOR_COLUMNS
+from analysis_tools.symbol_partitioned_index import SymbolPartitionedIndex
+
+
+class StreamingRevisionPipeline:
+    """
+    Runs tracking and scoring as one pipeline.
+
+    A pool of producer threads fetches the analyst estimates and earnings surprises of each symbol
+    and streams them through a queue to the consumer, which scores the symbol from its stored
+    history plus the new rows while other fetches are still in flight. Only storing the new
+    tracking run and the cross-sectional normalization wait for all symbols. If more than
+    TRACKER_MAX_FAILED_SYMBOLS symbols fail, run() raises TrackingRunError before storing or ranking.
+    """
+
+    def __init__(self, fmp_api_key, concurrency=FETCH_CONCURRENCY, run_context=None):
+        self.run_context = run_context
+        fmp_data_loader = run_context.fmp_data_loader if run_context is not None else None
+        self.tracker = EstimateTracker(fmp_api_key, concurrency=concurrency, fmp_data_loader=fmp_data_loader)
+        self.calculator = EarningsEstimateRevisionCalculator(fmp_api_key, fmp_data_loader=fmp_data_loader)
+        self.concurrency = max(1, concurrency)
+
+    def fetch_symbol(self, symbol, tracking_date):
+        """
+        Producer stage: fetches the new estimates and the earnings surprise of one symbol.
+        """
+        new_estimates_df, succeeded = self.tracker.try_fetch_symbol_estimates(symbol, tracking_date)
+        avg_earnings_surprise = self.calculator.calculate_earnings_surprise(symbol)
+        return symbol, new_estimates_df, succeeded, avg_earnings_surprise
+
+    def score_symbol(self, symbol, history_index, new_estimates_df, avg_earnings_surprise, as_of):
+        """
+        Consumer stage: scores one symbol from its stored history up to the previous tracking day
+        and the rows of the current run.
+        """
+        symbol_df = history_index.get_symbol_df(symbol)
+        if new_estimates_df is not None and len(new_estimates_df) > 0:
+            symbol_df = pd.concat([symbol_df, new_estimates_df], axis=0, ignore_index=True) \
+                if len(symbol_df) > 0 else new_estimates_df
+        return {
+            'symbol': symbol,
+            'agreement_score': self.calculator.calculate_agreement(symbol, symbol_df, as_of=as_of),
+            'magnitude_score': self.calculator.calculate_magnitude(symbol, symbol_df, as_of=as_of),
+            'upside_score': self.calculator.calculate_upside(symbol, symbol_df, as_of=as_of),
+            'avg_earnings_surprise': avg_earnings_surprise,
+            'avg_num_analysts': self.calculator.calculate_avg_number_analysts(symbol, symbol_df, as_of=as_of)
+        }
+
+    def run(self):
+        logi("Running streaming estimate revision pipeline...")
+        if self.run_context is not None:
+            symbols_df = self.run_context.get_symbols_df()
+        else:
+            with metrics.stage("symbol_load"):
+                symbols_df = self.tracker.market_symbol_loader.fetch_sp500_symbols(cache_file=True)
+        symbol_list = list(symbols_df['symbol'].unique())
+        self.calculator.symbol_groups = get_symbol_groups(symbols_df)
+
+        # Load the scoring window once while nothing else is running. Storing the run replaces the rows
+        # of its tracking day, so a rerun on the same day must not see the earlier run in the history
+        tracking_date = datetime.today()
+        with metrics.stage("history_load"):
+            history_df = self.tracker.estimate_store.load(
+                start_date=tracking_date - timedelta(days=SCORING_HISTORY_DAYS),
+                end_date=tracking_date - timedelta(days=1))
+        history_index = SymbolPartitionedIndex(history_df)
+
+        result_queue = queue.Queue()
+        results = {}
+        new_estimates = {}
+        failed_symbols = []
+        with metrics.stage("fetch_and_score"), ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for symbol in symbol_list:
+                future = executor.submit(self.fetch_symbol, symbol, tracking_date)
+                future.add_done_callback(lambda f: result_queue.put(f))
+
+            # Score symbols in completion order while the remaining fetches run
+            for _ in range(len(symbol_list)):
+                symbol, new_estimates_df, succeeded, avg_earnings_surprise = result_queue.get().result()
+                if not succeeded:
+                    failed_symbols.append(symbol)
+                new_estimates[symbol] = new_estimates_df
+                with metrics.stage("score"):
+                    results[symbol] = self.score_symbol(symbol, history_index, new_estimates_df,
+                                                        avg_earnings_surprise, tracking_date)
+
+        # Same threshold as the batch tracker: an outage must not store a partial run or rank stale history
+        if len(failed_symbols) > TRACKER_MAX_FAILED_SYMBOLS:
+            raise TrackingRunError(f"{len(failed_symbols)} symbols failed - run not stored and no results written. "
+                                   f"Run the pipeline again.")
+        if failed_symbols:
+            logw(f"No estimates tracked for failed symbols: {failed_symbols}")
+
+        # Store the new tracking run in symbol order
+        new_estimates_list = [new_estimates[symbol] for symbol in symbol_list
+                              if new_estimates[symbol] is not None and len(new_estimates[symbol]) > 0]
+        if new_estimates_list:
+            new_estimates_df = pd.concat(new_estimates_list, axis=0, ignore_index=True)
+            with metrics.stage("store"):
+                self.tracker.estimate_store.append(new_estimates_df, tracking_date)
+            metrics.increment("tracked_rows", len(new_estimates_df))
+            if ROLLING_FACTOR_STATE_ENABLED:
+                with metrics.stage("rolling_state_update"):
+                    self.tracker.update_rolling_factor_state(new_estimates_df, tracking_date)
+
+        # Cross-sectional normalization needs all symbols
+        results_df = pd.DataFrame([results[symbol] for symbol in symbol_list])[['symbol'] + FACTOR_COLUMNS]
+        with metrics.stage("normalize"):
+            final_results_df = self.calculator.rank_results(results_df)
+
+        file_name = f"earnings_revision_results.csv"
+        with metrics.stage("write"):
+            store_csv(RESULTS_DIR, file_name, final_results_df)
+        logd(f"Results file stored to: {os.path.join(RESULTS_DIR, file_name)}")
+        logi(f"FMP request stats: {self.tracker.fmp_data_loader.get_request_stats()}")
+        self.tracker.fmp_data_loader.log_cache_stats()
+        if self.calculator.earnings_surprise_loader.fmp_data_loader is not self.tracker.fmp_data_loader:
+            self.calculator.earnings_surprise_loader.fmp_data_loader.log_cache_stats()
@@ -0,0 +1,78 @@
+import os
+import shutil
+import pandas as pd
+from config import *
+from utils.file_utils import load_csv
+from storage.typed_estimate_loader import load_typed_estimate_history, TYPED_ESTIMATE_COLUMNS
+
+
+class CsvEstimateStore:
+    """
+    Stores the estimate tracking history in a single CSV file.
+
+    Attributes:
+        path (str): Path of the tracking file.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, file_name=ESTIMATE_TRACKING_FILE_NAME):
+        self.cache_dir = cache_dir
+        self.file_name = file_name
+        self.path = os.path.join(cache_dir, file_name)
+
+    def append(self, new_estimates_df: pd.DataFrame, tracking_date=None):
+        """
+        Appends one run of estimates to the end of the tracking file. Re-running on the same tracking day
+        replaces that day's rows instead of duplicating them, like the other stores. The new file is built
+        next to the old one and renamed over it, so readers never see a half-written file.
+        """
+        if new_estimates_df is None or new_estimates_df.empty:
+            return
+        if tracking_date is None:
+            tracking_date = pd.to_datetime(new_estimates_df['tracking_date'], errors='coerce').max()
+        tracking_day = pd.Timestamp(tracking_date).normalize()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        if os.path.exists(self.path):
+            # Keep the column order of the existing file
+            columns = pd.read_csv(self.path, nrows=0).columns
+            tracking_days = pd.to_datetime(pd.read_csv(self.path, usecols=['tracking_date'])['tracking_date'],
+                                           errors='coerce').dt.normalize()
+            same_day = (tracking_days == tracking_day).to_numpy()
+            if same_day.any():
+                # Rare rerun of a stored day: rewrite the file without it, values kept as written
+                existing_df = pd.read_csv(self.path, dtype=str, keep_default_na=False)
+                existing_df[~same_day].to_csv(tmp_path, index=False)
+            else:
+                shutil.copyfile(self.path, tmp_path)
+            new_estimates_df.reindex(columns=columns).to_csv(tmp_path, mode='a', header=False, index=False)
+        else:
+            new_estimates_df[ESTIMATE_TRACKING_COLUMNS].to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+
+    def load(self, symbols=None, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        Loads the tracking history, optionally filtered by symbol and tracking date range (inclusive).
+        """
+        estimate_tracking_df = None
+        if os.path.exists(self.path):
+            estimate_tracking_df = load_csv(self.cache_dir, self.file_name)
+        if estimate_tracking_df is None:
+            return pd.DataFrame(columns=ESTIMATE_TRACKING_COLUMNS)
+
+        estimate_tracking_df['date'] = pd.to_datetime(estimate_tracking_df['date'], errors='coerce')
+        estimate_tracking_df['tracking_date'] = pd.to_datetime(estimate_tracking_df['tracking_date'], errors='coerce')
+        if symbols is not None:
+            estimate_tracking_df = estimate_tracking_df[estimate_tracking_df['symbol'].isin(list(symbols))]
+        if start_date is not None:
+            estimate_tracking_df = estimate_tracking_df[
+                estimate_tracking_df['tracking_date'] >= pd.Timestamp(start_date).normalize()]
+        if end_date is not None:
+            estimate_tracking_df = estimate_tracking_df[
+                estimate_tracking_df['tracking_date'] < pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)]
+        return estimate_tracking_df.reset_index(drop=True)
+
+    def load_typed(self, symbols=None, start_date=None, end_date=None, columns=TYPED_ESTIMATE_COLUMNS) -> pd.DataFrame:
+        """
+        Loads the tracking history in the compact typed layout of storage.typed_estimate_loader.
+        """
+        return load_typed_estimate_history(self.path, symbols, start_date, end_date, columns)
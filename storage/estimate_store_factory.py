@@ -0,0 +1,44 @@
+from config import *
+
+
+def create_estimate_store(backend=TRACKING_STORE_BACKEND):
+    """
+    Creates the estimate tracking store for the configured backend.
+    Backends are imported lazily so optional dependencies are only needed when used.
+    """
+    if backend == "csv":
+        from storage.csv_estimate_store import CsvEstimateStore
+        return CsvEstimateStore()
+    elif backend == "parquet":
+        from storage.parquet_estimate_store import ParquetEstimateStore
+        store = ParquetEstimateStore()
+        # One-time migration of the legacy CSV history
+        if not store.has_data():
+            store.migrate_from_csv()
+        return store
+    elif backend == "interval":
+        from storage.interval_estimate_store import IntervalEstimateStore
+        from storage.parquet_estimate_store import ParquetEstimateStore
+        from storage.csv_estimate_store import CsvEstimateStore
+        store = IntervalEstimateStore()
+        # One-time migration from the daily snapshot history
+        if not store.has_data():
+            snapshot_store = ParquetEstimateStore()
+            if not snapshot_store.has_data():
+                snapshot_store = CsvEstimateStore()
+            store.migrate_from_snapshots(snapshot_store.load())
+        return store
+    elif backend == "sqlite":
+        from storage.sqlite_estimate_store import SqliteEstimateStore
+        from storage.parquet_estimate_store import ParquetEstimateStore
+        from storage.csv_estimate_store import CsvEstimateStore
+        store = SqliteEstimateStore()
+        # One-time migration from the daily snapshot history
+        if not store.has_data():
+            snapshot_store = ParquetEstimateStore()
+            if not snapshot_store.has_data():
+                snapshot_store = CsvEstimateStore()
+            store.migrate_from_snapshots(snapshot_store.load())
+        return store
+    else:
+        raise ValueError(f"Unsupported tracking store backend: {backend}")
@@ -0,0 +1,197 @@
+import os
+import numpy as np
+import pandas as pd
+from config import *
+from utils.log_utils import *
+
+
+# A new interval starts whenever one of these values changes
+INTERVAL_VALUE_COLUMNS = ['estimatedEpsAvg', 'estimatedEpsHigh', 'estimatedEpsLow', 'numberAnalystsEstimatedEps']
+INTERVAL_KEY_COLUMNS = ['symbol', 'date']
+INTERVAL_COLUMNS = ['interval_id', 'symbol', 'date'] + INTERVAL_VALUE_COLUMNS + ['valid_from', 'valid_to', 'position']
+
+
+class IntervalEstimateStore:
+    """
+    Stores the estimate tracking history as change-only intervals.
+
+    A row is kept per (symbol, target date) only when its consensus values change. Each interval
+    is valid for every tracking run from valid_from to valid_to (inclusive). The list of tracking
+    runs is stored separately so the daily snapshot view can be rebuilt with load().
+    An interval also ends when a target is missing from a run, so gaps are reproduced exactly.
+
+    Attributes:
+        base_dir (str): Directory holding intervals.parquet and runs.parquet.
+    """
+
+    def __init__(self, base_dir=ESTIMATE_TRACKING_INTERVAL_DIR):
+        self.base_dir = base_dir
+        self.intervals_path = os.path.join(base_dir, "intervals.parquet")
+        self.runs_path = os.path.join(base_dir, "runs.parquet")
+        self._intervals_df = None
+        self._runs = None
+
+    def has_data(self) -> bool:
+        return os.path.exists(self.intervals_path) and os.path.exists(self.runs_path)
+
+    def _load_state(self):
+        if self._intervals_df is not None:
+            return
+        if self.has_data():
+            self._intervals_df = pd.read_parquet(self.intervals_path)
+            self._runs = pd.to_datetime(pd.read_parquet(self.runs_path)['tracking_date']).sort_values().reset_index(drop=True)
+        else:
+            self._intervals_df = pd.DataFrame(columns=INTERVAL_COLUMNS)
+            self._runs = pd.Series([], dtype='datetime64[ns]')
+
+    def _save_state(self):
+        os.makedirs(self.base_dir, exist_ok=True)
+        for df, path in [(self._intervals_df, self.intervals_path),
+                         (pd.DataFrame({'tracking_date': self._runs}), self.runs_path)]:
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+
+    def _drop_last_run(self):
+        # Remove the most recent run so that it can be replaced
+        last_run = self._runs.iloc[-1]
+        intervals_df = self._intervals_df[self._intervals_df['valid_from'] != last_run].copy()
+        previous_run = self._runs.iloc[-2] if len(self._runs) > 1 else pd.NaT
+        intervals_df.loc[intervals_df['valid_to'] == last_run, 'valid_to'] = previous_run
+        self._intervals_df = intervals_df.reset_index(drop=True)
+        self._runs = self._runs.iloc[:-1].reset_index(drop=True)
+
+    @staticmethod
+    def _values_equal(left_df, right_df):
+        # NaN-aware comparison of the value columns
+        equal = np.ones(len(left_df), dtype=bool)
+        for col in INTERVAL_VALUE_COLUMNS:
+            left = left_df[col].to_numpy(dtype=float)
+            right = right_df[col].to_numpy(dtype=float)
+            equal &= (left == right) | (np.isnan(left) & np.isnan(right))
+        return equal
+
+    def append(self, new_estimates_df: pd.DataFrame, tracking_date=None, save=True):
+        """
+        Adds one tracking run. Unchanged values extend their open interval, changed or new values open a new one.
+        Re-running on the same day as the last run replaces that run.
+        """
+        if new_estimates_df is None or new_estimates_df.empty:
+            return
+        self._load_state()
+        new_df = new_estimates_df.copy()
+        new_df['date'] = pd.to_datetime(new_df['date'], errors='coerce')
+        if tracking_date is None:
+            tracking_date = pd.to_datetime(new_df['tracking_date']).max()
+        tracking_date = pd.Timestamp(tracking_date)
+        new_df['position'] = np.arange(len(new_df))
+        new_df = new_df.drop_duplicates(subset=INTERVAL_KEY_COLUMNS, keep='last')
+
+        if len(self._runs) > 0 and self._runs.iloc[-1].normalize() == tracking_date.normalize():
+            self._drop_last_run()
+
+        intervals_df = self._intervals_df
+        new_interval_df = new_df
+        if len(self._runs) > 0:
+            last_run = self._runs.iloc[-1]
+            open_df = intervals_df[intervals_df['valid_to'] == last_run]
+            merged_df = new_df.merge(open_df[INTERVAL_KEY_COLUMNS + INTERVAL_VALUE_COLUMNS + ['interval_id']],
+                                     on=INTERVAL_KEY_COLUMNS, how='left', suffixes=('', '_open'))
+            open_values_df = merged_df[[f"{col}_open" for col in INTERVAL_VALUE_COLUMNS]]
+            open_values_df.columns = INTERVAL_VALUE_COLUMNS
+            unchanged = merged_df['interval_id'].notna().to_numpy() & self._values_equal(merged_df, open_values_df)
+
+            extended_ids = merged_df.loc[unchanged, 'interval_id']
+            intervals_df.loc[intervals_df['interval_id'].isin(extended_ids), 'valid_to'] = tracking_date
+            new_interval_df = merged_df[~unchanged]
+
+        next_id = int(intervals_df['interval_id'].max()) + 1 if len(intervals_df) > 0 else 0
+        new_interval_df = new_interval_df[INTERVAL_KEY_COLUMNS + INTERVAL_VALUE_COLUMNS + ['position']].copy()
+        new_interval_df['interval_id'] = np.arange(next_id, next_id + len(new_interval_df))
+        new_interval_df['valid_from'] = tracking_date
+        new_interval_df['valid_to'] = tracking_date
+
+        frames = [df for df in [intervals_df, new_interval_df[INTERVAL_COLUMNS]] if len(df) > 0]
+        self._intervals_df = pd.concat(frames, ignore_index=True)
+        self._runs = pd.concat([self._runs, pd.Series([tracking_date])], ignore_index=True)
+        if save:
+            self._save_state()
+            report = self.get_compression_report()
+            logd(f"Interval store: {report['interval_rows']} intervals for {report['snapshot_rows']} snapshot rows "
+                 f"(compression ratio {report['compression_ratio']})")
+
+    def load(self, symbols=None, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        Rebuilds the daily snapshot view (one row per symbol, target date and tracking run)
+        for the requested symbols and tracking date range (inclusive, day granularity).
+        """
+        self._load_state()
+        runs = self._runs
+        if start_date is not None:
+            runs = runs[runs >= pd.Timestamp(start_date).normalize()]
+        if end_date is not None:
+            runs = runs[runs < pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)]
+        intervals_df = self._intervals_df
+        if symbols is not None:
+            intervals_df = intervals_df[intervals_df['symbol'].isin(list(symbols))]
+        if len(runs) == 0 or len(intervals_df) == 0:
+            return pd.DataFrame(columns=ESTIMATE_TRACKING_COLUMNS)
+
+        # Find the range of runs each interval covers and repeat the interval once per run
+        run_values = runs.to_numpy()
+        first_run = np.searchsorted(run_values, intervals_df['valid_from'].to_numpy(), side='left')
+        end_run = np.searchsorted(run_values, intervals_df['valid_to'].to_numpy(), side='right')
+        counts = np.maximum(end_run - first_run, 0)
+        row_index = np.repeat(np.arange(len(intervals_df)), counts)
+        # Offset of each repeated row within its interval
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        snapshot_df = intervals_df.iloc[row_index].reset_index(drop=True)
+        snapshot_df['tracking_date'] = run_values[np.repeat(first_run, counts) + offsets]
+        snapshot_df.sort_values(by=['tracking_date', 'position'], kind='stable', inplace=True)
+        return snapshot_df[ESTIMATE_TRACKING_COLUMNS].reset_index(drop=True)
+
+    def snapshot_as_of(self, as_of_date, symbols=None) -> pd.DataFrame:
+        """
+        Returns the rows of the most recent tracking run on or before as_of_date.
+        """
+        self._load_state()
+        runs = self._runs[self._runs < pd.Timestamp(as_of_date).normalize() + pd.Timedelta(days=1)]
+        if len(runs) == 0:
+            return pd.DataFrame(columns=ESTIMATE_TRACKING_COLUMNS)
+        return self.load(symbols=symbols, start_date=runs.iloc[-1], end_date=runs.iloc[-1])
+
+    def get_compression_report(self) -> dict:
+        """
+        Compares the number of stored intervals with the number of rows in the equivalent daily snapshots.
+        """
+        self._load_state()
+        interval_rows = len(self._intervals_df)
+        snapshot_rows = 0
+        if interval_rows > 0:
+            run_values = self._runs.to_numpy()
+            first_run = np.searchsorted(run_values, self._intervals_df['valid_from'].to_numpy(), side='left')
+            end_run = np.searchsorted(run_values, self._intervals_df['valid_to'].to_numpy(), side='right')
+            snapshot_rows = int(np.maximum(end_run - first_run, 0).sum())
+        return {
+            'runs': len(self._runs),
+            'interval_rows': interval_rows,
+            'snapshot_rows': snapshot_rows,
+            'compression_ratio': round(snapshot_rows / interval_rows, 2) if interval_rows else 0.0
+        }
+
+    def migrate_from_snapshots(self, snapshot_df: pd.DataFrame):
+        """
+        One-time migration from a daily snapshot history (CSV or Parquet store contents).
+        """
+        if snapshot_df is None or snapshot_df.empty:
+            return
+        snapshot_df = snapshot_df.copy()
+        snapshot_df['tracking_date'] = pd.to_datetime(snapshot_df['tracking_date'], errors='coerce')
+        snapshot_df = snapshot_df.dropna(subset=['tracking_date'])
+        for tracking_date, run_df in snapshot_df.groupby('tracking_date', sort=True):
+            self.append(run_df, tracking_date, save=False)
+        self._save_state()
+        report = self.get_compression_report()
+        logi(f"Migrated {len(snapshot_df)} snapshot rows into {report['interval_rows']} intervals "
+             f"(compression ratio {report['compression_ratio']})")
@@ -0,0 +1,183 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from config import *
+from utils.log_utils import *
+
+
+class MemmapColumnStore:
+    """
+    Read-optimized copy of the estimate tracking history as one .npy file per column:
+
+        <base_dir>/CURRENT                      name of the current version directory
+        <base_dir>/<version>/<column>.npy       rows sorted by (symbol, date, tracking_date)
+        <base_dir>/<version>/symbols.npy        sorted symbol names
+        <base_dir>/<version>/offsets.npy        rows of symbols[i] are offsets[i]:offsets[i + 1]
+        <base_dir>/<version>/meta.json
+
+    Columns are opened with np.load(mmap_mode='r'), so opening the store reads no data and a
+    symbol's history is a slice of each column. Only the pages of that slice are read from disk.
+    Symbol frames wrap the slices without copying them and can be passed to the factor methods
+    of EarningsEstimateRevisionCalculator. Those give the same results as on the chronological
+    history as long as each fiscal year has one target date, as with the annual FMP estimates.
+
+    The store is derived from the tracking store and rebuilt as a whole (see build), by the
+    column_store job after tracking or with "python cli.py build-column-store", never by the
+    tracker itself. A build writes a new version directory and then replaces CURRENT, so readers
+    always see a complete version.
+
+    Attributes:
+        base_dir (str): Directory of the column files.
+    """
+
+    COLUMN_DTYPES = {
+        'date': 'datetime64[ns]',
+        'tracking_date': 'datetime64[ns]',
+        'estimatedEpsAvg': np.float64,
+        'estimatedEpsHigh': np.float64,
+        'estimatedEpsLow': np.float64,
+        'numberAnalystsEstimatedEps': np.float64,
+    }
+
+    def __init__(self, base_dir=ESTIMATE_TRACKING_MEMMAP_DIR):
+        self.base_dir = base_dir
+        self.columns = {}
+        self.symbols = np.array([], dtype=str)
+        self.offsets = np.zeros(1, dtype=np.int64)
+
+    @classmethod
+    def open(cls, base_dir=ESTIMATE_TRACKING_MEMMAP_DIR):
+        """
+        Opens the current version of the store. An empty store is returned if it has not been built yet.
+        """
+        store = cls(base_dir)
+        # A build may remove the version read from CURRENT before it is opened, so retry once
+        for _ in range(2):
+            version_dir = store._get_current_dir()
+            if version_dir is None:
+                return store
+            try:
+                store.symbols = np.load(os.path.join(version_dir, "symbols.npy"))
+                store.offsets = np.load(os.path.join(version_dir, "offsets.npy"))
+                store.columns = {col: np.load(os.path.join(version_dir, f"{col}.npy"), mmap_mode='r')
+                                 for col in cls.COLUMN_DTYPES}
+                return store
+            except FileNotFoundError:
+                continue
+        return store
+
+    def _get_current_path(self) -> str:
+        return os.path.join(self.base_dir, "CURRENT")
+
+    def _get_current_dir(self):
+        try:
+            with open(self._get_current_path(), "r") as f:
+                return os.path.join(self.base_dir, f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def has_data(self) -> bool:
+        return os.path.exists(self._get_current_path())
+
+    def get_built_at(self):
+        """
+        Returns when the current version was built, None if the store has not been built yet.
+        """
+        version_dir = self._get_current_dir()
+        if version_dir is None:
+            return None
+        with open(os.path.join(version_dir, "meta.json"), "r") as f:
+            return pd.Timestamp(json.load(f)['built_at'])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def get_symbols(self) -> list:
+        return self.symbols.tolist()
+
+    def get_symbol_range(self, symbol) -> tuple:
+        """
+        Returns the [start, end) row range of a symbol, (0, 0) if the symbol is not stored.
+        """
+        i = np.searchsorted(self.symbols, symbol)
+        if i >= len(self.symbols) or self.symbols[i] != symbol:
+            return 0, 0
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+    def get_symbol_arrays(self, symbol) -> dict:
+        """
+        Returns read-only views of the column slices of a symbol, ordered by (date, tracking_date).
+        """
+        start, end = self.get_symbol_range(symbol)
+        return {col: values[start:end] for col, values in self.columns.items()}
+
+    def get_symbol_df(self, symbol) -> pd.DataFrame:
+        """
+        Returns the history of a symbol as a DataFrame backed by the memory-mapped columns.
+        """
+        arrays = self.get_symbol_arrays(symbol)
+        if not arrays:
+            return pd.DataFrame(columns=ESTIMATE_TRACKING_COLUMNS)
+        row_count = len(arrays['date'])
+        symbol_column = pd.Categorical.from_codes(np.zeros(row_count, dtype=np.int8), categories=[symbol])
+        return pd.DataFrame({**arrays, 'symbol': symbol_column}, copy=False)[ESTIMATE_TRACKING_COLUMNS]
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Returns the whole history, sorted by (symbol, date, tracking_date).
+        """
+        if not self.columns:
+            return pd.DataFrame(columns=ESTIMATE_TRACKING_COLUMNS)
+        codes = np.repeat(np.arange(len(self.symbols)), np.diff(self.offsets))
+        symbol_column = pd.Categorical.from_codes(codes, categories=self.symbols)
+        return pd.DataFrame({**self.columns, 'symbol': symbol_column}, copy=False)[ESTIMATE_TRACKING_COLUMNS]
+
+    def build(self, estimate_tracking_df: pd.DataFrame):
+        """
+        Writes a new version of the store from a tracking history.
+        """
+        df = estimate_tracking_df.dropna(subset=['symbol'])
+        symbols = df['symbol'].to_numpy(dtype=str)
+        arrays = {col: pd.to_datetime(df[col], errors='coerce').to_numpy(dtype=dtype)
+                  if dtype == 'datetime64[ns]' else df[col].to_numpy(dtype=dtype)
+                  for col, dtype in self.COLUMN_DTYPES.items()}
+        self._write(symbols, arrays)
+
+    def build_from_store(self, estimate_store):
+        """
+        Rebuilds the store from the whole history of a tracking store.
+        """
+        self.build(estimate_store.load())
+
+    def _write(self, symbols: np.ndarray, arrays: dict):
+        # Sort by (symbol, date, tracking_date), stable so equal keys keep their input order
+        order = np.lexsort((arrays['tracking_date'], arrays['date'], symbols))
+        symbols = symbols[order]
+        unique_symbols, starts = np.unique(symbols, return_index=True)
+        offsets = np.append(starts, len(symbols)).astype(np.int64)
+
+        version = f"v{pd.Timestamp.now().strftime('%Y%m%d%H%M%S%f')}_{os.getpid()}"
+        version_dir = os.path.join(self.base_dir, version)
+        os.makedirs(version_dir)
+        np.save(os.path.join(version_dir, "symbols.npy"), unique_symbols)
+        np.save(os.path.join(version_dir, "offsets.npy"), offsets)
+        for col, values in arrays.items():
+            np.save(os.path.join(version_dir, f"{col}.npy"), np.ascontiguousarray(values[order]))
+        with open(os.path.join(version_dir, "meta.json"), "w") as f:
+            json.dump({'rows': len(symbols), 'symbols': len(unique_symbols),
+                       'built_at': pd.Timestamp.now().isoformat()}, f)
+
+        # Switching CURRENT is atomic, so readers see either the old or the new version
+        current_path = self._get_current_path()
+        with open(f"{current_path}.{os.getpid()}.tmp", "w") as f:
+            f.write(version)
+        os.replace(f"{current_path}.{os.getpid()}.tmp", current_path)
+
+        # Open memory maps keep the files of older versions readable until they are closed
+        for name in os.listdir(self.base_dir):
+            path = os.path.join(self.base_dir, name)
+            if name != version and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+        logd(f"Memmap column store written: {len(symbols)} rows, {len(unique_symbols)} symbols")
@@ -0,0 +1,175 @@
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from config import *
+from utils.log_utils import *
+from storage.typed_estimate_loader import filter_tracking_table, table_to_typed_frame, typed_empty_frame, \
+    TYPED_ESTIMATE_COLUMNS
+
+
+class ParquetEstimateStore:
+    """
+    Stores the estimate tracking history as Parquet files partitioned by tracking day:
+
+        <base_dir>/tracking_day=YYYY-MM-DD/part-0.parquet
+
+    Each tracking run only writes its own partition. Loads push symbol and tracking date
+    filters down to pyarrow, so partitions outside the requested date range are never read.
+
+    Attributes:
+        base_dir (str): Root directory of the partitioned dataset.
+    """
+
+    PARTITION_KEY = "tracking_day"
+
+    def __init__(self, base_dir=ESTIMATE_TRACKING_PARQUET_DIR):
+        self.base_dir = base_dir
+        self._partitioning = ds.partitioning(pa.schema([(self.PARTITION_KEY, pa.string())]), flavor="hive")
+
+    @staticmethod
+    def _format_day(value) -> str:
+        return pd.Timestamp(value).strftime("%Y-%m-%d")
+
+    def _get_partition_dir(self, day: str) -> str:
+        return os.path.join(self.base_dir, f"{self.PARTITION_KEY}={day}")
+
+    def has_data(self) -> bool:
+        return os.path.isdir(self.base_dir) and any(
+            name.startswith(f"{self.PARTITION_KEY}=") for name in os.listdir(self.base_dir))
+
+    def list_partitions(self) -> list:
+        """
+        Returns the sorted list of tracking days stored.
+        """
+        if not os.path.isdir(self.base_dir):
+            return []
+        prefix = f"{self.PARTITION_KEY}="
+        return sorted(name[len(prefix):] for name in os.listdir(self.base_dir) if name.startswith(prefix))
+
+    def write_partition(self, day_df: pd.DataFrame, day: str):
+        """
+        Writes (or replaces) the partition of a single tracking day atomically.
+        """
+        partition_dir = self._get_partition_dir(day)
+        os.makedirs(partition_dir, exist_ok=True)
+
+        # Sort by symbol so row group statistics allow symbol filters to skip data
+        day_df = day_df[ESTIMATE_TRACKING_COLUMNS].sort_values(by='symbol', kind='stable')
+        table = pa.Table.from_pandas(day_df, preserve_index=False)
+
+        # Dot-prefixed temp files are ignored by dataset discovery
+        tmp_path = os.path.join(partition_dir, f".part-0.parquet.{os.getpid()}.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(partition_dir, "part-0.parquet"))
+
+    def append(self, new_estimates_df: pd.DataFrame, tracking_date=None):
+        """
+        Stores one run of estimates as the partition of its tracking day. Re-running on the same
+        day replaces that day's partition instead of duplicating rows.
+        """
+        if new_estimates_df is None or new_estimates_df.empty:
+            return
+        new_estimates_df = new_estimates_df.copy()
+        new_estimates_df['date'] = pd.to_datetime(new_estimates_df['date'], errors='coerce')
+        new_estimates_df['tracking_date'] = pd.to_datetime(new_estimates_df['tracking_date'], errors='coerce')
+        if tracking_date is None:
+            tracking_date = new_estimates_df['tracking_date'].max()
+        self.write_partition(new_estimates_df, self._format_day(tracking_date))
+
+    def load(self, symbols=None, start_date=None, end_date=None, columns=None) -> pd.DataFrame:
+        """
+        Loads the tracking history, optionally filtered by symbol and tracking date range (inclusive, day granularity).
+
+        Parameters:
+            symbols (list): Symbols to load, None for all.
+            start_date (datetime): First tracking day to load.
+            end_date (datetime): Last tracking day to load.
+            columns (list): Columns to load, None for all tracking columns.
+
+        Returns:
+            DataFrame: tracking rows in chronological order.
+        """
+        columns = columns or ESTIMATE_TRACKING_COLUMNS
+        if not self.has_data():
+            return pd.DataFrame(columns=columns)
+
+        table = self._read_table(symbols, start_date, end_date, columns)
+        estimate_tracking_df = table.to_pandas()
+        if 'tracking_date' in estimate_tracking_df.columns:
+            estimate_tracking_df.sort_values(by='tracking_date', kind='stable', inplace=True)
+            estimate_tracking_df.reset_index(drop=True, inplace=True)
+        return estimate_tracking_df
+
+    def load_typed(self, symbols=None, start_date=None, end_date=None, columns=TYPED_ESTIMATE_COLUMNS) -> pd.DataFrame:
+        """
+        Loads the tracking history in the compact typed layout of storage.typed_estimate_loader.
+        """
+        if not self.has_data():
+            return typed_empty_frame(columns)
+        read_columns = list(dict.fromkeys(list(columns) + ['tracking_date']))
+        table = filter_tracking_table(self._read_table(symbols, start_date, end_date, read_columns))
+        return table_to_typed_frame(table, columns)
+
+    def _read_table(self, symbols, start_date, end_date, columns) -> pa.Table:
+        dataset = ds.dataset(self.base_dir, format="parquet", partitioning=self._partitioning)
+        expression = None
+        filters = []
+        if start_date is not None:
+            filters.append(ds.field(self.PARTITION_KEY) >= self._format_day(start_date))
+        if end_date is not None:
+            filters.append(ds.field(self.PARTITION_KEY) <= self._format_day(end_date))
+        if symbols is not None:
+            filters.append(ds.field('symbol').isin(list(symbols)))
+        for f in filters:
+            expression = f if expression is None else expression & f
+
+        return dataset.to_table(columns=list(columns), filter=expression)
+
+    def migrate_from_csv(self, csv_path=os.path.join(CACHE_DIR, ESTIMATE_TRACKING_FILE_NAME), overwrite=False):
+        """
+        One-time migration of the legacy tracking CSV into daily partitions.
+
+        The partitions are written to a sibling directory that is renamed to base_dir once complete,
+        so a crash never leaves a partial store that has_data() would take as migrated.
+
+        Returns:
+            int: Number of partitions written.
+        """
+        if not os.path.exists(csv_path):
+            logi(f"No tracking file to migrate at {csv_path}")
+            return 0
+        if self.has_data() and not overwrite:
+            logi(f"Parquet store {self.base_dir} already has data - skipping migration")
+            return 0
+
+        estimate_tracking_df = pd.read_csv(csv_path)
+        estimate_tracking_df['date'] = pd.to_datetime(estimate_tracking_df['date'], errors='coerce')
+        estimate_tracking_df['tracking_date'] = pd.to_datetime(estimate_tracking_df['tracking_date'], errors='coerce')
+        estimate_tracking_df = estimate_tracking_df.dropna(subset=['tracking_date'])
+
+        # Leftovers of an interrupted migration are discarded
+        base_dir = self.base_dir.rstrip(os.sep)
+        migration_store = ParquetEstimateStore(base_dir=f"{base_dir}.migrating")
+        shutil.rmtree(migration_store.base_dir, ignore_errors=True)
+        os.makedirs(migration_store.base_dir)
+        days = estimate_tracking_df['tracking_date'].dt.strftime("%Y-%m-%d")
+        partition_count = 0
+        for day, day_df in estimate_tracking_df.groupby(days, sort=True):
+            migration_store.write_partition(day_df, day)
+            partition_count += 1
+
+        # Move the old store (data when overwriting, otherwise at most an empty directory) out of the way
+        if os.path.exists(base_dir):
+            replaced_dir = f"{base_dir}.replaced"
+            shutil.rmtree(replaced_dir, ignore_errors=True)
+            os.rename(base_dir, replaced_dir)
+            os.rename(migration_store.base_dir, base_dir)
+            shutil.rmtree(replaced_dir, ignore_errors=True)
+        else:
+            os.makedirs(os.path.dirname(base_dir) or ".", exist_ok=True)
+            os.rename(migration_store.base_dir, base_dir)
+        logi(f"Migrated {len(estimate_tracking_df)} rows from {csv_path} into {partition_count} partitions")
+        return partition_count
@@ -0,0 +1,214 @@
+import os
+import sqlite3
+import pandas as pd
+from contextlib import closing
+from config import *
+from utils.log_utils import *
+
+
+class SqliteEstimateStore:
+    """
+    Stores the estimate tracking history in a SQLite database in WAL mode.
+
+    Readers (notebooks, cron jobs) read a consistent snapshot while the tracker writes, and never
+    block the writer. Each tracking run is written in one transaction with executemany. Dates are
+    stored as ISO strings, so they sort chronologically, and queries by symbol and tracking date
+    use the (symbol, tracking_date) and (tracking_date) indexes.
+
+    Attributes:
+        db_path (str): Path of the database file.
+    """
+
+    TABLE = "estimates_tracking"
+    VALUE_COLUMNS = ['estimatedEpsAvg', 'estimatedEpsHigh', 'estimatedEpsLow', 'numberAnalystsEstimatedEps']
+
+    def __init__(self, db_path=ESTIMATE_TRACKING_SQLITE_PATH, timeout=SQLITE_BUSY_TIMEOUT):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._create_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, timeout=self.timeout)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # Durable at checkpoints, which is enough for data that can be re-fetched
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _create_schema(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.TABLE} (
+                    symbol TEXT NOT NULL,
+                    date TEXT,
+                    tracking_date TEXT NOT NULL,
+                    estimatedEpsAvg REAL,
+                    estimatedEpsHigh REAL,
+                    estimatedEpsLow REAL,
+                    numberAnalystsEstimatedEps REAL
+                )""")
+            connection.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.TABLE}_symbol_tracking_date "
+                               f"ON {self.TABLE} (symbol, tracking_date)")
+            connection.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.TABLE}_tracking_date "
+                               f"ON {self.TABLE} (tracking_date)")
+
+    @staticmethod
+    def _format_timestamp(value) -> str:
+        return pd.Timestamp(value).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+    @staticmethod
+    def _get_day_range(start_date=None, end_date=None) -> tuple:
+        # Inclusive day range as [start, end) bounds on the ISO strings
+        start = pd.Timestamp(start_date).strftime("%Y-%m-%d") if start_date is not None else None
+        end = (pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)).strftime("%Y-%m-%d") \
+            if end_date is not None else None
+        return start, end
+
+    def _build_filter(self, symbols=None, start_date=None, end_date=None) -> tuple:
+        conditions = []
+        params = []
+        if symbols is not None:
+            symbols = list(symbols)
+            conditions.append(f"symbol IN ({','.join('?' * len(symbols))})")
+            params += symbols
+        start, end = self._get_day_range(start_date, end_date)
+        if start is not None:
+            conditions.append("tracking_date >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("tracking_date < ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return where, params
+
+    def _read_query(self, query: str, params) -> pd.DataFrame:
+        with closing(self._connect()) as connection:
+            return pd.read_sql_query(query, connection, params=params)
+
+    @staticmethod
+    def _parse_dates(df: pd.DataFrame) -> pd.DataFrame:
+        for col in ('date', 'tracking_date'):
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col], errors='coerce', format='ISO8601')
+        return df
+
+    def has_data(self) -> bool:
+        with closing(self._connect()) as connection:
+            return connection.execute(f"SELECT 1 FROM {self.TABLE} LIMIT 1").fetchone() is not None
+
+    def _get_rows(self, df: pd.DataFrame, tracking_date):
+        tracking_dates = pd.to_datetime(df['tracking_date'], errors='coerce').fillna(pd.Timestamp(tracking_date))
+        rows_df = pd.DataFrame({
+            'symbol': df['symbol'].astype(str),
+            'date': pd.to_datetime(df['date'], errors='coerce').dt.strftime("%Y-%m-%d"),
+            'tracking_date': tracking_dates.dt.strftime("%Y-%m-%d %H:%M:%S.%f"),
+            **{col: df[col].astype(float) for col in self.VALUE_COLUMNS}
+        })
+        # NaN and NaT are stored as NULL
+        return rows_df.astype(object).where(rows_df.notna(), None).itertuples(index=False, name=None)
+
+    def _insert_run(self, connection, new_estimates_df: pd.DataFrame, tracking_date=None):
+        df = new_estimates_df.dropna(subset=['symbol'])
+        if tracking_date is None:
+            tracking_date = pd.to_datetime(df['tracking_date'], errors='coerce').max()
+        start, end = self._get_day_range(tracking_date, tracking_date)
+        connection.execute(f"DELETE FROM {self.TABLE} WHERE tracking_date >= ? AND tracking_date < ?", (start, end))
+        connection.executemany(
+            f"INSERT INTO {self.TABLE} (symbol, date, tracking_date, {', '.join(self.VALUE_COLUMNS)}) "
+            f"VALUES (?, ?, ?, ?, ?, ?, ?)", self._get_rows(df, tracking_date))
+
+    def append(self, new_estimates_df: pd.DataFrame, tracking_date=None):
+        """
+        Stores one tracking run in a single transaction. Rows of the same tracking day are replaced,
+        so a rerun does not duplicate them.
+        """
+        if new_estimates_df is None or new_estimates_df.empty:
+            return
+        with closing(self._connect()) as connection, connection:
+            self._insert_run(connection, new_estimates_df, tracking_date)
+
+    def load(self, symbols=None, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        Loads the tracking history, optionally filtered by symbol and tracking date range (inclusive, day granularity).
+        """
+        where, params = self._build_filter(symbols, start_date, end_date)
+        df = self._read_query(f"SELECT {', '.join(ESTIMATE_TRACKING_COLUMNS)} FROM {self.TABLE} {where} "
+                              f"ORDER BY tracking_date, rowid", params)
+        return self._parse_dates(df)
+
+    def get_symbol_history(self, symbol, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        Returns the tracking history of one symbol, read through the (symbol, tracking_date) index.
+        """
+        return self.load(symbols=[symbol], start_date=start_date, end_date=end_date)
+
+    def snapshot_as_of(self, as_of_date, symbols=None) -> pd.DataFrame:
+        """
+        Returns, per symbol, the rows of its most recent tracking run on or before as_of_date.
+        """
+        where, params = self._build_filter(symbols, end_date=as_of_date)
+        df = self._read_query(f"""
+            SELECT {', '.join(ESTIMATE_TRACKING_COLUMNS)} FROM (
+                SELECT *, MAX(tracking_date) OVER (PARTITION BY symbol) AS last_tracking_date
+                FROM {self.TABLE} {where}
+            )
+            WHERE tracking_date = last_tracking_date
+            ORDER BY symbol, date""", params)
+        return self._parse_dates(df)
+
+    def get_window_aggregates(self, start_date, end_date=None, symbols=None) -> pd.DataFrame:
+        """
+        Aggregates the tracking window per symbol in SQL, so only one row per symbol is returned.
+
+        Revisions are changes of a fiscal target's consensus between consecutive runs, with the
+        sign of the percentage change as in EarningsEstimateRevisionCalculator.calculate_agreement.
+
+        Returns:
+            DataFrame: symbol, row_count, first/last tracking_date, avg_eps, avg_num_analysts,
+                up_revisions, down_revisions and agreement_score.
+        """
+        where, params = self._build_filter(symbols, start_date, end_date)
+        df = self._read_query(f"""
+            WITH revisions AS (
+                SELECT symbol, tracking_date, estimatedEpsAvg, numberAnalystsEstimatedEps,
+                       -- A change from 0 is +/-inf in pandas, so only the sign of the new value counts
+                       CASE WHEN prev_eps = 0 THEN estimatedEpsAvg
+                            ELSE (estimatedEpsAvg - prev_eps) / prev_eps END AS eps_change
+                FROM (
+                    SELECT *, LAG(estimatedEpsAvg) OVER (
+                        PARTITION BY symbol, date ORDER BY tracking_date, rowid) AS prev_eps
+                    FROM {self.TABLE} {where}
+                )
+            )
+            SELECT symbol,
+                   COUNT(*) AS row_count,
+                   MIN(tracking_date) AS first_tracking_date,
+                   MAX(tracking_date) AS last_tracking_date,
+                   AVG(estimatedEpsAvg) AS avg_eps,
+                   AVG(numberAnalystsEstimatedEps) AS avg_num_analysts,
+                   TOTAL(eps_change > 0) AS up_revisions,
+                   TOTAL(eps_change < 0) AS down_revisions
+            FROM revisions
+            GROUP BY symbol
+            ORDER BY symbol""", params)
+        df[['up_revisions', 'down_revisions']] = df[['up_revisions', 'down_revisions']].astype(int)
+        total = df['up_revisions'] + df['down_revisions']
+        df['agreement_score'] = (df['up_revisions'] / total.where(total > 0)).round(2).fillna(0.0)
+        for col in ('first_tracking_date', 'last_tracking_date'):
+            df[col] = pd.to_datetime(df[col], format='ISO8601')
+        return df
+
+    def migrate_from_snapshots(self, snapshot_df: pd.DataFrame):
+        """
+        One-time migration from a daily snapshot history (CSV or Parquet store contents).
+        """
+        if snapshot_df is None or snapshot_df.empty:
+            return
+        snapshot_df = snapshot_df.copy()
+        snapshot_df['tracking_date'] = pd.to_datetime(snapshot_df['tracking_date'], errors='coerce')
+        snapshot_df = snapshot_df.dropna(subset=['tracking_date'])
+        days = snapshot_df['tracking_date'].dt.normalize()
+        with closing(self._connect()) as connection, connection:
+            for day, run_df in snapshot_df.groupby(days, sort=True):
+                self._insert_run(connection, run_df, day)
+        logi(f"Migrated {len(snapshot_df)} snapshot rows into {self.db_path}")
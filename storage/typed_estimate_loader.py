@@ -0,0 +1,165 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+from config import *
+
+
+# Columns used by the scoring engines - estimatedEpsHigh and estimatedEpsLow are never read
+TYPED_ESTIMATE_COLUMNS = ['symbol', 'date', 'tracking_date', 'estimatedEpsAvg', 'numberAnalystsEstimatedEps']
+
+# In-memory layout of the typed history
+#   symbol                      category (int16 codes for up to 32767 symbols)   2 bytes
+#   date                        int32 days since 1970-01-01 (fiscal period end)  4 bytes
+#   tracking_date               int32 days since 1970-01-01 (tracking day)       4 bytes
+#   estimatedEpsAvg             float32                                          4 bytes
+#   numberAnalystsEstimatedEps  Int16 (nullable, 1 byte validity mask)           3 bytes
+# = 17 bytes per row plus the symbol categories. The default read_csv + to_datetime frame with all
+# seven columns takes ~112 bytes per row with object symbol strings (pandas 2) and ~63 with Arrow
+# strings (pandas 3), so 10 million rows (Russell 2000 x 5 years x 4 targets) need ~170 MB instead
+# of 0.6-1.1 GB. Measured with DataFrame.memory_usage(deep=True) on benchmarks/synthetic_history.py data.
+TYPED_BYTES_PER_ROW = 17
+
+_CSV_COLUMN_TYPES = {
+    'symbol': pa.dictionary(pa.int32(), pa.string()),
+    'date': pa.timestamp('us'),
+    'tracking_date': pa.timestamp('us'),
+    'estimatedEpsAvg': pa.float32(),
+    'estimatedEpsHigh': pa.float32(),
+    'estimatedEpsLow': pa.float32(),
+    'numberAnalystsEstimatedEps': pa.float32(),
+}
+
+
+def to_day_number(value):
+    """
+    Converts a datetime (or array of datetimes) to int32 days since 1970-01-01, dropping the time of day.
+    """
+    if isinstance(value, (pd.Series, pd.Index, np.ndarray)):
+        days = pd.to_datetime(value).to_numpy().astype('datetime64[D]').astype(np.int64)
+        return days.astype(np.int32)
+    return np.int32(pd.Timestamp(value).to_datetime64().astype('datetime64[D]').astype(np.int64))
+
+
+def from_day_number(day_numbers) -> np.ndarray:
+    return np.asarray(day_numbers).astype('datetime64[D]')
+
+
+def is_day_number(values) -> bool:
+    return pd.api.types.is_integer_dtype(values)
+
+
+def get_day_number_years(day_numbers) -> np.ndarray:
+    return from_day_number(day_numbers).astype('datetime64[Y]').astype(np.int64) + 1970
+
+
+def table_to_typed_frame(table: pa.Table, columns=TYPED_ESTIMATE_COLUMNS) -> pd.DataFrame:
+    """
+    Converts an Arrow table of tracking rows to the typed layout. The casts run in Arrow, so the
+    wide intermediate pandas frame is never built.
+    """
+    arrays = {}
+    for col in columns:
+        array = table.column(col)
+        if col == 'symbol':
+            if not pa.types.is_dictionary(array.type):
+                array = pc.dictionary_encode(array)
+            arrays[col] = array.to_pandas().astype('category')
+        elif col in ('date', 'tracking_date'):
+            # Timestamps are truncated to their day
+            array = pc.cast(array, pa.date32(), safe=False)
+            arrays[col] = pc.cast(array, pa.int32()).to_numpy(zero_copy_only=False)
+        elif col == 'numberAnalystsEstimatedEps':
+            arrays[col] = pd.array(pc.cast(array, pa.int16(), safe=False).to_pandas(
+                types_mapper={pa.int16(): pd.Int16Dtype()}.get), dtype='Int16')
+        else:
+            arrays[col] = pc.cast(array, pa.float32()).to_numpy(zero_copy_only=False)
+
+    typed_df = pd.DataFrame(arrays)
+    # Categories with int16 codes as long as there are few enough symbols
+    if 'symbol' in typed_df.columns:
+        typed_df['symbol'] = typed_df['symbol'].cat.remove_unused_categories()
+    return typed_df
+
+
+def filter_tracking_table(table: pa.Table, symbols=None, start_date=None, end_date=None) -> pa.Table:
+    """
+    Filters an Arrow table by symbol and tracking date range (inclusive, day granularity) and sorts it
+    chronologically, like the store loaders.
+    """
+    mask = None
+    if symbols is not None:
+        mask = pc.is_in(pc.cast(table.column('symbol'), pa.string()), value_set=pa.array(list(symbols), pa.string()))
+    tracking_days = pc.cast(table.column('tracking_date'), pa.date32(), safe=False)
+    if start_date is not None:
+        start_mask = pc.greater_equal(tracking_days, pa.scalar(pd.Timestamp(start_date).date(), pa.date32()))
+        mask = start_mask if mask is None else pc.and_(mask, start_mask)
+    if end_date is not None:
+        end_mask = pc.less_equal(tracking_days, pa.scalar(pd.Timestamp(end_date).date(), pa.date32()))
+        mask = end_mask if mask is None else pc.and_(mask, end_mask)
+    if mask is not None:
+        table = table.filter(pc.fill_null(mask, False))
+    # Arrow's sort is stable, so rows of one run keep their order
+    return table.sort_by([('tracking_date', 'ascending')])
+
+
+def load_typed_estimate_history(path=os.path.join(CACHE_DIR, ESTIMATE_TRACKING_FILE_NAME), symbols=None,
+                                start_date=None, end_date=None, columns=TYPED_ESTIMATE_COLUMNS) -> pd.DataFrame:
+    """
+    Loads the tracking CSV into the typed layout described by TYPED_BYTES_PER_ROW.
+
+    Only the given columns are parsed, with the multithreaded pyarrow CSV reader and a fixed schema,
+    so dates are parsed once while reading instead of with pd.to_datetime afterwards. Dates become
+    int32 day numbers (see to_day_number), so time windows over the result have day granularity.
+
+    Parameters:
+        path (str): Path of the tracking CSV.
+        symbols (list): Symbols to load, None for all.
+        start_date (datetime): First tracking day to load.
+        end_date (datetime): Last tracking day to load.
+        columns (list): Columns to load, defaults to the columns used for scoring.
+
+    Returns:
+        DataFrame: typed tracking rows in chronological order.
+    """
+    if not os.path.exists(path):
+        return typed_empty_frame(columns)
+
+    read_columns = list(dict.fromkeys(list(columns) + ['symbol', 'tracking_date']))
+    table = pa_csv.read_csv(path, convert_options=pa_csv.ConvertOptions(
+        include_columns=read_columns,
+        column_types={col: _CSV_COLUMN_TYPES[col] for col in read_columns},
+        timestamp_parsers=[pa_csv.ISO8601]
+    ))
+    table = filter_tracking_table(table, symbols, start_date, end_date)
+    return table_to_typed_frame(table, columns)
+
+
+def typed_empty_frame(columns=TYPED_ESTIMATE_COLUMNS) -> pd.DataFrame:
+    dtypes = {'symbol': 'category', 'date': np.int32, 'tracking_date': np.int32,
+              'numberAnalystsEstimatedEps': 'Int16'}
+    return pd.DataFrame({col: pd.Series(dtype=dtypes.get(col, np.float32)) for col in columns})
+
+
+def compact_estimate_history(estimate_tracking_df: pd.DataFrame, columns=TYPED_ESTIMATE_COLUMNS) -> pd.DataFrame:
+    """
+    Converts a tracking history loaded with datetime columns to the typed layout.
+    """
+    if estimate_tracking_df is None or estimate_tracking_df.empty:
+        return typed_empty_frame(columns)
+    table = pa.Table.from_pandas(estimate_tracking_df[list(columns)], preserve_index=False)
+    return table_to_typed_frame(table, columns)
+
+
+def expand_day_numbers(typed_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts the day number columns of a typed history back to datetime64 columns, for code that
+    needs datetimes. Other columns keep their compact types.
+    """
+    expanded_df = typed_df.copy()
+    for col in ('date', 'tracking_date'):
+        if col in expanded_df.columns and is_day_number(expanded_df[col]):
+            expanded_df[col] = from_day_number(expanded_df[col].to_numpy()).astype('datetime64[ns]')
+    return expanded_df
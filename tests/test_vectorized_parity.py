@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+import pytest
+from datetime import datetime, timedelta
+from analysis_tools.earnings_estimate_revision_calculator import EarningsEstimateRevisionCalculator
+from analysis_tools.vectorized_revision_engine import VectorizedRevisionEngine, ESTIMATE_FACTOR_COLUMNS
+from analysis_tools.rolling_factor_state import RollingFactorState
+from analysis_tools.sharded_scorer import ShardedScorer
+
+
+AS_OF = datetime(2026, 6, 15, 12, 0)
+CURRENT_TARGET = pd.Timestamp(2026, 12, 31)
+NEXT_TARGET = pd.Timestamp(2027, 12, 31)
+PAST_TARGET = pd.Timestamp(2025, 12, 31)
+
+# Symbols without any tracked row must score 0.0 in every engine
+SYMBOL_LIST = ['STEADY', 'NAN_EPS', 'ZERO_PREVIOUS', 'SINGLE_ROW', 'WINDOW_EDGES', 'OUT_OF_WINDOW', 'NO_HISTORY']
+
+
+def add_run(rows, symbol, days_ago, eps_by_target, analysts=10.0):
+    tracking_date = AS_OF - timedelta(days=days_ago)
+    for target_date, eps in eps_by_target.items():
+        rows.append({
+            'symbol': symbol,
+            'date': target_date,
+            'estimatedEpsAvg': eps,
+            'estimatedEpsHigh': eps,
+            'estimatedEpsLow': eps,
+            'numberAnalystsEstimatedEps': analysts,
+            'tracking_date': tracking_date
+        })
+
+
+def build_history():
+    """
+    Synthetic tracking history with one target per fiscal year, sorted by tracking date like the stores return it.
+    """
+    rows = []
+    # Regular revisions of three targets across both windows
+    for i, days_ago in enumerate(range(120, -1, -6)):
+        add_run(rows, 'STEADY', days_ago, {
+            PAST_TARGET: 2.0 + 0.01 * (i % 4),
+            CURRENT_TARGET: 3.0 + 0.02 * i * (-1) ** i,
+            NEXT_TARGET: 3.5 + 0.03 * i
+        }, analysts=8 + i % 5)
+
+    # Missing consensus and analyst counts in and around the windows
+    for i, days_ago in enumerate([100, 80, 45, 25, 20, 10, 5, 1]):
+        current_eps = np.nan if i in (2, 4) else 1.0 + 0.1 * i
+        next_eps = np.nan if i == 7 else 1.5 - 0.05 * i
+        add_run(rows, 'NAN_EPS', days_ago, {CURRENT_TARGET: current_eps, NEXT_TARGET: next_eps},
+                analysts=np.nan if i in (1, 5) else 12.0)
+
+    # Revisions away from a zero consensus divide by zero
+    for days_ago, current_eps, next_eps in [(28, 0.0, 0.0), (21, 0.5, 0.0), (14, 0.0, -0.2), (7, 0.0, 0.0),
+                                            (3, -0.4, 0.3)]:
+        add_run(rows, 'ZERO_PREVIOUS', days_ago, {CURRENT_TARGET: current_eps, NEXT_TARGET: next_eps})
+
+    add_run(rows, 'SINGLE_ROW', 12, {CURRENT_TARGET: 4.2})
+
+    # Runs just outside, exactly at and just inside the 30 and 90 day window starts
+    for days_ago, eps in [(91, 5.0), (90, 5.2), (89, 5.1), (31, 5.3), (30, 5.5), (29, 5.4), (0, 5.6)]:
+        add_run(rows, 'WINDOW_EDGES', days_ago, {CURRENT_TARGET: eps, NEXT_TARGET: eps + 1.0}, analysts=days_ago)
+
+    for days_ago in [150, 120, 91]:
+        add_run(rows, 'OUT_OF_WINDOW', days_ago, {CURRENT_TARGET: 6.0 + days_ago / 100, NEXT_TARGET: 7.0})
+
+    df = pd.DataFrame(rows)
+    return df.sort_values(['tracking_date', 'symbol'], kind='stable').reset_index(drop=True)
+
+
+def assert_factors_equal(factors_df, expected_df, tolerance=1e-9):
+    assert list(factors_df['symbol']) == list(expected_df['symbol'])
+    for col in ESTIMATE_FACTOR_COLUMNS:
+        left = factors_df[col].astype(float).to_numpy()
+        right = expected_df[col].astype(float).to_numpy()
+        mismatch = ~np.isclose(left, right, rtol=0, atol=tolerance, equal_nan=True)
+        assert not mismatch.any(), \
+            f"{col} differs for {list(factors_df['symbol'][mismatch])}: {left[mismatch]} vs {right[mismatch]}"
+
+
+@pytest.fixture
+def calculator(tmp_path, monkeypatch):
+    # The calculator creates its estimate store and response cache relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return EarningsEstimateRevisionCalculator("test")
+
+
+@pytest.fixture
+def history_df():
+    return build_history()
+
+
+@pytest.fixture
+def expected_df(calculator, history_df):
+    return calculator.calculate_symbol_factors(SYMBOL_LIST, history_df, as_of=AS_OF)
+
+
+def test_history_covers_edge_cases(history_df):
+    edges_df = history_df[history_df['symbol'] == 'WINDOW_EDGES']
+    days_ago = set((AS_OF - edges_df['tracking_date']).dt.days)
+    assert {29, 30, 31, 89, 90, 91} <= days_ago
+    assert history_df['estimatedEpsAvg'].isna().any()
+    assert (history_df['symbol'] == 'SINGLE_ROW').sum() == 1
+
+
+def test_vectorized_engine_matches_per_symbol(calculator, history_df):
+    mismatch_df = VectorizedRevisionEngine().check_parity(calculator, history_df, SYMBOL_LIST, AS_OF)
+    assert mismatch_df.empty, mismatch_df.to_string()
+
+
+def test_vectorized_engine_matches_partitioned_per_symbol(history_df, expected_df):
+    factors_df = VectorizedRevisionEngine().calculate_factors(history_df, SYMBOL_LIST, AS_OF)
+    assert_factors_equal(factors_df, expected_df)
+
+
+def test_no_history_scores_zero(history_df):
+    factors_df = VectorizedRevisionEngine().calculate_factors(history_df, SYMBOL_LIST, AS_OF).set_index('symbol')
+    for symbol in ['NO_HISTORY', 'OUT_OF_WINDOW']:
+        assert (factors_df.loc[symbol, ESTIMATE_FACTOR_COLUMNS] == 0.0).all()
+
+
+def test_rolling_state_matches_per_symbol(history_df, expected_df):
+    state = RollingFactorState(state_dir=None)
+    state.rebuild(history_df)
+    assert_factors_equal(state.calculate_factors(SYMBOL_LIST, AS_OF), expected_df)
+
+
+def test_rolling_state_incremental_updates_match_rebuild(tmp_path, history_df, expected_df):
+    """
+    Applying the runs one by one and persisting the state in between gives the same factors as the history.
+    """
+    state_dir = str(tmp_path / "rolling_factor_state")
+    for tracking_date, run_df in history_df.groupby('tracking_date', sort=True):
+        state = RollingFactorState.load(state_dir)
+        state.update(run_df, tracking_date)
+        state.save()
+    state = RollingFactorState.load(state_dir)
+    assert_factors_equal(state.calculate_factors(SYMBOL_LIST, AS_OF), expected_df)
+
+
+def test_rolling_state_rejects_out_of_order_runs(history_df):
+    state = RollingFactorState(state_dir=None)
+    state.rebuild(history_df)
+    with pytest.raises(ValueError):
+        state.update(history_df.iloc[0:1], history_df['tracking_date'].min())
+
+
+@pytest.mark.parametrize("workers, shard_count", [(1, 1), (2, 3)])
+def test_sharded_scorer_matches_per_symbol(history_df, expected_df, workers, shard_count):
+    factors_df = ShardedScorer(workers=workers, shard_count=shard_count).calculate_factors(history_df, SYMBOL_LIST,
+                                                                                           AS_OF)
+    assert_factors_equal(factors_df, expected_df)
@@ -0,0 +1,205 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from data_loaders.fixture_paths import get_fixture_path
+
+
+API_PREFIX = "/api/v3/"
+
+
+def _get_seed(*parts):
+    return int(hashlib.md5("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:8], 16)
+
+
+def generate_analyst_estimates(symbol, limit=100, as_of=None):
+    """
+    Generates annual analyst estimates that drift slightly from day to day, so that repeated
+    tracking runs see revisions like the real endpoint.
+    """
+    as_of = as_of or date.today()
+    base_eps = 1.0 + (_get_seed(symbol) % 1000) / 100.0
+    estimates = []
+    for year in range(as_of.year + 3, as_of.year - 3, -1):
+        rng = random.Random(_get_seed(symbol, year))
+        eps = base_eps * (1.08 ** (year - as_of.year))
+        # Random walk of daily revisions up to the requested day
+        days = (as_of - date(as_of.year - 1, 1, 1)).days
+        drift = sum(rng.gauss(0, 0.002) if rng.random() < 0.2 else 0.0 for _ in range(days))
+        eps_avg = round(eps * (1 + drift), 4)
+        analysts = 5 + _get_seed(symbol, year, "analysts") % 20
+        estimates.append({
+            'symbol': symbol,
+            'date': f"{year}-12-31",
+            'estimatedEpsAvg': eps_avg,
+            'estimatedEpsHigh': round(eps_avg * 1.1, 4),
+            'estimatedEpsLow': round(eps_avg * 0.9, 4),
+            'numberAnalystsEstimatedEps': int(analysts)
+        })
+    return estimates[:limit]
+
+
+def generate_earnings_surprises(symbol, as_of=None, quarters=8):
+    as_of = as_of or date.today()
+    rng = random.Random(_get_seed(symbol, "surprises"))
+    base_eps = 0.25 + (_get_seed(symbol) % 1000) / 400.0
+    surprises = []
+    for quarter in range(quarters):
+        report_date = as_of - timedelta(days=45 + quarter * 91)
+        estimated = round(base_eps * (1 + rng.gauss(0, 0.05)), 2)
+        surprises.append({
+            'date': report_date.isoformat(),
+            'symbol': symbol,
+            'actualEarningResult': round(estimated * (1 + rng.gauss(0.02, 0.08)), 2),
+            'estimatedEarning': estimated
+        })
+    return surprises
+
+
+class FmpStubRequestHandler(BaseHTTPRequestHandler):
+    server_version = "FmpStub/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        server.count_request()
+
+        # Latency with jitter
+        delay = server.latency + random.uniform(-server.jitter, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        if random.random() < server.error_rate_429:
+            self._send_json(429, {'Error Message': "Limit Reach"}, {'Retry-After': str(server.retry_after)})
+            return
+        if not url.path.startswith(API_PREFIX):
+            self._send_json(404, {'Error Message': f"Unknown path {url.path}"})
+            return
+
+        path = url.path[len(API_PREFIX):]
+        payload = server.get_payload(path, query)
+        if payload is None:
+            self._send_json(404, {'Error Message': f"No fixture for {path}"})
+            return
+        self._send_json(200, payload)
+
+
+class FmpStubServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the FMP API used for offline runs and benchmarks.
+
+    Serves recorded fixtures (see FmpDataLoader record_dir) from fixtures_dir and, if synthetic is
+    set, generates analyst estimates and earnings surprises for symbols without a fixture.
+    Latency, jitter and 429 responses can be injected. Point the loader at base_url.
+
+    Attributes:
+        base_url (str): Base URL to pass to FmpDataLoader.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, fixtures_dir=None, synthetic=True, latency=0.0, jitter=0.0,
+                 error_rate_429=0.0, retry_after=1, verbose=False):
+        super().__init__((host, port), FmpStubRequestHandler)
+        self.fixtures_dir = fixtures_dir
+        self.synthetic = synthetic
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate_429 = error_rate_429
+        self.retry_after = retry_after
+        self.verbose = verbose
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX.rstrip('/')}"
+
+    def count_request(self):
+        with self._lock:
+            self.request_count += 1
+
+    def get_payload(self, path, query):
+        if self.fixtures_dir:
+            try:
+                # Fixtures recorded with the query parameters first, then hand-written ones without them
+                fixture_paths = (get_fixture_path(self.fixtures_dir, path, query),
+                                 get_fixture_path(self.fixtures_dir, path))
+            except ValueError:
+                return None
+            for fixture_path in fixture_paths:
+                if os.path.exists(fixture_path):
+                    with open(fixture_path, "r") as f:
+                        return json.load(f)
+        if not self.synthetic:
+            return None
+
+        parts = path.strip("/").split("/")
+        if parts[0] == "analyst-estimates" and len(parts) == 2:
+            return generate_analyst_estimates(parts[1], limit=int(query.get('limit', 100)))
+        if parts[0] == "earnings-surprises" and len(parts) == 2:
+            return generate_earnings_surprises(parts[1])
+        return None
+
+    def start(self):
+        """
+        Serves requests in a background thread.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the FMP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures-dir", default=None, help="Directory with recorded responses")
+    parser.add_argument("--no-synthetic", action="store_true", help="Only serve recorded fixtures")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate-429", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = FmpStubServer(args.host, args.port, args.fixtures_dir, not args.no_synthetic, args.latency_ms / 1000.0,
+                           args.jitter_ms / 1000.0, args.error_rate_429, args.retry_after, args.verbose)
+    print(f"FMP stand-in listening on {server.base_url} - set FMP_BASE_URL to use it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,36 @@
 from config import *
-from data_loaders.fmp_data_loader import FmpDataLoader, Period
-from data_loaders.market_symbol_loader import MarketSymbolLoader
+from data_loaders.fmp_data_loader import FmpDataLoader, FmpRequestError, Period
+from data_loaders.market_symbol_loader import MarketSymbolLoader, MarketIndex
 from utils.log_utils import *
 from utils.file_utils import *
-from datetime import datetime
+from utils.metrics_utils import metrics
+from storage.estimate_store_factory import create_estimate_store
+from analysis_tools.rolling_factor_state import RollingFactorState
+from trackers.tracker_checkpoint import TrackerCheckpoint
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import pandas as pd
 import os
 
 
+class TrackingRunError(Exception):
+    """
+    Raised when too many symbols failed and the tracking run was not committed, so nothing scores the old history as new.
+    """
+    pass
+
+
 class EstimateTracker:
-    def __init__(self, fmp_api_key):
-        self.fmp_data_loader = FmpDataLoader(fmp_api_key)
+    def __init__(self, fmp_api_key, concurrency=FETCH_CONCURRENCY, fmp_data_loader=None,
+                 market_index=MarketIndex.SNP_500):
+        self.fmp_data_loader = fmp_data_loader or FmpDataLoader(fmp_api_key)
         self.market_symbol_loader = MarketSymbolLoader()
+        self.market_index = market_index
+        self.concurrency = max(1, concurrency)
+        if self.fmp_data_loader.concurrency_limiter is not None:
+            # The adaptive limiter decides how many of the workers have a request in flight
+            self.concurrency = max(self.concurrency, self.fmp_data_loader.concurrency_limiter.max_limit)
+        self.estimate_store = create_estimate_store()
 
     def load_tracking_file(self, file_name):
         # Load quarterly or annual tracking file
@@ -25,45 +44,138 @@ class EstimateTracker:
             ])
         return tracking_df
 
-    def track_estimates(self):
+    def fetch_symbol_estimates(self, symbol, tracking_date):
+        """
+        Fetches the current annual estimates for a symbol and stamps them with the tracking date.
+        """
+        new_estimates_df = self.fmp_data_loader.fetch_analyst_estimates(symbol, Period.ANNUAL, limit=100,
+                                                                        raise_errors=True)
+        if new_estimates_df is None or len(new_estimates_df) == 0:
+            return None
+        new_estimates_df = new_estimates_df[['symbol', 'date', 'estimatedEpsAvg', 'estimatedEpsHigh', 'estimatedEpsLow',
+                                             'numberAnalystsEstimatedEps']].copy()
+
+        # Filter out records from past years
+        new_estimates_df['date'] = pd.to_datetime(new_estimates_df['date'], errors="coerce")
+        new_estimates_df = new_estimates_df[new_estimates_df['date'].dt.year >= tracking_date.year].copy()
+
+        # Add tracking date
+        new_estimates_df['tracking_date'] = tracking_date
+        return new_estimates_df
+
+    def try_fetch_symbol_estimates(self, symbol, tracking_date):
+        """
+        Fetches the estimates of a symbol.
+
+        Returns:
+            tuple: (estimates DataFrame or None if there is no data, True if the request succeeded)
+        """
+        try:
+            return self.fetch_symbol_estimates(symbol, tracking_date), True
+        except FmpRequestError as ex:
+            loge(ex)
+            return None, False
+
+    def fetch_estimates(self, symbol_list, tracking_date, concurrent=USE_CONCURRENT_FETCH):
+        """
+        Fetches estimates for all symbols, either one by one or with a thread pool.
+        Results are (estimates, succeeded) tuples in the order of symbol_list in both modes.
+        """
+        if concurrent and self.concurrency > 1:
+            logd(f"Fetching estimates for {len(symbol_list)} symbols with {self.concurrency} workers...")
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                # map() yields results in submission order
+                return list(executor.map(lambda symbol: self.try_fetch_symbol_estimates(symbol, tracking_date),
+                                         symbol_list))
+        return [self.try_fetch_symbol_estimates(symbol, tracking_date) for symbol in symbol_list]
+
+    def fetch_estimates_checkpointed(self, symbol_list, checkpoint, concurrent=USE_CONCURRENT_FETCH,
+                                     batch_size=TRACKER_BATCH_SIZE):
+        """
+        Fetches the symbols not yet in the checkpoint in batches and commits each batch to it.
+
+        Returns:
+            list: symbols whose request failed. They are not journaled and will be retried on resume.
+        """
+        pending_symbols = [symbol for symbol in symbol_list if symbol not in checkpoint.completed_symbols]
+        failed_symbols = []
+        for batch_start in range(0, len(pending_symbols), batch_size):
+            batch_symbols = pending_symbols[batch_start:batch_start + batch_size]
+            results = self.fetch_estimates(batch_symbols, checkpoint.tracking_date, concurrent=concurrent)
+
+            completed_symbols = [symbol for symbol, (_, succeeded) in zip(batch_symbols, results) if succeeded]
+            failed_symbols += [symbol for symbol, (_, succeeded) in zip(batch_symbols, results) if not succeeded]
+            batch_list = [df for df, _ in results if df is not None and len(df) > 0]
+            batch_df = pd.concat(batch_list, axis=0, ignore_index=True) if batch_list else None
+            checkpoint.commit_batch(batch_df, completed_symbols)
+            logd(f"Checkpointed {len(checkpoint.completed_symbols)} of {len(symbol_list)} symbols")
+        return failed_symbols
+
+    def update_rolling_factor_state(self, new_estimates_df, tracking_date):
+        """
+        Applies the new tracking run to the persisted rolling factor state.
+        """
+        rolling_factor_state = RollingFactorState.load()
+        if rolling_factor_state.can_update(tracking_date):
+            rolling_factor_state.update(new_estimates_df, tracking_date)
+        else:
+            # First run or a rerun of the same day - rebuild from the stored window
+            start_date = tracking_date - timedelta(days=rolling_factor_state.window_days + 1)
+            rolling_factor_state.rebuild(self.estimate_store.load(start_date=start_date))
+        rolling_factor_state.save()
+
+    def log_membership_changes(self, since=None, market_index=None):
+        """
+        Logs the index additions and removals recorded since the given date (default today). Added
+        symbols are tracked from this run on, removed symbols are no longer fetched. Every run is a full
+        snapshot of the estimates, so all current constituents are still fetched on each run.
+        """
+        market_index = market_index or self.market_index
+        changes_df = self.market_symbol_loader.get_membership_changes(market_index, since or datetime.today(),
+                                                                      cache_dir=CACHE_DIR)
+        if changes_df.empty:
+            return
+        added = changes_df.loc[changes_df['change'] == 'added', 'symbol'].tolist()
+        removed = changes_df.loc[changes_df['change'] == 'removed', 'symbol'].tolist()
+        logi(f"{market_index.value} membership changes - added: {added}, removed: {removed}")
+
+    def track_estimates(self, concurrent=USE_CONCURRENT_FETCH, symbol_list=None):
         logi(f"Tracking estimates...")
         # Get list of symbols
-        symbols_df = self.market_symbol_loader.fetch_sp500_symbols(cache_file=True)
-        symbol_list = symbols_df['symbol'].unique()
+        if symbol_list is None:
+            with metrics.stage("symbol_load"):
+                symbols_df = self.market_symbol_loader.fetch_symbols(self.market_index, cache_file=True,
+                                                                     cache_dir=CACHE_DIR)
+            symbol_list = symbols_df['symbol'].unique()
         #symbol_list = symbol_list[:5]
+        self.log_membership_changes()
 
-        # Load existing tracking file
-        estimate_tracking_df = load_csv(CACHE_DIR, ESTIMATE_TRACKING_FILE_NAME)
-        if estimate_tracking_df is None:
-            estimate_tracking_df = pd.DataFrame(columns=[
-                'date', 'tracking_date', 'estimatedEpsAvg', 'estimatedEpsHigh',
-                'estimatedEpsLow', 'numberAnalystsEstimatedEps', 'symbol'
-            ])
-        # Convert dates
-        estimate_tracking_df['date'] = pd.to_datetime(estimate_tracking_df['date'], errors="coerce")
-        estimate_tracking_df['tracking_date'] = pd.to_datetime(estimate_tracking_df['tracking_date'], errors="coerce")
-
-        # Fetch new estimates
-        for symbol in symbol_list:
-            # Fetch new estimates
-            new_estimates_df = self.fmp_data_loader.fetch_analyst_estimates(symbol, Period.ANNUAL, limit=100)
-            if new_estimates_df is None or len(new_estimates_df) == 0:
-                continue
-            new_estimates_df = new_estimates_df[['symbol', 'date', 'estimatedEpsAvg', 'estimatedEpsHigh', 'estimatedEpsLow',
-                                                 'numberAnalystsEstimatedEps']]
-
-            # Filter out records from past years
-            new_estimates_df['date'] = pd.to_datetime(new_estimates_df['date'], errors="coerce")
-
-            # Filter out records from past years
-            new_estimates_df = new_estimates_df[new_estimates_df['date'].dt.year >= datetime.today().year]
-
-            # Add tracking date
-            new_estimates_df['tracking_date'] = datetime.today()
-
-            # Add to existing estimates
-            estimate_tracking_df = pd.concat([estimate_tracking_df, new_estimates_df], axis=0, ignore_index=True)
-
-        # Store records
-        path = os.path.join(CACHE_DIR, ESTIMATE_TRACKING_FILE_NAME)
-        estimate_tracking_df.to_csv(path, index=False)
+        # Fetch new estimates, resuming an interrupted run of the same day
+        checkpoint = TrackerCheckpoint(datetime.today())
+        checkpoint.open()
+        tracking_date = checkpoint.tracking_date
+        with metrics.stage("fetch"):
+            failed_symbols = self.fetch_estimates_checkpointed(symbol_list, checkpoint, concurrent=concurrent)
+        if len(failed_symbols) > TRACKER_MAX_FAILED_SYMBOLS:
+            raise TrackingRunError(f"{len(failed_symbols)} symbols failed - run not committed. "
+                                   f"Run the tracker again to resume.")
+        if failed_symbols:
+            logw(f"No estimates tracked for failed symbols: {failed_symbols}")
+
+        # Store records - only the new rows are written
+        new_estimates_df = checkpoint.load_batches()
+        if new_estimates_df is not None:
+            # Keep the symbol order of a single uninterrupted run
+            symbol_position = {symbol: i for i, symbol in enumerate(symbol_list)}
+            new_estimates_df = new_estimates_df.sort_values(
+                by='symbol', key=lambda symbols: symbols.map(symbol_position), kind='stable').reset_index(drop=True)
+            with metrics.stage("store"):
+                self.estimate_store.append(new_estimates_df, tracking_date)
+            metrics.increment("tracked_rows", len(new_estimates_df))
+            if ROLLING_FACTOR_STATE_ENABLED:
+                with metrics.stage("rolling_state_update"):
+                    self.update_rolling_factor_state(new_estimates_df, tracking_date)
+        checkpoint.remove()
+        logi(f"FMP request stats: {self.fmp_data_loader.get_request_stats()}")
+        self.fmp_data_loader.log_limiter_metrics(os.path.join(LOG_DIR, "fmp_limiter_timeline.csv"))
+        self.fmp_data_loader.log_cache_stats()
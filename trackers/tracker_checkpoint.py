@@ -0,0 +1,114 @@
+import json
+import os
+import shutil
+import pandas as pd
+from config import *
+from utils.log_utils import *
+
+
+class TrackerCheckpoint:
+    """
+    Per-run checkpoint of a tracking run, stored under <checkpoint_dir>/<tracking day>/:
+
+        meta.json            tracking date of the run
+        batch_00000.parquet  fetched estimates of one batch of symbols
+        journal.jsonl        one line per committed batch: batch file and the symbols it covers
+
+    Batch files are written atomically before their journal line, and only journaled batches
+    are read back, so a crash at any point leaves a consistent checkpoint to resume from.
+    A journal line counts once its trailing newline is written; a torn last line is truncated on open.
+
+    Attributes:
+        run_dir (str): Checkpoint directory of the tracking day.
+        tracking_date (datetime): Tracking date shared by all batches of the run.
+    """
+
+    def __init__(self, tracking_date, checkpoint_dir=TRACKER_CHECKPOINT_DIR):
+        self.run_dir = os.path.join(checkpoint_dir, pd.Timestamp(tracking_date).strftime("%Y-%m-%d"))
+        self.meta_path = os.path.join(self.run_dir, "meta.json")
+        self.journal_path = os.path.join(self.run_dir, "journal.jsonl")
+        self.tracking_date = pd.Timestamp(tracking_date).to_pydatetime()
+        self.completed_symbols = set()
+        self.batch_files = []
+
+    def open(self):
+        """
+        Opens the checkpoint of the tracking day, resuming an interrupted run if one exists.
+
+        Returns:
+            bool: True if an interrupted run was found.
+        """
+        os.makedirs(self.run_dir, exist_ok=True)
+        resumed = os.path.exists(self.meta_path)
+        if resumed:
+            with open(self.meta_path, "r") as f:
+                self.tracking_date = pd.Timestamp(json.load(f)['tracking_date']).to_pydatetime()
+            self._read_journal()
+            logi(f"Resuming tracking run of {self.tracking_date} with {len(self.completed_symbols)} symbols done")
+        else:
+            self._write_atomic(self.meta_path, json.dumps({'tracking_date': self.tracking_date.isoformat()}))
+        return resumed
+
+    def _read_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "rb") as f:
+            data = f.read()
+        # Only lines ending with a newline are committed. A torn last line of a crashed write is cut off,
+        # so the next append starts on a line of its own
+        committed_size = data.rfind(b"\n") + 1
+        if committed_size < len(data):
+            logw(f"Truncating torn journal line of {len(data) - committed_size} bytes in {self.journal_path}")
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(committed_size)
+                f.flush()
+                os.fsync(f.fileno())
+        for line in data[:committed_size].decode("utf-8").splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                loge(f"Skipping invalid journal line in {self.journal_path}: {line[:100]}")
+                continue
+            self.completed_symbols.update(entry['symbols'])
+            if entry.get('batch_file'):
+                self.batch_files.append(entry['batch_file'])
+
+    @staticmethod
+    def _write_atomic(path, text):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def commit_batch(self, batch_df: pd.DataFrame, symbols):
+        """
+        Stores the estimates of a batch and records its symbols as completed.
+        Symbols without data are recorded too so they are not fetched again.
+        """
+        batch_file = None
+        if batch_df is not None and not batch_df.empty:
+            batch_file = f"batch_{len(self.batch_files):05d}.parquet"
+            path = os.path.join(self.run_dir, batch_file)
+            batch_df.to_parquet(f"{path}.tmp", index=False)
+            os.replace(f"{path}.tmp", path)
+            self.batch_files.append(batch_file)
+
+        with open(self.journal_path, "a") as f:
+            f.write(json.dumps({'batch_file': batch_file, 'symbols': list(symbols)}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.completed_symbols.update(symbols)
+
+    def load_batches(self) -> pd.DataFrame:
+        """
+        Returns all journaled estimates of the run, or None if there are none.
+        """
+        batch_list = [pd.read_parquet(os.path.join(self.run_dir, batch_file)) for batch_file in self.batch_files]
+        if not batch_list:
+            return None
+        return pd.concat(batch_list, axis=0, ignore_index=True)
+
+    def remove(self):
+        shutil.rmtree(self.run_dir, ignore_errors=True)
@@ -0,0 +1,176 @@
+import csv
+import os
+import threading
+import time
+
+
+class CircuitState:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised by AdaptiveConcurrencyLimiter.acquire while the circuit breaker is open.
+    """
+    pass
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limiter for the number of in-flight requests with a circuit breaker.
+
+    The limit grows additively (about +1 per limit's worth of healthy responses) while latency stays
+    within latency_tolerance of the best observed latency, and is cut multiplicatively on 429/5xx
+    responses and connection errors. After failure_threshold consecutive failures the circuit opens
+    and requests fail fast for open_seconds, then a single probe request decides whether to close it.
+
+    Attributes:
+        limit (float): Current concurrency limit.
+        state (str): Circuit breaker state, one of CircuitState.
+    """
+
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=32, backoff_ratio=0.5, latency_tolerance=2.0,
+                 failure_threshold=10, open_seconds=30.0, sample_interval=1.0):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.sample_interval = sample_interval
+
+        self.state = CircuitState.CLOSED
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._consecutive_failures = 0
+        self._min_latency = None
+        self._last_decrease = 0.0
+
+        self._start_time = time.monotonic()
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._last_sample_time = self._start_time
+        self._last_sample_completed = 0
+        self.timeline = []
+
+    def acquire(self):
+        """
+        Blocks until a request slot is free.
+
+        Returns:
+            bool: True if the request is the half-open probe. Pass it on to release().
+
+        Raises:
+            CircuitOpenError: if the circuit is open.
+        """
+        with self._condition:
+            while True:
+                if self.state == CircuitState.OPEN:
+                    if time.monotonic() - self._opened_at < self.open_seconds:
+                        self._rejected += 1
+                        raise CircuitOpenError("FMP circuit breaker is open")
+                    self.state = CircuitState.HALF_OPEN
+                if self.state == CircuitState.HALF_OPEN:
+                    # Only one probe request at a time
+                    if not self._probe_in_flight:
+                        self._probe_in_flight = True
+                        self.in_flight += 1
+                        return True
+                elif self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return False
+                self._condition.wait(timeout=0.5)
+
+    def release(self, latency: float, succeeded: bool, probe: bool = False):
+        """
+        Returns a request slot and adapts the limit.
+
+        Parameters:
+            latency (float): Request latency in seconds.
+            succeeded (bool): False for 429/5xx responses and connection errors.
+            probe (bool): Value returned by acquire(). Only the probe closes or reopens a half-open circuit,
+                requests started before the circuit opened do not.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if probe and self.state == CircuitState.HALF_OPEN:
+                self._probe_in_flight = False
+                self.state = CircuitState.CLOSED if succeeded else CircuitState.OPEN
+                if not succeeded:
+                    self._opened_at = now
+
+            if succeeded:
+                self._completed += 1
+                self._consecutive_failures = 0
+                self._min_latency = latency if self._min_latency is None else min(self._min_latency, latency)
+                if latency <= self._min_latency * self.latency_tolerance:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                else:
+                    self._decrease(now)
+            else:
+                self._failed += 1
+                self._consecutive_failures += 1
+                self._decrease(now)
+                if self._consecutive_failures >= self.failure_threshold and self.state == CircuitState.CLOSED:
+                    self.state = CircuitState.OPEN
+                    self._opened_at = now
+
+            if now - self._last_sample_time >= self.sample_interval:
+                self._record_sample(now)
+            self._condition.notify_all()
+
+    def _decrease(self, now):
+        # Requests in flight during a decrease report the same congestion, so decrease at most once per latency
+        if now - self._last_decrease < (self._min_latency or 0.0):
+            return
+        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        self._last_decrease = now
+
+    def _record_sample(self, now):
+        elapsed = now - self._last_sample_time
+        requests_per_second = (self._completed - self._last_sample_completed) / elapsed if elapsed > 0 else 0.0
+        self.timeline.append({
+            'elapsed_seconds': round(now - self._start_time, 3),
+            'limit': round(self.limit, 2),
+            'in_flight': self.in_flight,
+            'state': self.state,
+            'requests_per_second': round(requests_per_second, 2),
+            'completed': self._completed,
+            'failed': self._failed
+        })
+        self._last_sample_time = now
+        self._last_sample_completed = self._completed
+
+    def get_metrics(self) -> dict:
+        with self._condition:
+            elapsed = time.monotonic() - self._start_time
+            return {
+                'limit': round(self.limit, 2),
+                'state': self.state,
+                'completed': self._completed,
+                'failed': self._failed,
+                'rejected': self._rejected,
+                'requests_per_second': round(self._completed / elapsed, 2) if elapsed > 0 else 0.0,
+                'min_latency': round(self._min_latency, 4) if self._min_latency is not None else None
+            }
+
+    def export_timeline(self, path):
+        """
+        Writes the limiter state over time to a CSV file.
+        """
+        with self._condition:
+            timeline = list(self.timeline)
+        if not timeline:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(timeline[0].keys()))
+            writer.writeheader()
+            writer.writerows(timeline)
@@ -1,24 +1,23 @@
 import pandas as pd
 import numpy as np
 from config import *
-from sklearn.preprocessing import MinMaxScaler
+from utils.normalization_utils import normalize_factors, winsorize_matrix
 import os
 
 
-def normalize_dataframe(df: pd.DataFrame, column_list: list):
-    scaler = MinMaxScaler(feature_range=(0, 100))
-
+def normalize_dataframe(df: pd.DataFrame, column_list: list, mode=NORMALIZATION_MODE, group_labels=None):
     # Check if columns exist and if they have more than one unique value
+    scale_columns = []
     for col in column_list:
         if col == 'symbol':
             continue
         if col in df.columns and len(df[col].dropna().unique()) > 1:
-            # Reshape data for scaler
-            df[col] = scaler.fit_transform(df[[col]])  # Double brackets keep the DataFrame structure
+            scale_columns.append(col)
         else:
             print(f"Warning: Column {col} not found or not enough data to scale in DataFrame")
 
-    return df
+    # All columns in one pass, 0-100 for min-max and percentile ranks
+    return normalize_factors(df, scale_columns, mode=mode, group_labels=group_labels)
 
 
 def round_dataframe_columns(df, precision=4):
@@ -37,18 +36,10 @@ def round_dataframe_columns(df, precision=4):
     return df
 
 
-def cap_outliers(df, column_name):
-    # Calculate mean and standard deviation
-    mean_factor = df[column_name].mean()
-    std_factor = df[column_name].std()
-
-    # Define cutoffs for outliers
-    upper_limit = mean_factor + OUTLIER_STD_MULTIPLIER * std_factor
-    lower_limit = mean_factor - OUTLIER_STD_MULTIPLIER * std_factor
-
-    # Cap values
-    df[column_name] = np.where(df[column_name] > upper_limit, upper_limit, df[column_name])
-    df[column_name] = np.where(df[column_name] < lower_limit, lower_limit, df[column_name])
+def cap_outliers(df, column_name, std_multiplier=OUTLIER_STD_MULTIPLIER):
+    # Cap values at mean +/- std_multiplier standard deviations
+    values = df[[column_name]].to_numpy(dtype=float, na_value=np.nan)
+    df[column_name] = winsorize_matrix(values, sigma=std_multiplier)[:, 0]
 
     return df
 
@@ -0,0 +1,282 @@
+import csv
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from config import *
+from utils.log_utils import *
+from utils.metrics_utils import metrics
+
+
+class MisfirePolicy:
+    CATCH_UP = "catch_up"
+    SKIP = "skip"
+
+
+JOB_RUN_COLUMNS = ['job', 'due_at', 'started_at', 'finished_at', 'queue_delay_seconds', 'duration_seconds', 'status']
+
+
+class JobLock:
+    """
+    Lock file that keeps two runs of a job from overlapping, also across processes.
+    The file holds the owner's pid, so a lock left behind by a dead process is taken over.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def acquire(self) -> bool:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        for _ in range(2):
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self._is_stale():
+                    logw(f"Removing stale lock {self.path}")
+                    os.remove(self.path)
+                    continue
+                return False
+            with os.fdopen(fd, "w") as f:
+                f.write(str(os.getpid()))
+            return True
+        return False
+
+    def _is_stale(self) -> bool:
+        try:
+            with open(self.path, "r") as f:
+                pid = int(f.read().strip() or 0)
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except (ValueError, FileNotFoundError):
+            return True
+        except PermissionError:
+            # The process exists but belongs to another user
+            return False
+        return False
+
+    def release(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class ScheduledJob:
+    """
+    A job due on the given weekdays (0 = Monday) at a local time, or after the jobs it depends on.
+
+    Attributes:
+        name (str): Job name, used for the lock file and the run history.
+        depends_on (list): Names of the jobs that must succeed before this job runs.
+    """
+
+    def __init__(self, name, fn, weekdays=None, at=None, depends_on=None):
+        self.name = name
+        self.fn = fn
+        self.weekdays = set(weekdays) if weekdays is not None else set(range(7))
+        self.at = datetime.strptime(at, "%H:%M").time() if at else None
+        self.depends_on = list(depends_on or [])
+
+    def is_timed(self) -> bool:
+        return self.at is not None
+
+    def get_next_due(self, after: datetime) -> datetime:
+        """
+        Returns the first due time strictly after the given time.
+        """
+        for day_offset in range(8):
+            day = after.date() + timedelta(days=day_offset)
+            due = datetime.combine(day, self.at)
+            if due > after and day.weekday() in self.weekdays:
+                return due
+        raise ValueError(f"Job {self.name} has no weekdays")
+
+    def get_last_due(self, before: datetime) -> datetime:
+        """
+        Returns the most recent due time at or before the given time.
+        """
+        for day_offset in range(8):
+            day = before.date() - timedelta(days=day_offset)
+            due = datetime.combine(day, self.at)
+            if due <= before and day.weekday() in self.weekdays:
+                return due
+        raise ValueError(f"Job {self.name} has no weekdays")
+
+
+class JobScheduler:
+    """
+    Runs scheduled jobs without polling.
+
+    The scheduler thread sleeps until the next due time and hands due jobs to a single worker
+    thread, so a long run never blocks scheduling. Jobs hold a lock file while they run. Dependent
+    jobs run after their upstream job succeeds and are skipped when it fails.
+
+    Runs that were missed while the process was down, or while the previous run was still going,
+    are handled by the misfire policy: "catch_up" runs a missed job once as soon as possible
+    (if it is not older than misfire_grace_seconds), "skip" waits for the next due time.
+    Every run is appended to the run history with its queue delay (start minus due time) and duration.
+    """
+
+    def __init__(self, misfire_policy=JOB_MISFIRE_POLICY, misfire_grace_seconds=JOB_MISFIRE_GRACE_SECONDS,
+                 state_dir=JOB_STATE_DIR, history_path=JOB_RUN_HISTORY_PATH):
+        self.misfire_policy = misfire_policy
+        self.misfire_grace_seconds = misfire_grace_seconds
+        self.state_dir = state_dir
+        self.history_path = history_path
+        self.jobs = {}
+        self._next_due = {}
+        self._pending = set()
+        # Due time of the one rerun per job that waits for its running or queued run
+        self._reruns = {}
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-worker")
+
+    def add_job(self, name, fn, weekdays=None, at=None, depends_on=None):
+        for upstream in depends_on or []:
+            if upstream not in self.jobs:
+                raise ValueError(f"Job {name} depends on unknown job {upstream}")
+        job = ScheduledJob(name, fn, weekdays, at, depends_on)
+        if not job.is_timed() and not job.depends_on:
+            raise ValueError(f"Job {name} needs a time or an upstream job")
+        self.jobs[name] = job
+        return job
+
+    def _get_state_path(self):
+        return os.path.join(self.state_dir, "scheduler_state.json")
+
+    def _load_state(self) -> dict:
+        path = self._get_state_path()
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def _save_last_due(self, job_name, due: datetime):
+        with self._lock:
+            state = self._load_state()
+            state[job_name] = due.isoformat()
+            os.makedirs(self.state_dir, exist_ok=True)
+            path = self._get_state_path()
+            with open(f"{path}.tmp", "w") as f:
+                json.dump(state, f)
+            os.replace(f"{path}.tmp", path)
+
+    def _record_run(self, job_name, due, started_at, finished_at, status):
+        queue_delay = (started_at - due).total_seconds()
+        duration = (finished_at - started_at).total_seconds()
+        metrics.record_stage(f"job_{job_name}", duration)
+        os.makedirs(os.path.dirname(os.path.abspath(self.history_path)), exist_ok=True)
+        write_header = not os.path.exists(self.history_path)
+        with open(self.history_path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if write_header:
+                writer.writerow(JOB_RUN_COLUMNS)
+            writer.writerow([job_name, due.isoformat(), started_at.isoformat(), finished_at.isoformat(),
+                             round(queue_delay, 3), round(duration, 3), status])
+        logi(f"Job {job_name} {status} - queue delay {queue_delay:.1f}s, duration {duration:.1f}s")
+
+    def _get_downstream_jobs(self, job_name) -> list:
+        return [job for job in self.jobs.values() if job_name in job.depends_on]
+
+    def _run_job(self, job: ScheduledJob, due: datetime):
+        """
+        Runs a job and then its dependent jobs in the worker thread.
+        """
+        started_at = datetime.now()
+        lock = JobLock(os.path.join(self.state_dir, f"{job.name}.lock"))
+        status = "succeeded"
+        if not lock.acquire():
+            logw(f"Job {job.name} is already running in another process - skipping this run")
+            status = "skipped_locked"
+        else:
+            try:
+                job.fn()
+            except Exception as ex:
+                loge(f"Job {job.name} failed: {ex}")
+                status = "failed"
+            finally:
+                lock.release()
+        finished_at = datetime.now()
+        self._record_run(job.name, due, started_at, finished_at, status)
+
+        for downstream_job in self._get_downstream_jobs(job.name):
+            if status == "succeeded":
+                # Dependent jobs are due when their upstream job finishes
+                self._run_job(downstream_job, finished_at)
+            else:
+                self._record_run(downstream_job.name, finished_at, finished_at, finished_at, "skipped_upstream")
+
+        with self._lock:
+            rerun_due = self._reruns.pop(job.name, None)
+            if rerun_due is None:
+                self._pending.discard(job.name)
+        if rerun_due is not None:
+            self._executor.submit(self._run_job, job, rerun_due)
+
+    def _submit(self, job: ScheduledJob, due: datetime):
+        with self._lock:
+            is_pending = job.name in self._pending
+            if is_pending and self.misfire_policy != MisfirePolicy.SKIP:
+                # Later due times replace an earlier rerun, so a job runs once afterwards however many runs it missed
+                self._reruns[job.name] = due
+            self._pending.add(job.name)
+        if is_pending:
+            if self.misfire_policy == MisfirePolicy.SKIP:
+                logw(f"Job {job.name} due at {due} is still running or queued - skipping this run")
+            else:
+                logw(f"Job {job.name} due at {due} is still running or queued - it will run once afterwards")
+        self._save_last_due(job.name, due)
+        if not is_pending:
+            self._executor.submit(self._run_job, job, due)
+
+    def _handle_missed_runs(self, now: datetime):
+        state = self._load_state()
+        for job in self.jobs.values():
+            if not job.is_timed():
+                continue
+            last_due = job.get_last_due(now)
+            last_run_due = datetime.fromisoformat(state[job.name]) if job.name in state else None
+            if last_run_due is None:
+                # First start - nothing was missed
+                self._save_last_due(job.name, last_due)
+                continue
+            if last_due <= last_run_due:
+                continue
+            missed_seconds = (now - last_due).total_seconds()
+            if self.misfire_policy == MisfirePolicy.CATCH_UP and \
+                    (self.misfire_grace_seconds is None or missed_seconds <= self.misfire_grace_seconds):
+                logi(f"Job {job.name} missed its run due at {last_due} - catching up")
+                self._submit(job, last_due)
+            else:
+                logw(f"Job {job.name} missed its run due at {last_due} - skipping it")
+                self._save_last_due(job.name, last_due)
+
+    def run_forever(self):
+        """
+        Schedules jobs until stop() is called.
+        """
+        now = datetime.now()
+        self._handle_missed_runs(now)
+        self._next_due = {job.name: job.get_next_due(now) for job in self.jobs.values() if job.is_timed()}
+        while not self._stopped:
+            next_name = min(self._next_due, key=self._next_due.get)
+            next_due = self._next_due[next_name]
+            logd(f"Next job: {next_name} at {next_due}")
+            # Sleep in chunks so clock changes (e.g. suspend) are noticed
+            wait_seconds = (next_due - datetime.now()).total_seconds()
+            if wait_seconds > 0:
+                self._wake_event.wait(min(wait_seconds, 3600))
+                continue
+            for job_name, due in list(self._next_due.items()):
+                if due <= datetime.now():
+                    self._submit(self.jobs[job_name], due)
+                    self._next_due[job_name] = self.jobs[job_name].get_next_due(due)
+        self._executor.shutdown(wait=True)
+
+    def stop(self):
+        self._stopped = True
+        self._wake_event.set()
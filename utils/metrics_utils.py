@@ -0,0 +1,227 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import *
+from utils.log_utils import *
+
+
+class LatencyHistogram:
+    """
+    Cumulative latency histogram with fixed bucket bounds in seconds, as in the Prometheus histogram type.
+    """
+
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        self.buckets = sorted(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.bucket_counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float):
+        """
+        Returns the upper bound of the bucket holding the q quantile, or the max for the overflow bucket.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, self.bucket_counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': round(self.max, 6),
+            'buckets': {str(bound): bucket_count for bound, bucket_count in zip(self.buckets, self.bucket_counts)},
+            'overflow': self.bucket_counts[-1]
+        }
+
+
+class MetricsRegistry:
+    """
+    Thread-safe collection of the metrics of one run.
+
+    Stages are timed with the stage() context manager. Stages entered from several worker threads add up
+    their durations, so 'seconds' can exceed the wall time of the run. Request latencies are kept in one
+    histogram per endpoint and counters hold rows and bytes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now()
+            self.stages = {}
+            self.latencies = {}
+            self.counters = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - start)
+
+    def record_stage(self, name: str, seconds: float):
+        with self._lock:
+            stage = self.stages.setdefault(name, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            stage['count'] += 1
+            stage['seconds'] += seconds
+            stage['max_seconds'] = max(stage['max_seconds'], seconds)
+
+    def observe_latency(self, endpoint: str, seconds: float):
+        with self._lock:
+            if endpoint not in self.latencies:
+                self.latencies[endpoint] = LatencyHistogram()
+            self.latencies[endpoint].observe(seconds)
+
+    def increment(self, name: str, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'started_at': self.started_at.isoformat(),
+                'elapsed_seconds': round((datetime.now() - self.started_at).total_seconds(), 3),
+                'stages': {name: {**stage, 'seconds': round(stage['seconds'], 6),
+                                  'max_seconds': round(stage['max_seconds'], 6)}
+                           for name, stage in self.stages.items()},
+                'latencies': {endpoint: histogram.to_dict() for endpoint, histogram in self.latencies.items()},
+                'counters': dict(self.counters)
+            }
+
+    def write_json(self, metrics_dir=METRICS_DIR) -> str:
+        """
+        Writes the metrics of the run to <metrics_dir>/run_<start time>.json and returns the path.
+        """
+        os.makedirs(metrics_dir, exist_ok=True)
+        path = os.path.join(metrics_dir, f"run_{self.started_at.strftime('%Y%m%d_%H%M%S')}.json")
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
+
+    def to_prometheus_text(self) -> str:
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = ["# TYPE estimate_revision_stage_seconds_total counter",
+                 "# TYPE estimate_revision_stage_runs_total counter"]
+        with self._lock:
+            for name, stage in self.stages.items():
+                lines.append(f'estimate_revision_stage_seconds_total{{stage="{name}"}} {stage["seconds"]:.6f}')
+                lines.append(f'estimate_revision_stage_runs_total{{stage="{name}"}} {stage["count"]}')
+
+            lines.append("# TYPE estimate_revision_request_seconds histogram")
+            for endpoint, histogram in self.latencies.items():
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, histogram.bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'estimate_revision_request_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} '
+                                 f'{cumulative}')
+                lines.append(f'estimate_revision_request_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} '
+                             f'{histogram.count}')
+                lines.append(f'estimate_revision_request_seconds_sum{{endpoint="{endpoint}"}} {histogram.sum:.6f}')
+                lines.append(f'estimate_revision_request_seconds_count{{endpoint="{endpoint}"}} {histogram.count}')
+
+            for name, value in self.counters.items():
+                lines.append(f"# TYPE estimate_revision_{name}_total counter")
+                lines.append(f"estimate_revision_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Registry of the current run, shared by the loaders, tracker and calculator
+metrics = MetricsRegistry()
+
+
+class _PrometheusHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.to_prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_prometheus_server(port=METRICS_PROMETHEUS_PORT, registry=None, host=METRICS_PROMETHEUS_HOST):
+    """
+    Serves the registry at http://<host>:<port>/metrics from a daemon thread. Returns the server.
+    """
+    server = ThreadingHTTPServer((host, port), _PrometheusHandler)
+    server.daemon_threads = True
+    server.registry = registry or metrics
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logi(f"Prometheus metrics served on {host}:{server.server_address[1]}")
+    return server
+
+
+@contextmanager
+def profile_run(profiler=PROFILE_RUN, output_dir=METRICS_DIR):
+    """
+    Profiles the enclosed block with "cprofile" or "pyinstrument". Does nothing if profiler is None.
+    cProfile output is a .prof file for pstats/snakeviz, pyinstrument output an HTML report.
+    """
+    if not profiler:
+        yield
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+    file_stem = os.path.join(output_dir, f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    if profiler == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logw("pyinstrument is not installed - falling back to cProfile")
+            profiler = "cprofile"
+
+    if profiler == "pyinstrument":
+        pyinstrument_profiler = Profiler()
+        pyinstrument_profiler.start()
+        try:
+            yield
+        finally:
+            pyinstrument_profiler.stop()
+            with open(f"{file_stem}.html", "w") as f:
+                f.write(pyinstrument_profiler.output_html())
+            logi(f"Profile stored to: {file_stem}.html")
+    elif profiler == "cprofile":
+        import cProfile
+        cprofile_profiler = cProfile.Profile()
+        cprofile_profiler.enable()
+        try:
+            yield
+        finally:
+            cprofile_profiler.disable()
+            cprofile_profiler.dump_stats(f"{file_stem}.prof")
+            logi(f"Profile stored to: {file_stem}.prof")
+    else:
+        raise ValueError(f"Unsupported profiler: {profiler}")
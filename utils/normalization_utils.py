@@ -0,0 +1,217 @@
+"""
+Cross-sectional normalization of a factor matrix (symbols x factors) with NumPy.
+
+Every (factor, group) pair is a cell of its own: the matrix is flattened column by column and
+each value gets the cell id column * group_count + group. Statistics are computed for all cells at
+once with np.bincount, ufunc.at and one lexsort, so there is no Python loop over factors or groups.
+Without groups there is one group, so each factor is normalized over the whole universe.
+
+NaN and +/-inf are missing values: they are left out of the statistics and are NaN in the result.
+"""
+import numpy as np
+import pandas as pd
+from config import *
+
+
+class NormalizationMode:
+    MIN_MAX = "min_max"
+    Z_SCORE = "z_score"
+    PERCENTILE_RANK = "percentile_rank"
+
+
+def get_symbol_groups(symbols_df: pd.DataFrame, group_column=NORMALIZATION_GROUP_COLUMN) -> dict:
+    """
+    Returns the group (e.g. GICS sector) of each symbol of a symbol table, empty if grouping is
+    disabled or the table has no such column.
+    """
+    if group_column is None or symbols_df is None or group_column not in symbols_df.columns:
+        return {}
+    return symbols_df.drop_duplicates('symbol').set_index('symbol')[group_column].to_dict()
+
+
+def get_group_codes(group_labels, row_count=None):
+    """
+    Returns int64 group codes (0..group_count-1) and the group count. Missing labels form a group of their own.
+    """
+    if group_labels is None:
+        return np.zeros(row_count, dtype=np.int64), 1
+    codes, uniques = pd.factorize(pd.Series(group_labels), use_na_sentinel=True)
+    codes = np.where(codes < 0, len(uniques), codes).astype(np.int64)
+    return codes, len(uniques) + int((codes == len(uniques)).any())
+
+
+class _CellLayout:
+    """
+    Flattened view of a factor matrix with one cell per (factor, group) pair.
+    """
+
+    def __init__(self, values: np.ndarray, group_codes: np.ndarray, group_count: int):
+        self.shape = values.shape
+        row_count, column_count = values.shape
+        # Column-major flattening keeps the cells of one factor together
+        self.values = np.asarray(values, dtype=np.float64).ravel(order='F').copy()
+        self.valid = np.isfinite(self.values)
+        self.values[~self.valid] = np.nan
+        self.cells = (np.repeat(np.arange(column_count), row_count) * group_count + np.tile(group_codes, column_count))
+        self.cell_count = column_count * group_count
+        self.counts = np.bincount(self.cells[self.valid], minlength=self.cell_count)
+        self._sort = None
+
+    def to_matrix(self, flat_values: np.ndarray) -> np.ndarray:
+        return flat_values.reshape(self.shape, order='F')
+
+    def get_mean_std(self):
+        cells = self.cells[self.valid]
+        values = self.values[self.valid]
+        sums = np.bincount(cells, weights=values, minlength=self.cell_count)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / self.counts
+            squared_deviations = np.bincount(cells, weights=(values - means[cells]) ** 2, minlength=self.cell_count)
+            # Sample standard deviation, like pandas
+            stds = np.sqrt(squared_deviations / (self.counts - 1))
+        return means, stds
+
+    def get_min_max(self):
+        mins = np.full(self.cell_count, np.inf)
+        maxs = np.full(self.cell_count, -np.inf)
+        np.minimum.at(mins, self.cells[self.valid], self.values[self.valid])
+        np.maximum.at(maxs, self.cells[self.valid], self.values[self.valid])
+        return mins, maxs
+
+    def get_sort(self):
+        """
+        Returns the order that sorts the values by (cell, value) and the first sorted position of each cell.
+        Missing values sort last within their cell.
+        """
+        if self._sort is None:
+            order = np.lexsort((self.values, self.cells))
+            starts = np.searchsorted(self.cells[order], np.arange(self.cell_count))
+            self._sort = order, starts
+        return self._sort
+
+    def get_quantiles(self, q: float) -> np.ndarray:
+        """
+        Returns the q-quantile of each cell with linear interpolation, like np.nanquantile.
+        """
+        order, starts = self.get_sort()
+        sorted_values = self.values[order]
+        positions = q * np.maximum(self.counts - 1, 0)
+        lower = np.floor(positions).astype(np.int64)
+        upper = np.ceil(positions).astype(np.int64)
+        has_values = self.counts > 0
+        lower_values = np.where(has_values, sorted_values[np.minimum(starts + lower, len(sorted_values) - 1)], np.nan)
+        upper_values = np.where(has_values, sorted_values[np.minimum(starts + upper, len(sorted_values) - 1)], np.nan)
+        return lower_values + (upper_values - lower_values) * (positions - lower)
+
+    def get_percentile_ranks(self) -> np.ndarray:
+        """
+        Returns (rank - 1) / (count - 1) within each cell, with ties getting their average rank.
+        """
+        order, starts = self.get_sort()
+        if len(order) == 0:
+            return np.empty(0)
+        sorted_cells = self.cells[order]
+        sorted_values = self.values[order]
+        positions = np.arange(len(order)) - starts[sorted_cells]
+        # Runs of equal values within a cell share the average of their positions
+        run_starts = np.ones(len(order), dtype=bool)
+        run_starts[1:] = (sorted_cells[1:] != sorted_cells[:-1]) | (sorted_values[1:] != sorted_values[:-1])
+        run_ends = np.append(run_starts[1:], True)
+        run_ids = np.cumsum(run_starts) - 1
+        average_positions = ((positions[run_starts] + positions[run_ends]) / 2)[run_ids]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sorted_ranks = average_positions / (self.counts[sorted_cells] - 1)
+        ranks = np.empty(len(order))
+        ranks[order] = sorted_ranks
+        ranks[~self.valid] = np.nan
+        return ranks
+
+
+def _winsorize_cells(layout: _CellLayout, sigma=None, quantiles=None):
+    if sigma is not None:
+        means, stds = layout.get_mean_std()
+        stds = np.nan_to_num(stds)
+        lower, upper = means - sigma * stds, means + sigma * stds
+    elif quantiles is not None:
+        lower, upper = layout.get_quantiles(quantiles[0]), layout.get_quantiles(quantiles[1])
+    else:
+        return
+    # Clipping is monotonic, so a cached sort order stays valid
+    layout.values = np.clip(layout.values, lower[layout.cells], upper[layout.cells])
+
+
+def winsorize_matrix(values: np.ndarray, group_codes=None, group_count=1, sigma=None, quantiles=None) -> np.ndarray:
+    """
+    Clips each factor (within each group) to mean +/- sigma standard deviations or to the (lower, upper)
+    quantiles. Missing values are returned as NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if group_codes is None:
+        group_codes = np.zeros(values.shape[0], dtype=np.int64)
+    layout = _CellLayout(values, group_codes, group_count)
+    _winsorize_cells(layout, sigma, quantiles)
+    return layout.to_matrix(layout.values)
+
+
+def normalize_matrix(values: np.ndarray, mode=NORMALIZATION_MODE, group_codes=None, group_count=1,
+                     winsorize_sigma=None, winsorize_quantiles=None, feature_range=(0, 100)) -> np.ndarray:
+    """
+    Normalizes each column of a factor matrix, optionally within groups.
+
+    Parameters:
+        values (ndarray): symbols x factors matrix.
+        mode (str): "min_max" and "percentile_rank" map to feature_range, "z_score" to mean 0 and standard deviation 1.
+        group_codes (ndarray): Group code (0..group_count-1) per row, None to normalize over all rows.
+        group_count (int): Number of groups.
+        winsorize_sigma (float): Clip at mean +/- winsorize_sigma standard deviations before normalizing.
+        winsorize_quantiles (tuple): Or clip at the (lower, upper) quantiles.
+        feature_range (tuple): Output range of the "min_max" and "percentile_rank" modes.
+
+    Returns:
+        ndarray: normalized float64 matrix. Cells whose values are all equal map to the middle of
+            the range (0 for "z_score").
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if group_codes is None:
+        group_codes = np.zeros(values.shape[0], dtype=np.int64)
+    layout = _CellLayout(values, group_codes, group_count)
+    _winsorize_cells(layout, winsorize_sigma, winsorize_quantiles)
+
+    range_min, range_max = feature_range
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if mode == NormalizationMode.MIN_MAX:
+            mins, maxs = layout.get_min_max()
+            spans = (maxs - mins)[layout.cells]
+            scaled = np.where(spans > 0, (layout.values - mins[layout.cells]) / spans, 0.5)
+            normalized = range_min + scaled * (range_max - range_min)
+        elif mode == NormalizationMode.PERCENTILE_RANK:
+            ranks = layout.get_percentile_ranks()
+            ranks = np.where(layout.counts[layout.cells] > 1, ranks, 0.5)
+            normalized = range_min + ranks * (range_max - range_min)
+        elif mode == NormalizationMode.Z_SCORE:
+            means, stds = layout.get_mean_std()
+            stds = stds[layout.cells]
+            normalized = np.where(stds > 0, (layout.values - means[layout.cells]) / stds, 0.0)
+        else:
+            raise ValueError(f"Unsupported normalization mode: {mode}")
+
+    normalized[~layout.valid] = np.nan
+    return layout.to_matrix(normalized)
+
+
+def normalize_factors(df: pd.DataFrame, column_list: list, mode=NORMALIZATION_MODE, group_labels=None,
+                      winsorize_sigma=WINSORIZE_SIGMA, winsorize_quantiles=WINSORIZE_QUANTILES,
+                      feature_range=(0, 100)) -> pd.DataFrame:
+    """
+    Normalizes the given factor columns of a DataFrame in one pass, see normalize_matrix.
+    group_labels (e.g. the GICS sector of each row) makes the normalization relative to each group.
+    """
+    column_list = [col for col in column_list if col != 'symbol' and col in df.columns]
+    if not column_list or df.empty:
+        return df
+    group_codes, group_count = get_group_codes(group_labels, len(df))
+    values = df[column_list].to_numpy(dtype=np.float64, na_value=np.nan)
+    df[column_list] = normalize_matrix(values, mode, group_codes, group_count, winsorize_sigma, winsorize_quantiles,
+                                       feature_range)
+    return df
@@ -0,0 +1,78 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiter used to keep API calls within a plan's calls-per-minute quota.
+
+    Attributes:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum number of tokens the bucket can hold (burst size).
+    """
+
+    def __init__(self, calls_per_minute: int, burst: int = 1):
+        """
+        Initializes the bucket full so that a run can start with a short burst.
+
+        Parameters:
+            calls_per_minute (int): Sustained number of calls allowed per minute.
+            burst (int): Maximum number of calls that can be made back to back.
+        """
+        if calls_per_minute <= 0:
+            raise ValueError(f"calls_per_minute must be positive: {calls_per_minute}")
+        self.rate = calls_per_minute / 60.0
+        self.capacity = float(max(1, burst))
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._last_refill = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """
+        Takes tokens from the bucket if available without blocking.
+
+        Returns:
+            bool: True if the tokens were taken.
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0):
+        """
+        Blocks until the requested number of tokens is available and takes them.
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_time = (tokens - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+
+_shared_buckets = {}
+_shared_buckets_lock = threading.Lock()
+
+
+def get_shared_token_bucket(name: str, calls_per_minute: int, burst: int = 1) -> TokenBucket:
+    """
+    Returns the process-wide bucket of name, e.g. an API key, creating it on first use.
+    All clients of one quota share the bucket, so the quota holds however many clients a run creates.
+    """
+    with _shared_buckets_lock:
+        bucket = _shared_buckets.get(name)
+        if bucket is None:
+            bucket = TokenBucket(calls_per_minute, burst)
+            _shared_buckets[name] = bucket
+        return bucket